@@ -1,16 +1,71 @@
 """WorkBrew — Flask application entry point and route definitions."""
+import time
+
+_IMPORT_STARTED = time.perf_counter()   # for the startup report; keep above other imports
+
+import csv
+import gzip
+import io
+import json
+import math
 import os
 
 from dotenv import load_dotenv
-from flask import Flask, abort, flash, redirect, render_template, request, session, url_for
-from sqlalchemy import text
+from flask import Flask, abort, flash, jsonify, redirect, render_template, request, session, url_for
+from markupsafe import Markup
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
+import assets
+import bootstrap
+import bulk_admin
+import catalog
+import cities
+import facets
+import jobs
+import metrics
+import pooling
+import replicas
+import stream
+import thumbnails
+import tiles
+from cache import FragmentCache, ResponseCache
 from extensions import csrf, db
 from forms import AdminLoginForm, CafeForm
-from models import Cafe
+from models import CARD_FIELDS, INT_MAX, Cafe, parse_price
 
 load_dotenv()
 
+# /api/cafes/near caps — keep a single request bounded in work and payload size.
+MAX_NEAR_RADIUS_KM = 50.0
+MAX_NEAR_LIMIT     = 100
+
+# /api/map refuses viewports needing more tiles than this at the requested zoom.
+MAX_MAP_TILES = 64
+
+# /search returns at most this many results.
+MAX_SEARCH_LIMIT = 50
+
+# Rows fetched per server-side cursor round trip by the export endpoints.
+EXPORT_CHUNK = 1000
+
+# Stands in for csrf_token() in cached pages; swapped for a real token per request.
+CSRF_PLACEHOLDER = "__workbrew_csrf_token__"
+
+# Blank card that client-side filtering clones and fills in per cafe: every
+# amenity badge present (unset ones are removed), no thumbnail.
+CARD_PROTOTYPE = {**dict.fromkeys(CARD_FIELDS, ""), **dict.fromkeys(catalog.AMENITIES, True),
+                  "id": 0, "lat": None, "lng": None, "thumb_key": None}
+
+
+def _database_url(url: str | None) -> str:
+    url = (url or "").strip()
+    # Render.com supplies postgres:// — SQLAlchemy 2 requires postgresql+psycopg2://
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql+psycopg2://", 1)
+    return url
+
 
 def create_app() -> Flask:
     app = Flask(__name__)
@@ -18,63 +73,268 @@ def create_app() -> Flask:
     # ── Core config ──────────────────────────────────────────────────────────
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-insecure-key-change-me")
 
-    db_url = os.getenv("DATABASE_URL", "").strip() or "sqlite:///cafes.db"
-    # Render.com supplies postgres:// — SQLAlchemy 2 requires postgresql+psycopg2://
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql+psycopg2://", 1)
+    db_url = _database_url(os.getenv("DATABASE_URL")) or "sqlite:///cafes.db"
     app.config["SQLALCHEMY_DATABASE_URI"] = db_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # ── Catalog caching ──────────────────────────────────────────────────────
+    # How often (seconds) a worker checks whether another worker changed the
+    # catalog; bounds how stale its in-process indexes and page cache can be.
+    app.config["CATALOG_SYNC_INTERVAL"] = float(os.getenv("CATALOG_SYNC_INTERVAL") or 1.0)
+    # Cards per listing page; further pages load via /cafes/page.
+    app.config["PAGE_SIZE"] = int(os.getenv("PAGE_SIZE") or 24)
+    # "client" filters in the browser against /api/catalog.json (fetched once
+    # per catalog version); "server" re-renders the page per filter change.
+    # Admins always get server-rendered pages.
+    app.config["FILTER_MODE"] = os.getenv("FILTER_MODE") or "server"
+    # "postgres" answers /search with pg_trgm indexes, "memory" with the
+    # in-process trigram index; defaults to whichever matches the database.
+    app.config["SEARCH_BACKEND"] = os.getenv("SEARCH_BACKEND") or (
+        "postgres" if db_url.startswith("postgresql") else "memory"
+    )
+
     # ── Schema isolation (Postgres only) ─────────────────────────────────────
     # DB_SCHEMA scopes all tables to a named schema (e.g. "workbrew") so this
     # app's data stays isolated from other apps sharing the same Postgres
     # instance. Unset locally — SQLite doesn't use schemas.
     db_schema = os.getenv("DB_SCHEMA", "").strip()
     if db_schema and not db_url.startswith("sqlite"):
-        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-            "connect_args": {"options": f"-csearch_path={db_schema},public"},
-        }
+        app.config["DB_SCHEMA"] = db_schema
+
+    # ── Connection pooling ───────────────────────────────────────────────────
+    # Per worker process: keep DB_POOL_SIZE + DB_MAX_OVERFLOW times the number
+    # of gunicorn workers under the server's connection limit. Use
+    # DB_POOL_MODE=transaction behind pgbouncer's transaction pooling.
+    # WORKER_CLASS is gunicorn's --worker-class (render.yaml passes the same
+    # variable to both); under gevent, psycopg2 queries yield to other greenlets.
+    app.config["WORKER_CLASS"]            = os.getenv("WORKER_CLASS") or "sync"
+    pooling.cooperative_driver(app.config["WORKER_CLASS"])
+    app.config["DB_POOL_MODE"]            = os.getenv("DB_POOL_MODE") or "session"
+    app.config["DB_POOL_SIZE"]            = int(os.getenv("DB_POOL_SIZE") or 5)
+    app.config["DB_MAX_OVERFLOW"]         = int(os.getenv("DB_MAX_OVERFLOW") or 5)
+    app.config["DB_POOL_TIMEOUT"]         = float(os.getenv("DB_POOL_TIMEOUT") or 10)
+    app.config["DB_POOL_RECYCLE"]         = int(os.getenv("DB_POOL_RECYCLE") or 1800)
+    app.config["DB_POOL_PRE_PING"]        = (os.getenv("DB_POOL_PRE_PING") or "1").lower() not in ("0", "false", "no")
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.getenv("DB_STATEMENT_TIMEOUT_MS") or 0)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pooling.engine_options(app.config, db_url)
+
+    # ── Read replica ─────────────────────────────────────────────────────────
+    # Optional. Non-admin GET/HEAD requests read from DATABASE_URL_READ (its
+    # own pool, same DB_POOL_* settings) while it is reachable and at most
+    # REPLICA_MAX_LAG seconds behind; writes and admin pages use the primary.
+    # For READ_YOUR_WRITES_TTL seconds after a write, that client reads from
+    # the primary too.
+    app.config["DATABASE_URL_READ"]     = _database_url(os.getenv("DATABASE_URL_READ")) or None
+    app.config["REPLICA_MAX_LAG"]       = float(os.getenv("REPLICA_MAX_LAG") or 5)
+    app.config["REPLICA_CHECK_INTERVAL"] = float(os.getenv("REPLICA_CHECK_INTERVAL") or 5)
+    app.config["READ_YOUR_WRITES_TTL"]  = float(os.getenv("READ_YOUR_WRITES_TTL") or 10)
 
     # ── Extensions ───────────────────────────────────────────────────────────
     db.init_app(app)
     csrf.init_app(app)
+    pooling.init_app(app)
+    replicas.init_app(app)
+
+    # ── Instrumentation ──────────────────────────────────────────────────────
+    # Server-Timing on every response and Prometheus metrics at /metrics.
+    # METRICS_DIR lets gunicorn workers share one merged view via snapshot files.
+    app.config["METRICS_DIR"] = os.getenv("METRICS_DIR") or None
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN") or None
+    metrics.init_app(app)
+
+    # ── Schema bootstrap ─────────────────────────────────────────────────────
+    # Nothing here touches the database. "deploy" leaves the schema check to
+    # bootstrap.py / seed.py at release time; "first-request" runs it once
+    # per process before the first request is served.
+    app.config["SCHEMA_BOOTSTRAP"] = os.getenv("SCHEMA_BOOTSTRAP") or "first-request"
+    bootstrap.init_app(app)
+
+    # ── Cities ───────────────────────────────────────────────────────────────
+    # Each city's pages live under /<slug>/ (add cities with cities.py);
+    # DEFAULT_CITY is also served at the bare paths, as before multi-city.
+    app.config["DEFAULT_CITY"] = os.getenv("DEFAULT_CITY") or cities.DEFAULT_CITY
+    cities.init_app(app)
+
+    # ── Static assets ────────────────────────────────────────────────────────
+    # Content-hashed, precompressed CSS/JS built offline by assets.py (run at
+    # deploy); served from /assets/ with immutable caching.
+    app.config["ASSETS_DIR"] = os.getenv("ASSETS_DIR") or assets.OUTPUT_DIR
+    assets.init_app(app)
+
+    # ── Photo thumbnails ─────────────────────────────────────────────────────
+    # Each cafe's img_url is fetched once by a background job and served from
+    # /img/ as resized WebP/JPEG; THUMB_MAX_BYTES bounds the on-disk cache.
+    # THUMBNAILS_ENABLED=0 keeps cards on the original URLs (no writable disk).
+    app.config["THUMBNAILS_ENABLED"] = (os.getenv("THUMBNAILS_ENABLED") or "1").lower() not in ("0", "false", "no")
+    app.config["THUMB_DIR"] = os.getenv("THUMB_DIR") or os.path.join(app.instance_path, "thumbs")
+    app.config["THUMB_MAX_BYTES"] = int(os.getenv("THUMB_MAX_BYTES") or 256 * 1024 * 1024)
+    thumbnails.init_app(app)
+
+    # ── Background jobs ──────────────────────────────────────────────────────
+    # Geocoding and thumbnails for new cafes run on a per-process worker pool
+    # fed from the durable pending_job table; JOB_WORKERS=0 disables the threads.
+    app.config["JOB_WORKERS"] = int(os.getenv("JOB_WORKERS") or 2)
+    jobs.init_app(app)
+
+    # ── Admin bulk tools ─────────────────────────────────────────────────────
+    # Multi-delete, batch amenity edits and CSV import under /admin/cafes/,
+    # each one transaction with a per-row error report.
+    bulk_admin.init_app(app)
+
+    # ── Live updates ─────────────────────────────────────────────────────────
+    # Open browse pages follow catalog writes over /api/stream (SSE). Each
+    # open page holds a connection, so this defaults on only under a gevent
+    # or gthread WORKER_CLASS. With several workers, set STREAM_BACKEND=file
+    # (shared STREAM_FILE) or postgres (LISTEN/NOTIFY, session pooling only)
+    # so every worker sees every write.
+    live_default = "1" if app.config["WORKER_CLASS"] in stream.STREAMING_WORKERS else "0"
+    app.config["LIVE_UPDATES"]       = (os.getenv("LIVE_UPDATES") or live_default).lower() not in ("0", "false", "no")
+    app.config["STREAM_BACKEND"]     = os.getenv("STREAM_BACKEND") or "memory"
+    app.config["STREAM_FILE"]        = os.getenv("STREAM_FILE") or os.path.join(app.instance_path, "stream.jsonl")
+    app.config["STREAM_MAX_CLIENTS"] = int(os.getenv("STREAM_MAX_CLIENTS") or 1000)
+    app.config["STREAM_QUEUE_SIZE"]  = int(os.getenv("STREAM_QUEUE_SIZE") or 64)
+    stream.init_app(app)
 
     # ── Routes ───────────────────────────────────────────────────────────────
 
+    page_cache = app.extensions["workbrew.page_cache"] = ResponseCache(
+        int(os.getenv("PAGE_CACHE_MAX_ENTRIES") or 512)
+    )
+    # Rendered listing cards, keyed by (cafe id, row version, admin flag), so a
+    # page render is mostly assembly; each card only re-renders when it changes.
+    card_cache = app.extensions["workbrew.card_cache"] = FragmentCache(
+        int(os.getenv("CARD_CACHE_MAX_ENTRIES") or 4096)
+    )
+
     @app.route("/")
+    @app.route("/<city:city>/")
     def index():
-        wifi     = request.args.get("wifi")
-        sockets  = request.args.get("sockets")
-        calls    = request.args.get("calls")
-        location = request.args.get("location")
-
-        query = Cafe.query
-        if wifi:     query = query.filter_by(has_wifi=True)
-        if sockets:  query = query.filter_by(has_sockets=True)
-        if calls:    query = query.filter_by(can_take_calls=True)
-        if location: query = query.filter_by(location=location)
-
-        cafes     = query.order_by(Cafe.name).all()
-        locations = [r[0] for r in db.session.query(Cafe.location).distinct().order_by(Cafe.location)]
-        cafes_data = [c.to_dict() for c in cafes]
-
-        return render_template(
-            "index.html",
-            cafes=cafes,
-            cafes_data=cafes_data,
-            locations=locations,
-            is_admin=session.get("is_admin", False),
-            active_wifi=wifi,
-            active_sockets=sockets,
-            active_calls=calls,
-            active_location=location,
-        )
+        return _listing("index.html")
+
+    @app.route("/cafes/page")
+    @app.route("/<city:city>/cafes/page")
+    def cafe_page():
+        """Fragment for the "Load more" button: the cards after ``?after=<cursor>``."""
+        try:
+            after = catalog.decode_cursor(request.args.get("after", ""), sorted_by=_range_args()[2] is not None)
+        except ValueError:
+            abort(400)
+        return _listing("_cafe_page.html", after)
+
+    def _filter_args() -> tuple:
+        """(wifi, sockets, calls, location) as passed on the query string."""
+        return tuple(request.args.get(name) for name in ("wifi", "sockets", "calls", "location"))
+
+    def _range_args() -> tuple:
+        """(max_price in pence, min_seats, sort) as passed on the query string.
+
+        Each is None when absent or unusable — including numbers past what the
+        INTEGER columns hold, which are ignored rather than sent to the database.
+        """
+        sort = request.args.get("sort")
+        min_seats = request.args.get("min_seats", type=int)
+        if min_seats is not None and not 0 <= min_seats <= INT_MAX:
+            min_seats = None
+        return parse_price(request.args.get("max_price")), min_seats, sort if sort in catalog.SORTS else None
+
+    def _listing(template: str, after=None):
+        wifi, sockets, calls, location = _filter_args()
+        max_price, min_seats, sort = _range_args()
+        ranged = max_price is not None or min_seats is not None or sort is not None
+        is_admin = session.get("is_admin", False)
+
+        # Range filters and sorts are server-rendered: the browser-side
+        # document and the live diffs only know the name-ordered listing.
+        client_filtering = app.config["FILTER_MODE"] == "client" and not is_admin and not ranged
+        live_updates = app.config["LIVE_UPDATES"] and not is_admin and not ranged
+
+        def render() -> str:
+            # Served from the in-process bitmap index: each filter combination is
+            # a bitwise AND, and the cards come back already in name order.
+            # Only one keyset page of cards (and map pins) is rendered at a time.
+            # Price/seat ranges and sorts are indexed keyset queries instead.
+            if ranged:
+                clauses = (catalog.filter_clauses(wifi, sockets, calls, location, city=cities.current_slug())
+                           + catalog.range_clauses(max_price, min_seats))
+                cafes, next_key = catalog.sorted_page(clauses, sort, after, app.config["PAGE_SIZE"])
+                total = catalog.count(clauses)
+            else:
+                index = catalog.filter_index()
+                bits  = index.match(catalog.filter_facets(wifi, sockets, calls, location))
+                cafes, next_key = index.page(bits, after, app.config["PAGE_SIZE"])
+                total = index.count(bits)
+
+            return render_template(
+                template,
+                client_filtering=client_filtering,
+                live_updates=live_updates,
+                catalog_version=catalog.generation()[0],
+                card_prototype=_card_prototype() if client_filtering or live_updates else None,
+                page_size=app.config["PAGE_SIZE"],
+                cards=[_card(cafe, is_admin) for cafe in cafes],
+                total=total,
+                next_cursor=catalog.encode_cursor(next_key) if next_key else None,
+                facet_counts=catalog.facet_counts(),
+                map_bounds=catalog.map_bounds(),
+                is_admin=is_admin,
+                active_wifi=wifi,
+                active_sockets=sockets,
+                active_calls=calls,
+                active_location=location,
+                active_max_price=max_price,
+                active_min_seats=min_seats,
+                active_sort=sort,
+                csrf_token=lambda: CSRF_PLACEHOLDER,
+            )
+
+        # A pending flash message makes the page one-off — render it directly.
+        if "_flashes" in session:
+            body = render()
+            return body.replace(CSRF_PLACEHOLDER, generate_csrf()) if is_admin else body
+
+        generation, updated_at = catalog.generation()
+        key = (cities.current_slug(), template, after, bool(wifi), bool(sockets), bool(calls), location or "", bool(is_admin),
+               client_filtering, live_updates, max_price, min_seats, sort)
+        page = page_cache.get_or_render(key, generation, updated_at, render)
+        return _page_response(page, is_admin)
+
+    def _card(cafe, is_admin: bool) -> Markup:
+        """One rendered listing card, from the fragment cache when unchanged.
+
+        Cards never contain a real CSRF token, only the placeholder that
+        ``_page_response`` swaps per request, so admin cards are shareable.
+        """
+        return card_cache.get_or_render(cafe.id, cafe.version, bool(is_admin), lambda: Markup(render_template(
+            "_cafe_card.html", cafe=cafe, is_admin=is_admin, csrf_token=lambda: CSRF_PLACEHOLDER,
+        )))
+
+    def _card_prototype() -> Markup:
+        return Markup(render_template("_cafe_card.html", cafe=CARD_PROTOTYPE, is_admin=False))
+
+    def _page_response(page, is_admin: bool):
+        if is_admin:
+            # Admin pages carry a per-session CSRF token, spliced in per request,
+            # so the body differs every time and is never revalidated.
+            body = page.body.replace(CSRF_PLACEHOLDER.encode(), generate_csrf().encode())
+            resp = app.response_class(body, mimetype="text/html")
+            resp.headers["Cache-Control"] = "private, no-store"
+        else:
+            resp = app.response_class(page.body, mimetype="text/html")
+            resp.set_etag(page.etag)
+            if page.last_modified is not None:
+                resp.last_modified = page.last_modified
+            resp.headers["Cache-Control"] = "no-cache"
+            resp.make_conditional(request)
+        resp.vary.add("Cookie")
+        return resp
 
     @app.route("/add", methods=["GET", "POST"])
+    @app.route("/<city:city>/add", methods=["GET", "POST"])
     def add_cafe():
         form = CafeForm()
         if form.validate_on_submit():
             cafe = Cafe(
+                city=cities.current_slug(),
                 name=form.name.data,
                 map_url=form.map_url.data,
                 img_url=form.img_url.data,
@@ -87,10 +347,23 @@ def create_app() -> Flask:
                 coffee_price=form.coffee_price.data,
             )
             db.session.add(cafe)
+            try:
+                db.session.flush()                   # assigns cafe.id for the job row
+            except IntegrityError:                   # (city, name) is unique
+                db.session.rollback()
+                form.name.errors.append(f"{form.name.data} is already listed in {cities.current().name}.")
+                return render_template("add_cafe.html", form=form, neighbourhoods=catalog.locations())
+            jobs.enqueue(jobs.JOB_GEOCODE, cafe.id)  # committed atomically with the cafe
+            if app.config["THUMBNAILS_ENABLED"]:
+                jobs.enqueue(jobs.JOB_THUMBNAIL, cafe.id)
+            facets.adjust(cafe, +1)
+            generation = catalog.bump_generation(cafe.city)
             db.session.commit()
+            catalog.cafe_added(cafe, generation)
+            jobs.notify()
             flash("Cafe added! ☕ It's now live on the map.", "success")
             return redirect(url_for("index"))
-        return render_template("add_cafe.html", form=form)
+        return render_template("add_cafe.html", form=form, neighbourhoods=catalog.locations())
 
     @app.route("/admin/login", methods=["GET", "POST"])
     def admin_login():
@@ -120,24 +393,185 @@ def create_app() -> Flask:
             abort(403)
         cafe = db.get_or_404(Cafe, cafe_id)
         db.session.delete(cafe)
+        jobs.cancel(cafe.id)
+        facets.adjust(cafe, -1)
+        generation = catalog.bump_generation(cafe.city)
         db.session.commit()
+        catalog.cafe_deleted(cafe, generation)
         flash(f'"{cafe.name}" has been removed.', "success")
-        return redirect(url_for("index"))
+        return redirect(cities.home_url(cafe.city))
+
+    @app.route("/admin/jobs")
+    def job_metrics():
+        if not session.get("is_admin"):
+            abort(403)
+        return jsonify(app.extensions["workbrew.jobs"].metrics())
+
+    @app.route("/admin/pool")
+    def pool_health():
+        if not session.get("is_admin"):
+            abort(403)
+        return jsonify({**app.extensions["workbrew.pool"].snapshot(),
+                        "replica": app.extensions["workbrew.replica"].snapshot()})
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        if not metrics.authorized():
+            abort(401)
+        body = metrics.render_prometheus(app.extensions["workbrew.metrics"].collect())
+        resp = app.response_class(body, mimetype="text/plain")
+        resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+
+    @app.route("/api/cafes/near")
+    @app.route("/<city:city>/api/cafes/near")
+    def cafes_near():
+        try:
+            lat = float(request.args["lat"])
+            lng = float(request.args["lng"])
+            radius = request.args.get("radius", type=float)
+            limit = request.args.get("limit", 20, type=int)
+        except (KeyError, ValueError):
+            return jsonify(error="lat and lng are required numbers"), 400
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return jsonify(error="lat/lng out of range"), 400
+        if radius is not None and not 0 < radius <= MAX_NEAR_RADIUS_KM:
+            return jsonify(error=f"radius must be in (0, {MAX_NEAR_RADIUS_KM}] km"), 400
+        limit = max(1, min(limit, MAX_NEAR_LIMIT))
+
+        index = catalog.spatial_index()
+        if radius is None:
+            hits = index.nearest(lat, lng, limit)
+        else:
+            hits = index.radius(lat, lng, radius, limit)
+        results = [{**cafe, "distance_km": round(d, 3)} for d, cafe in hits]
+        return jsonify(results=results, count=len(results))
+
+    @app.route("/search")
+    @app.route("/<city:city>/search")
+    def search_cafes():
+        """Type-ahead search: ``?q=<text>[&limit=]`` plus the index() filters.
+
+        Typo-tolerant and prefix-matching over cafe name and location; results
+        are ranked cards, best match first.
+        """
+        query = request.args.get("q", "").strip()
+        limit = max(1, min(request.args.get("limit", 10, type=int), MAX_SEARCH_LIMIT))
+        results = catalog.search_cafes(query, limit, *_filter_args()) if query else []
+        resp = jsonify(query=query, results=results, count=len(results))
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.add_etag()
+        return resp.make_conditional(request)
+
+    @app.route("/api/map")
+    @app.route("/<city:city>/api/map")
+    def map_data():
+        """Clustered markers for the viewport: ``?bbox=west,south,east,north&zoom=``.
+
+        Accepts the index() filters too. Tiles are clustered once per filter
+        combination and cached until a write touches them.
+        """
+        try:
+            west, south, east, north = (float(v) for v in request.args["bbox"].split(","))
+            zoom = int(request.args["zoom"])
+        except (KeyError, ValueError):
+            return jsonify(error="bbox=west,south,east,north and zoom are required"), 400
+        if (not all(math.isfinite(v) for v in (west, south, east, north))
+                or not 0 <= zoom <= tiles.MAX_ZOOM or west > east or south > north):
+            return jsonify(error="invalid bbox or zoom"), 400
+        west, east = max(west, -180.0), min(east, 180.0)
+        south, north = max(south, -85.0), min(north, 85.0)
+        x0, y0, x1, y1 = tiles.tile_range(west, south, east, north, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_MAP_TILES:
+            return jsonify(error="viewport too large for this zoom"), 400
+
+        features = catalog.map_features(west, south, east, north, zoom,
+                                        catalog.filter_facets(*_filter_args()))
+        resp = jsonify(zoom=zoom, features=features)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.add_etag()
+        return resp.make_conditional(request)
+
+    @app.route("/api/catalog.json")
+    @app.route("/<city:city>/api/catalog.json")
+    def catalog_document():
+        """Every cafe as one compact columnar document, for client-side filtering.
+
+        Rendered (and gzipped) once per catalog version. Requested with
+        ``?v=<version>`` matching the current one, it is cacheable for a year,
+        so browsers only download it again after a write.
+        """
+        city = cities.current_slug()
+        generation, updated_at = catalog.generation()
+        page = page_cache.get_or_render(
+            (city, "catalog.json"), generation, updated_at,
+            lambda: json.dumps(catalog.document(), separators=(",", ":")),
+        )
+        resp = app.response_class(page.body, mimetype="application/json")
+        if request.accept_encodings["gzip"]:
+            page = page_cache.get_or_render(
+                (city, "catalog.json", "gzip"), generation, updated_at,
+                lambda: gzip.compress(resp.get_data(), compresslevel=6),
+            )
+            resp.set_data(page.body)
+            resp.headers["Content-Encoding"] = "gzip"
+        resp.set_etag(page.etag)
+        if updated_at is not None:
+            resp.last_modified = updated_at
+        if request.args.get("v", type=int) == generation:
+            resp.headers["Cache-Control"] = assets.IMMUTABLE
+        else:
+            resp.headers["Cache-Control"] = "no-cache"
+        resp.vary.add("Accept-Encoding")
+        return resp.make_conditional(request)
+
+    @app.route("/api/cafes/export.<fmt>")
+    @app.route("/<city:city>/api/cafes/export.<fmt>")
+    def export_cafes(fmt: str):
+        """Stream the (optionally filtered) catalog as NDJSON or CSV.
+
+        Rows come off a server-side cursor in ``EXPORT_CHUNK`` batches and are
+        encoded as they arrive, so memory stays flat however large the table.
+        """
+        if fmt not in ("ndjson", "csv"):
+            abort(404)
+        columns = list(Cafe.__table__.columns)
+        stmt = (
+            select(*columns)
+            .where(*catalog.filter_clauses(*_filter_args(), city=cities.current_slug()),
+                   *catalog.range_clauses(*_range_args()[:2]))
+            .order_by(Cafe.id)
+        )
+        engine = replicas.read_engine()
+
+        def generate():
+            with engine.connect() as conn:
+                result = conn.execution_options(yield_per=EXPORT_CHUNK).execute(stmt)
+                if fmt == "csv":
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    writer.writerow(result.keys())
+                    for rows in result.partitions():
+                        writer.writerows(rows)
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+                else:
+                    keys = list(result.keys())
+                    for rows in result.partitions():
+                        yield "".join(json.dumps(dict(zip(keys, row))) + "\n" for row in rows)
+
+        mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+        resp = app.response_class(generate(), mimetype=mimetype)
+        resp.headers["Content-Disposition"] = f"attachment; filename=cafes.{fmt}"
+        return resp
 
     return app
 
 
 app = create_app()
-
-# Bootstrap schema + tables on every cold start (both steps are idempotent).
-with app.app_context():
-    db_schema = os.getenv("DB_SCHEMA", "").strip()
-    if db_schema:
-        # Ensure the schema exists before create_all() tries to place tables in it.
-        with db.engine.connect() as conn:
-            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {db_schema}"))
-            conn.commit()
-    db.create_all()
+app.extensions["workbrew.startup"].record("import", time.perf_counter() - _IMPORT_STARTED)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,203 @@
+"""
+Static asset pipeline: offline build, content-hashed names, precompressed files.
+
+Usage (at deploy, before the web workers start):
+    python assets.py
+
+Every input is in the repo: ``templates/*.html`` (scanned for utility
+classes), ``assets/app.css``, the vendored Leaflet in ``assets/vendor/leaflet/``
+and the Inter / Instrument Serif woff2 subsets in ``assets/vendor/fonts/``.
+The build writes to ``static/dist/``:
+
+* ``app.<hash>.css`` — the utilities the templates use (``tailwind.py``)
+  followed by ``assets/app.css``, minified
+* ``leaflet.<hash>.css``, ``leaflet.<hash>.js`` and ``images/*.<hash>.png``
+* ``fonts/*.<hash>.woff2`` (already compressed, so served as is)
+* a ``.gz`` next to every CSS/JS file, and a ``.br`` too when the ``brotli``
+  package is installed
+* ``manifest.json``, mapping logical names (``"app.css"``) to hashed paths
+
+Templates link assets with ``asset_url("app.css")``. The ``/assets/`` route
+serves the smallest precompressed variant the client accepts, with a one-year
+``immutable`` Cache-Control. A new build gives changed files new names, so
+browsers never revalidate. When the manifest is missing or older than its
+inputs at startup (a fresh checkout, an edited template), ``init_app``
+rebuilds it.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+import tailwind
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone still works
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, "assets")
+TEMPLATE_DIR = os.path.join(ROOT, "templates")
+OUTPUT_DIR = os.path.join(ROOT, "static", "dist")
+MANIFEST = "manifest.json"
+
+# Cache-Control for hashed files: their content never changes under a name.
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = (".css", ".js", ".svg", ".json")
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_SPACE = re.compile(r"\s+")
+_PUNCT = re.compile(r"\s*([{};,>])\s*")
+_URL = re.compile(r"url\((['\"]?)((?:images|fonts)/[^)'\"]+)\1\)")
+
+
+def minify_css(text: str) -> str:
+    """Strip comments and insignificant whitespace (strings are left alone)."""
+    text = _COMMENT.sub("", text)
+    text = _SPACE.sub(" ", text)
+    text = _PUNCT.sub(r"\1", text)
+    text = text.replace(": ", ":").replace(";}", "}")
+    return text.strip()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _hashed_name(logical: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(logical)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+
+def _write(path: str, data: bytes) -> None:
+    """Write atomically, so concurrent builds and readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _emit(out_dir: str, logical: str, data: bytes, manifest: dict) -> None:
+    name = _hashed_name(logical, data)
+    path = os.path.join(out_dir, name)
+    if not os.path.exists(path):
+        _write(path, data)
+        if name.endswith(COMPRESSIBLE):
+            _write(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(path + ".br", brotli.compress(data, quality=11))
+    manifest[logical] = name
+
+
+def _rewrite_urls(css: str, manifest: dict) -> str:
+    """Point relative ``url()`` references at their hashed build outputs."""
+    return _URL.sub(lambda m: f"url({manifest.get(m.group(2), m.group(2))})", css)
+
+
+def template_classes(template_dir: str = TEMPLATE_DIR) -> set[str]:
+    """Class-like tokens across every template (markup, Jinja and inline JS)."""
+    tokens = set()
+    for path in sorted(glob.glob(os.path.join(template_dir, "*.html"))):
+        with open(path, encoding="utf-8") as fh:
+            tokens |= tailwind.candidates(fh.read())
+    return tokens
+
+
+def build(source_dir: str = SOURCE_DIR, template_dir: str = TEMPLATE_DIR, out_dir: str = OUTPUT_DIR) -> dict:
+    """Build every asset into *out_dir*; return the manifest."""
+    manifest: dict[str, str] = {}
+    leaflet_dir = os.path.join(source_dir, "vendor", "leaflet")
+
+    for path in sorted(glob.glob(os.path.join(leaflet_dir, "images", "*"))):
+        with open(path, "rb") as fh:
+            _emit(out_dir, "images/" + os.path.basename(path), fh.read(), manifest)
+    for path in sorted(glob.glob(os.path.join(source_dir, "vendor", "fonts", "*.woff2"))):
+        with open(path, "rb") as fh:
+            _emit(out_dir, "fonts/" + os.path.basename(path), fh.read(), manifest)
+
+    with open(os.path.join(leaflet_dir, "leaflet.css"), encoding="utf-8") as fh:
+        leaflet_css = _rewrite_urls(fh.read(), manifest)
+    _emit(out_dir, "leaflet.css", minify_css(leaflet_css).encode(), manifest)
+    with open(os.path.join(leaflet_dir, "leaflet.js"), "rb") as fh:
+        _emit(out_dir, "leaflet.js", fh.read(), manifest)
+
+    utilities, _ = tailwind.generate(template_classes(template_dir))
+    with open(os.path.join(source_dir, "app.css"), encoding="utf-8") as fh:
+        components = minify_css(_rewrite_urls(fh.read(), manifest))
+    _emit(out_dir, "app.css", (utilities + components).encode(), manifest)
+
+    _write(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def _inputs_newer(out_dir: str) -> bool:
+    """True when a template or source asset changed after the last build."""
+    built_at = os.path.getmtime(os.path.join(out_dir, MANIFEST))
+    sources = glob.glob(os.path.join(TEMPLATE_DIR, "*.html"))
+    sources += glob.glob(os.path.join(SOURCE_DIR, "**", "*"), recursive=True)
+    return any(os.path.getmtime(path) > built_at for path in sources)
+
+
+def load_manifest(out_dir: str = OUTPUT_DIR) -> dict | None:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def init_app(app) -> dict:
+    """Load (or build) the manifest, register ``asset_url`` and the /assets/ route."""
+    out_dir = app.config.setdefault("ASSETS_DIR", OUTPUT_DIR)
+    manifest = load_manifest(out_dir)
+    if manifest is None or _inputs_newer(out_dir):
+        manifest = build(out_dir=out_dir)
+        app.logger.info("assets: built %d files into %s", len(manifest), out_dir)
+    app.extensions["workbrew.assets"] = manifest
+
+    def asset_url(logical: str) -> str:
+        return f"/assets/{manifest[logical]}"
+
+    app.jinja_env.globals["asset_url"] = asset_url
+
+    @app.route("/assets/<path:filename>")
+    def asset(filename: str):
+        path = safe_join(out_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        encoding = None
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, candidate
+                break
+        resp = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+        if encoding is not None:
+            resp.headers["Content-Encoding"] = encoding
+        resp.headers["Cache-Control"] = IMMUTABLE
+        resp.vary.add("Accept-Encoding")
+        return resp
+
+    return manifest
+
+
+if __name__ == "__main__":
+    built = build()
+    sizes = []
+    for logical, name in sorted(built.items()):
+        if name.endswith(COMPRESSIBLE):
+            path = os.path.join(OUTPUT_DIR, name)
+            variants = [f"{os.path.getsize(path):,} B"]
+            variants += [f"{ext} {os.path.getsize(path + ext):,} B" for ext in (".gz", ".br")
+                         if os.path.exists(path + ext)]
+            sizes.append(f"  {logical:<12} → {name}  ({', '.join(variants)})")
+    print("\n".join(sizes))
+    print(f"✅ {len(built)} assets in {OUTPUT_DIR}" + ("" if brotli else " (install brotli for .br files)"))
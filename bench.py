@@ -0,0 +1,317 @@
+"""
+Benchmark suite: synthetic cafes, repeatable timings, JSON results.
+
+Usage:
+    python bench.py --rows 1000 [--rows 100000 ...] [--database-url URL]
+                    [--repeat 20] [--out results.json] [--compare old.json]
+
+Each size gets a fresh database (a temp SQLite file unless --database-url
+points at e.g. a local Postgres, whose cafe tables are emptied first),
+filled by ``bulk_load`` from ``generate()``. The benchmarks then time:
+
+* ``index()`` for every filter combination: cold (page and card caches cleared),
+  assembled (page cache cleared, cards cached) and warm
+* the client-side filtering catalog document (``/api/catalog.json``), rendered
+  cold, with its raw and gzipped size
+* the ``SELECT DISTINCT location`` query, next to the facet-count table read
+* ``Cafe.to_dict()`` over a page of ORM rows
+* the catalog read path — full ORM hydration plus a card and a map projection
+  per cafe, against ``readmodel``'s single pass over a Core column select
+  (time and peak Python memory)
+* ``POST /add`` and ``POST /cafe/<id>/delete`` throughput
+
+Every timing reports the SQL statements it issued. Results are written as
+JSON with stable keys, so two runs diff cleanly; ``--compare`` prints the
+median ratio per benchmark against an earlier file.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from sqlalchemy import event, select
+
+# Neighbourhood centroids and relative popularity (roughly Zipf-shaped, as
+# real listings cluster in a few central areas).
+NEIGHBOURHOODS = [
+    ("Shoreditch", 51.5260, -0.0780, 30), ("Soho", 51.5136, -0.1365, 28),
+    ("Peckham", 51.4700, -0.0690, 18), ("Hackney", 51.5450, -0.0550, 17),
+    ("Camden", 51.5390, -0.1426, 16), ("Brixton", 51.4613, -0.1156, 14),
+    ("London Bridge", 51.5055, -0.0865, 13), ("Clerkenwell", 51.5246, -0.1057, 12),
+    ("King's Cross", 51.5308, -0.1238, 11), ("Islington", 51.5362, -0.1033, 11),
+    ("Borough", 51.5010, -0.0930, 9), ("Bermondsey", 51.4980, -0.0640, 8),
+    ("Dalston", 51.5463, -0.0750, 8), ("South Kensington", 51.4941, -0.1738, 7),
+    ("Notting Hill", 51.5090, -0.1960, 7), ("Stoke Newington", 51.5620, -0.0760, 6),
+    ("Greenwich", 51.4826, -0.0077, 5), ("Clapham", 51.4620, -0.1380, 5),
+    ("Stratford", 51.5416, -0.0030, 4), ("Walthamstow", 51.5830, -0.0200, 3),
+]
+_ADJECTIVES = ["Little", "Old", "Golden", "Black", "Urban", "Quiet", "Daily", "Corner", "Roasted", "Green"]
+_NOUNS = ["Bean", "Cup", "Grind", "Kettle", "Press", "Crema", "Pelican", "Lantern", "Fox", "Workshop"]
+_SUFFIXES = ["Cafe", "Coffee", "Roasters", "House", "Kitchen", "Bar", "Lab", "Co."]
+_SEATS = ["0-10", "10-20", "20-30", "30-40", "40-50", "50+"]
+
+# index() filter arguments: every wifi/sockets/calls combination, with and
+# without the most common location.
+FILTER_COMBOS = [
+    {k: "1" for k, on in zip(("wifi", "sockets", "calls"), flags) if on} | loc
+    for flags in itertools.product((False, True), repeat=3)
+    for loc in ({}, {"location": NEIGHBOURHOODS[0][0]})
+]
+
+
+def generate(n: int, seed: int = 42):
+    """Yield *n* cafe records with realistic location and amenity distributions."""
+    rng = random.Random(seed)
+    weights = [w for *_, w in NEIGHBOURHOODS]
+    for i in range(n):
+        location, lat, lng, _ = rng.choices(NEIGHBOURHOODS, weights)[0]
+        has_wifi = rng.random() < 0.85
+        # Sockets and call-friendliness mostly come with WiFi.
+        has_sockets = rng.random() < (0.7 if has_wifi else 0.25)
+        yield {
+            "name": f"{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} {rng.choice(_SUFFIXES)} #{i}",
+            "map_url": f"https://maps.example.com/?cafe={i}",
+            "img_url": f"https://img.example.com/{i}.jpg",
+            "location": location,
+            "has_wifi": has_wifi,
+            "has_sockets": has_sockets,
+            "has_toilet": rng.random() < 0.55,
+            "can_take_calls": rng.random() < (0.35 if has_sockets else 0.1),
+            "seats": rng.choice(_SEATS),
+            "coffee_price": f"£{rng.uniform(1.8, 4.2):.2f}",
+            "lat": round(rng.gauss(lat, 0.006), 6) if rng.random() < 0.97 else None,
+            "lng": round(rng.gauss(lng, 0.009), 6) if rng.random() < 0.97 else None,
+        }
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements: list[str] = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def _summary(samples: list[float], queries: int, ops: int) -> dict:
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "queries_per_run": round(queries / max(ops, 1), 2),
+    }
+
+
+def _time(engine, fn, repeat: int, setup=None) -> dict:
+    samples, queries = [], 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with QueryCounter(engine) as counter:
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        queries += counter.count
+    return _summary(samples, queries, repeat)
+
+
+def _peak_kib(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def _make_app(database_url: str):
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JOB_WORKERS", "0")   # no geocoding threads mid-benchmark
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SCHEMA_BOOTSTRAP="deploy",
+                      CATALOG_SYNC_INTERVAL=3600.0)
+    return app
+
+
+def _reset(app) -> None:
+    import bootstrap
+    from extensions import db
+    with app.app_context():
+        db.drop_all()
+    bootstrap.ensure_schema(app)
+
+
+def run_size(database_url: str, rows: int, repeat: int, seed: int = 42) -> dict:
+    import bulk_load
+    import catalog
+    import facets
+    import readmodel
+    from extensions import db
+    from models import CARD_FIELDS, Cafe
+
+    app = _make_app(database_url)
+    _reset(app)
+    results = {}
+    with app.app_context():
+        started = time.perf_counter()
+        bulk_load.load(generate(rows, seed), chunk_size=10_000, report=lambda line: None)
+        results["load"] = {"rows": rows, "seconds": round(time.perf_counter() - started, 3)}
+
+        started = time.perf_counter()
+        catalog.filter_index()
+        results["catalog_build"] = {"seconds": round(time.perf_counter() - started, 3)}
+        engine = db.engine
+
+        client = app.test_client()
+        page_cache = app.extensions["workbrew.page_cache"]
+        card_cache = app.extensions["workbrew.card_cache"]
+
+        def clear_all():
+            page_cache.clear()
+            card_cache.clear()
+
+        for combo in FILTER_COMBOS:
+            label = "+".join(f"{k}={v}" for k, v in sorted(combo.items())) or "all"
+            results[f"index[{label}].cold"] = _time(
+                engine, lambda: client.get("/", query_string=combo), repeat, setup=clear_all)
+            results[f"index[{label}].assembled"] = _time(
+                engine, lambda: client.get("/", query_string=combo), repeat, setup=page_cache.clear)
+            results[f"index[{label}].warm"] = _time(engine, lambda: client.get("/", query_string=combo), repeat)
+
+        # Client-side filtering: the catalog document's cold render and its size.
+        gz = {"Accept-Encoding": "gzip"}
+        results["catalog_document.cold"] = _time(
+            engine, lambda: client.get("/api/catalog.json", headers=gz), repeat, setup=page_cache.clear)
+        plain = client.get("/api/catalog.json")
+        results["catalog_document.cold"].update(
+            bytes=len(plain.data), gzip_bytes=len(client.get("/api/catalog.json", headers=gz).data))
+
+        distinct = select(Cafe.location).distinct().order_by(Cafe.location)
+        results["distinct_location.sql"] = _time(
+            engine, lambda: db.session.execute(distinct).scalars().all(), repeat)
+        results["distinct_location.facets"] = _time(engine, facets.read, repeat)
+
+        page = Cafe.query.order_by(Cafe.id).limit(1000)
+        results["to_dict.1000"] = _time(engine, lambda: [c.to_dict() for c in page.all()], repeat)
+
+        def orm_read():
+            payloads = [({f: getattr(c, f) for f in CARD_FIELDS}, c.to_dict()) for c in Cafe.query.yield_per(5000)]
+            db.session.expunge_all()
+            return payloads
+
+        def core_read():
+            result = db.session.execute(readmodel.card_select().execution_options(yield_per=5000))
+            return [(row, row.map_payload()) for row in readmodel.iter_rows(result)]
+
+        for name, fn in (("orm", orm_read), ("core", core_read)):
+            results[f"read_path.{name}"] = {**_time(engine, fn, max(repeat // 4, 3)), "peak_kib": _peak_kib(fn)}
+
+        form = {"map_url": "https://maps.example.com/bench", "img_url": "https://img.example.com/b.jpg",
+                "location": "Shoreditch", "seats": "10-20", "coffee_price": "£2.50", "has_wifi": "y"}
+        counter = itertools.count()
+        results["add_cafe"] = _time(
+            engine, lambda: client.post("/add", data={**form, "name": f"Bench Add {next(counter)}"}), repeat)
+
+        with client.session_transaction() as sess:
+            sess["is_admin"] = True
+        doomed = iter(db.session.execute(
+            select(Cafe.id).where(Cafe.name.like("Bench Add %")).order_by(Cafe.id)
+        ).scalars().all())
+        results["delete_cafe"] = _time(engine, lambda: client.post(f"/cafe/{next(doomed)}/delete"), repeat)
+
+        db.session.remove()
+    with app.app_context():
+        db.engine.dispose()
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> list[str]:
+    """One line per benchmark present in both runs: new/old median ratio."""
+    lines = []
+    for size, results in new["sizes"].items():
+        before = old.get("sizes", {}).get(size, {})
+        for name, stats in results.items():
+            prev = before.get(name, {})
+            if "median_ms" in stats and prev.get("median_ms"):
+                ratio = stats["median_ms"] / prev["median_ms"]
+                flag = "  ⚠" if ratio > 1.2 else ""
+                lines.append(f"{size:>9} {name:<48} {prev['median_ms']:>10.3f} → {stats['median_ms']:>10.3f} ms"
+                             f"  ×{ratio:.2f}{flag}")
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, action="append", help="catalog size (repeatable; default 1000)")
+    parser.add_argument("--database-url", help="benchmark against this DB instead of a temp SQLite file")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark (default 20)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write JSON results here (default instance/bench/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    report = {
+        "meta": {"timestamp": stamp, "commit": _git_commit(), "python": platform.python_version(),
+                 "database": (args.database_url or "sqlite").split("://")[0].split("@")[-1],
+                 "repeat": args.repeat, "seed": args.seed},
+        "sizes": {},
+    }
+    for rows in args.rows or [1000]:
+        if args.database_url:
+            url = args.database_url
+        else:
+            fd, path = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+            url = f"sqlite:///{path}"
+        print(f"— {rows:,} rows on {url.split('://')[0]} …", flush=True)
+        report["sizes"][str(rows)] = run_size(url, rows, args.repeat, args.seed)
+        if not args.database_url:
+            os.unlink(path)
+
+    out = args.out or os.path.join("instance", "bench", f"{stamp}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+    print(f"✅ Results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            print("\n".join(compare(json.load(fh), report)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
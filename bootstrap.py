@@ -0,0 +1,270 @@
+"""
+Schema bootstrap and cold-start timing.
+
+Usage (once per deploy, before the web workers start):
+    python bootstrap.py
+
+Importing ``app`` never touches the database. The schema check — ``CREATE
+SCHEMA``, ``create_all()``, columns and indexes added to existing tables
+(with the parsed price/seat columns backfilled, and cafe names made unique
+per city rather than globally), the built-in city rows and the search
+indexes — runs in ``ensure_schema``, either from this script / ``seed.py`` at deploy time (``SCHEMA_BOOTSTRAP=deploy``)
+or on each process's first request (``SCHEMA_BOOTSTRAP=first-request``, the
+default, so ``flask run`` works on a fresh checkout). On Postgres the check
+holds an advisory lock, so concurrent starters run the DDL once; afterwards a
+stored fingerprint of the expected DDL turns it into a single SELECT.
+
+``StartupReport`` records import time, the first DB connect, the schema check
+and the first request, and logs them once that request completes.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import g
+from sqlalchemy import MetaData, UniqueConstraint, and_, bindparam, event, inspect, or_, select, text
+from sqlalchemy.schema import AddConstraint, CreateColumn, CreateTable
+
+import cities
+import facets
+import search
+from extensions import db
+from models import AmenityCount, Cafe, Location, SchemaState, parse_price, parse_seats
+
+# Arbitrary app-wide key for pg_advisory_xact_lock.
+ADVISORY_LOCK_KEY = 0x776F726B62726577   # "workbrew"
+
+MODES = ("deploy", "first-request")
+
+# Rows per UPDATE batch when backfilling the parsed price/seat columns.
+BACKFILL_CHUNK = 5000
+
+# Tables holding nothing but counts derived from ``cafe`` (``facets.rebuild``
+# refills them): recreated rather than migrated when their shape changes.
+DERIVED_TABLES = (Location.__table__, AmenityCount.__table__)
+
+
+def schema_fingerprint(app, dialect) -> str:
+    """Hash of every DDL statement the bootstrap would issue on *dialect*."""
+    statements = [str(CreateTable(table).compile(dialect=dialect)) for table in db.metadata.sorted_tables]
+    if app.config.get("SEARCH_BACKEND") == "postgres":
+        statements.extend(search.POSTGRES_DDL)
+    statements.append(app.config.get("DB_SCHEMA") or "")
+    return hashlib.sha256("\n".join(statements).encode()).hexdigest()
+
+
+def ensure_schema(app) -> bool:
+    """Bring the schema up to date; return True if any DDL actually ran."""
+    report = app.extensions.get("workbrew.startup")
+    started = time.perf_counter()
+    with app.app_context():
+        engine = db.engine
+        fingerprint = schema_fingerprint(app, engine.dialect)
+        with engine.begin() as conn:
+            if engine.dialect.name == "postgresql":
+                # Held until commit: other starters wait, then see the new fingerprint.
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            db_schema = app.config.get("DB_SCHEMA")
+            if db_schema:
+                conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {db_schema}"))
+            applied = _stored_fingerprint(conn) != fingerprint
+            if applied:
+                _drop_stale_derived(conn)
+                db.metadata.create_all(bind=conn)
+                _add_missing_columns(conn)
+                _scope_cafe_names_to_city(conn)
+                _backfill_parsed(conn)
+                cities.ensure_builtin(conn)
+                if app.config.get("SEARCH_BACKEND") == "postgres":
+                    search.install_postgres(conn)
+                facets.rebuild(conn)   # backfills the count tables when first created
+                _store_fingerprint(conn, fingerprint)
+    if report is not None:
+        report.record("schema_check", time.perf_counter() - started, applied=applied)
+    return applied
+
+
+def _drop_stale_derived(conn) -> None:
+    """Drop any ``DERIVED_TABLES`` lacking a model column, for ``create_all`` to recreate."""
+    inspector = inspect(conn)
+    for table in DERIVED_TABLES:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        if not {column.name for column in table.columns} <= existing:
+            table.drop(conn)
+
+
+def _add_missing_columns(conn) -> None:
+    """``ALTER TABLE … ADD COLUMN`` (and ``CREATE INDEX``) for what a table lacks.
+
+    ``create_all`` skips tables that already exist, so a model gaining a
+    column would otherwise need a manual migration. New columns must be
+    nullable or carry a server default.
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+
+
+def _scope_cafe_names_to_city(conn) -> None:
+    """Replace a pre-multi-city ``UNIQUE (name)`` on ``cafe`` with ``UNIQUE (city, name)``.
+
+    Postgres swaps the constraint in place. SQLite cannot drop a table
+    constraint, so there the table is rebuilt: created under a new name,
+    filled, and renamed over the old one, then its indexes recreated.
+    """
+    table = Cafe.__table__
+    inspector = inspect(conn)
+    stale = [uc for uc in inspector.get_unique_constraints(table.name) if uc["column_names"] == ["name"]]
+    if not stale:
+        return
+    preparer = conn.dialect.identifier_preparer
+    if conn.dialect.name == "postgresql":
+        for uc in stale:
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} "
+                              f"DROP CONSTRAINT {preparer.quote(uc['name'])}"))
+        (key,) = [c for c in table.constraints if isinstance(c, UniqueConstraint)]
+        conn.execute(AddConstraint(key))
+        return
+    rebuilt = table.to_metadata(MetaData(), name=f"{table.name}_rebuild")
+    conn.execute(CreateTable(rebuilt))   # no indexes yet: their names are still taken
+    columns = ", ".join(preparer.quote(column.name) for column in table.columns)
+    conn.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}"))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _backfill_parsed(conn) -> None:
+    """Fill ``price_pence`` / ``seats_min`` / ``seats_max`` on rows that predate them.
+
+    New writes get them from the ``Cafe`` validators (or ``bulk_load``); this
+    catches rows stored before the columns existed. Unparseable text stays
+    NULL, so a re-run re-reads only those.
+    """
+    table = Cafe.__table__
+    c = table.c
+    rows = conn.execute(select(c.id, c.coffee_price, c.seats).where(or_(
+        and_(c.coffee_price.is_not(None), c.price_pence.is_(None)),
+        and_(c.seats.is_not(None), c.seats_min.is_(None)),
+    ))).all()
+    stmt = table.update().where(c.id == bindparam("row_id")).values(
+        price_pence=bindparam("price"), seats_min=bindparam("low"), seats_max=bindparam("high"),
+    )
+    for start in range(0, len(rows), BACKFILL_CHUNK):
+        params = []
+        for row in rows[start:start + BACKFILL_CHUNK]:
+            low, high = parse_seats(row.seats)
+            params.append({"row_id": row.id, "price": parse_price(row.coffee_price), "low": low, "high": high})
+        conn.execute(stmt, params)
+
+
+def _stored_fingerprint(conn) -> str | None:
+    if not inspect(conn).has_table(SchemaState.__tablename__):
+        return None
+    return conn.execute(select(SchemaState.fingerprint).where(SchemaState.id == 1)).scalar()
+
+
+def _store_fingerprint(conn, fingerprint: str) -> None:
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    table = SchemaState.__table__
+    updated = conn.execute(
+        table.update().where(table.c.id == 1).values(fingerprint=fingerprint, applied_at=now)
+    )
+    if updated.rowcount == 0:
+        conn.execute(table.insert().values(id=1, fingerprint=fingerprint, applied_at=now))
+
+
+class StartupReport:
+    """Cold-start timings (seconds) for one process."""
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.schema_applied: bool | None = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, applied: bool | None = None) -> None:
+        with self._lock:
+            self.timings.setdefault(name, seconds)
+            if applied is not None and self.schema_applied is None:
+                self.schema_applied = applied
+
+    def watch_engine(self, engine) -> None:
+        """Time the engine's first DB connection."""
+        connecting = {}
+
+        @event.listens_for(engine, "do_connect")
+        def _before(dialect, conn_rec, cargs, cparams):
+            connecting.setdefault("started", time.perf_counter())
+
+        @event.listens_for(engine, "connect", once=True)
+        def _after(dbapi_connection, connection_record):
+            self.record("db_connect", time.perf_counter() - connecting.get("started", time.perf_counter()))
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            report = {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
+            return {"ms": report, "schema_applied": self.schema_applied}
+
+    def summary(self) -> str:
+        data = self.as_dict()
+        parts = [f"{name} {ms}ms" for name, ms in data["ms"].items()]
+        if data["schema_applied"] is not None:
+            parts.append("schema " + ("updated" if data["schema_applied"] else "up to date"))
+        return "startup: " + ", ".join(parts)
+
+
+def init_app(app) -> StartupReport:
+    """Wire up the startup report and, in first-request mode, the schema check."""
+    mode = app.config.setdefault("SCHEMA_BOOTSTRAP", "first-request")
+    if mode not in MODES:
+        raise ValueError(f"SCHEMA_BOOTSTRAP must be one of {MODES}, not {mode!r}")
+    report = app.extensions["workbrew.startup"] = StartupReport()
+    with app.app_context():
+        report.watch_engine(db.engine)   # creating the engine does not connect
+    state = {"done": False}
+    lock = threading.Lock()
+
+    @app.before_request
+    def _first_request():
+        if state["done"]:
+            return
+        with lock:
+            if state["done"]:
+                return
+            g.startup_request_started = time.perf_counter()
+            if app.config["SCHEMA_BOOTSTRAP"] == "first-request":
+                ensure_schema(app)
+            state["done"] = True
+
+    @app.after_request
+    def _report_first_request(response):
+        started = g.pop("startup_request_started", None)
+        if started is not None:
+            report.record("first_request", time.perf_counter() - started)
+            app.logger.info(report.summary())
+        return response
+
+    return report
+
+
+if __name__ == "__main__":
+    from app import app
+
+    applied = ensure_schema(app)
+    print(("Schema updated." if applied else "Schema already up to date.")
+          + " " + app.extensions["workbrew.startup"].summary())
@@ -0,0 +1,291 @@
+"""
+Admin bulk operations: multi-delete, batch amenity edits and CSV import.
+
+All three are JSON endpoints under ``/admin/cafes/`` (plus a small page at
+``/admin/bulk`` that drives them), admin-only and CSRF-protected like the
+per-card delete form: send the token as a ``csrf_token`` form field or an
+``X-CSRFToken`` header.
+
+Each request is one transaction. Deletes and flag edits are set-based —
+``DELETE`` / ``UPDATE … WHERE id IN (…)`` in chunks of ``ID_CHUNK``, or a
+single statement for a filter — and the CSV import validates every row
+against ``CafeForm`` while the upload is read, upserting valid rows in
+chunks on ``Cafe.name`` exactly like ``bulk_load.py``. Afterwards the facet
+counts are recounted once, the catalog generation is bumped and the
+in-process indexes rebuild on their next read. Every response carries a
+per-row report::
+
+    {"deleted": 2, "errors": [{"row": 3, "id": 99, "errors": {"id": ["No such cafe."]}}]}
+
+``row`` is the position in the id list, or the line number in the CSV. The
+filters span every city unless ``city`` is given; CSV rows without a ``city``
+column go to the default city.
+"""
+import csv
+import io
+import itertools
+
+from flask import abort, current_app, jsonify, render_template, request, session
+from sqlalchemy import delete, select, tuple_, update
+from werkzeug.datastructures import MultiDict
+
+import bulk_load
+import catalog
+import facets
+import jobs
+from extensions import db
+from forms import CafeForm
+from models import Cafe, PendingJob
+
+# Ids per DELETE / UPDATE statement; keeps bound parameters well under every
+# driver's limit (SQLite's is 32766).
+ID_CHUNK = 500
+# Valid CSV rows per upsert executemany.
+IMPORT_CHUNK = 1000
+# Amenity flags a batch edit may set.
+FLAGS = facets.AMENITIES
+FILTERS = ("wifi", "sockets", "calls", "location", "city")
+
+
+class BulkError(ValueError):
+    """A request the bulk endpoints can't act on (reported as HTTP 400)."""
+
+
+def _payload() -> MultiDict:
+    """The JSON body or the form fields, as one MultiDict (JSON lists become repeated keys)."""
+    if not request.is_json:
+        return request.form
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise BulkError("expected a JSON object")
+    return MultiDict([(key, item) for key, value in data.items()
+                      for item in (value if isinstance(value, list) else [value]) or [""]])
+
+
+def parse_ids(values) -> tuple[list[int], list[dict]]:
+    """Ids from a list of ints/strings (strings may hold several, comma- or space-separated)."""
+    ids, errors = [], []
+    tokens = itertools.chain.from_iterable(
+        str(value).replace(",", " ").split() if isinstance(value, str) else [value] for value in values
+    )
+    for row, token in enumerate(tokens, start=1):
+        try:
+            ids.append(int(token))
+        except (TypeError, ValueError):
+            errors.append({"row": row, "id": token, "errors": {"id": ["Not a cafe id."]}})
+    return list(dict.fromkeys(ids)), errors
+
+
+def _target(data: MultiDict) -> tuple[list[int] | None, list, list[dict]]:
+    """``(ids, filter clauses, errors)``: an id list, or the index() filters."""
+    if "ids" in data:
+        ids, errors = parse_ids(data.getlist("ids"))
+        return ids, [], errors
+    clauses = catalog.filter_clauses(*(data.get(name) for name in FILTERS))
+    if not clauses:
+        raise BulkError(f"give ids or at least one filter ({', '.join(FILTERS)})")
+    return None, clauses, []
+
+
+def _missing(ids: list[int], found: set[int], errors: list[dict]) -> None:
+    for row, cafe_id in enumerate(ids, start=1):
+        if cafe_id not in found:
+            errors.append({"row": row, "id": cafe_id, "errors": {"id": ["No such cafe."]}})
+
+
+def _chunks(items: list):
+    for start in range(0, len(items), ID_CHUNK):
+        yield items[start:start + ID_CHUNK]
+
+
+def _finish(changed_ids) -> None:
+    """Recount facets, bump the generation and commit; then refresh this worker."""
+    facets.rebuild(db.session.connection())
+    catalog.bump_generation()
+    db.session.commit()
+    catalog.cafes_changed(changed_ids)
+
+
+def delete_cafes(ids: list[int] | None = None, clauses=()) -> tuple[list[int], list[dict]]:
+    """Delete cafes by id (reporting unknown ids) or by filter; one transaction."""
+    table = Cafe.__table__
+    if ids is None:
+        statements = [delete(table).where(*clauses).returning(table.c.id)]
+    else:
+        statements = [delete(table).where(table.c.id.in_(chunk)).returning(table.c.id) for chunk in _chunks(ids)]
+    deleted = [cafe_id for stmt in statements for cafe_id in db.session.execute(stmt).scalars()]
+    errors = []
+    if ids is not None:
+        _missing(ids, set(deleted), errors)
+    if deleted:
+        for chunk in _chunks(deleted):
+            db.session.execute(delete(PendingJob).where(PendingJob.cafe_id.in_(chunk)))
+        _finish(deleted)
+    else:
+        db.session.rollback()
+    return deleted, errors
+
+
+def update_flags(values: dict[str, bool], ids: list[int] | None = None, clauses=()) -> tuple[list[int], list[dict]]:
+    """Set amenity flags on cafes by id (reporting unknown ids) or by filter."""
+    table = Cafe.__table__
+    if ids is None:
+        statements = [update(table).where(*clauses).values(values).returning(table.c.id)]
+    else:
+        statements = [update(table).where(table.c.id.in_(chunk)).values(values).returning(table.c.id)
+                      for chunk in _chunks(ids)]
+    updated = [cafe_id for stmt in statements for cafe_id in db.session.execute(stmt).scalars()]
+    errors = []
+    if ids is not None:
+        _missing(ids, set(updated), errors)
+    if updated:
+        _finish(updated)
+    else:
+        db.session.rollback()
+    return updated, errors
+
+
+def _form_data(record: dict) -> MultiDict:
+    """A CSV record as CafeForm input: flags present only when truthy."""
+    data = MultiDict()
+    for key, value in record.items():
+        if key is None or value is None:
+            continue
+        value = value.strip()
+        if key in bulk_load.BOOL_COLUMNS:
+            if value.lower() in bulk_load._TRUE:
+                data[key] = "y"
+        else:
+            data[key] = value
+    return data
+
+
+def validate_rows(records, form: CafeForm | None = None):
+    """Yield ``(line, row, errors)`` per CSV record; *row* is None when invalid.
+
+    Each record is checked by ``CafeForm`` (the rules ``POST /add`` applies),
+    then coerced by ``bulk_load.normalize`` so optional ``lat`` / ``lng``
+    columns come through as numbers and ``city`` must name a known city. One
+    form is reused across rows.
+    """
+    form = form or CafeForm(meta={"csrf": False})
+    registry = current_app.extensions["workbrew.cities"]
+    for line, record in records:
+        form.process(_form_data(record))
+        if not form.validate():
+            yield line, None, {name: list(messages) for name, messages in form.errors.items()}
+            continue
+        data = {name: field.data for name, field in form._fields.items() if name != "submit"}
+        data.update(city=record.get("city"), lat=record.get("lat"), lng=record.get("lng"))
+        try:
+            row = bulk_load.normalize(data)
+        except bulk_load.RowError as exc:
+            yield line, None, {"row": [str(exc)]}
+            continue
+        if registry.get(row["city"]) is None:
+            yield line, None, {"city": ["Unknown city."]}
+            continue
+        yield line, row, None
+
+
+def import_csv(stream, enqueue_thumbnails: bool = False) -> tuple[int, list[dict]]:
+    """Validate and upsert a CSV (header row = cafe columns) read from text *stream*.
+
+    Valid rows are upserted on ``(city, name)`` in ``IMPORT_CHUNK`` batches inside
+    one transaction; invalid ones are reported and skipped. Cafes without
+    coordinates (or thumbnails) get their background jobs queued set-based.
+    """
+    reader = csv.DictReader(stream)
+    missing = [col for col in bulk_load.REQUIRED if col not in (reader.fieldnames or ())]
+    if missing:
+        raise BulkError(f"CSV header lacks {', '.join(missing)}")
+    # reader.line_num is the physical line just read; quoted newlines keep it honest.
+    records = ((reader.line_num, record) for record in reader)
+    stmt = bulk_load._upsert_statement(db.engine.dialect.name)
+    keys, errors = [], []
+    rows = iter(validate_rows(records))
+    while True:
+        batch = list(itertools.islice(rows, IMPORT_CHUNK))
+        if not batch:
+            break
+        by_key = {}
+        for line, row, row_errors in batch:
+            if row is None:
+                errors.append({"row": line, "errors": row_errors})
+            else:
+                by_key[row["city"], row["name"]] = row   # last occurrence wins, as in bulk_load
+        if by_key:
+            db.session.execute(stmt, list(by_key.values()))
+            keys.extend(by_key)
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        db.session.rollback()
+        return 0, errors
+
+    # A name is only unique within its city, so every follow-up matches both.
+    key = tuple_(Cafe.city, Cafe.name)
+    for chunk in _chunks(keys):
+        jobs.enqueue_where(jobs.JOB_GEOCODE, key.in_(chunk), Cafe.lat.is_(None))
+        if enqueue_thumbnails:
+            jobs.enqueue_where(jobs.JOB_THUMBNAIL, key.in_(chunk), Cafe.thumb_key.is_(None))
+    ids = [cafe_id for chunk in _chunks(keys)
+           for cafe_id in db.session.execute(select(Cafe.id).where(key.in_(chunk))).scalars()]
+    _finish(ids)
+    jobs.notify()
+    return len(keys), errors
+
+
+def init_app(app) -> None:
+    def _admin_only():
+        if not session.get("is_admin"):
+            abort(403)
+
+    def _bad_request(exc: BulkError):
+        return jsonify({"error": str(exc)}), 400
+
+    @app.route("/admin/bulk")
+    def bulk_tools():
+        _admin_only()
+        return render_template("admin_bulk.html", flags=FLAGS, locations=catalog.locations())
+
+    @app.route("/admin/cafes/delete", methods=["POST"])
+    def bulk_delete():
+        _admin_only()
+        try:
+            ids, clauses, errors = _target(_payload())
+        except BulkError as exc:
+            return _bad_request(exc)
+        deleted, missing = delete_cafes(ids, clauses)
+        return jsonify({"deleted": len(deleted), "ids": deleted, "errors": errors + missing})
+
+    @app.route("/admin/cafes/flags", methods=["POST"])
+    def bulk_flags():
+        _admin_only()
+        data = _payload()
+        values = {}
+        for flag in FLAGS:
+            if f"set_{flag}" in data:
+                values[flag] = str(data[f"set_{flag}"]).lower() in bulk_load._TRUE
+        try:
+            if not values:
+                raise BulkError(f"nothing to set: give one or more of {', '.join('set_' + f for f in FLAGS)}")
+            ids, clauses, errors = _target(data)
+        except BulkError as exc:
+            return _bad_request(exc)
+        updated, missing = update_flags(values, ids, clauses)
+        return jsonify({"updated": len(updated), "errors": errors + missing})
+
+    @app.route("/admin/cafes/import", methods=["POST"])
+    def bulk_import():
+        _admin_only()
+        upload = request.files.get("file")
+        if upload is None:
+            return _bad_request(BulkError("upload a CSV file as 'file'"))
+        # Decoded as it is read: the upload is never held in memory as one string.
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        try:
+            imported, errors = import_csv(stream, enqueue_thumbnails=app.config["THUMBNAILS_ENABLED"])
+        except (BulkError, UnicodeDecodeError, csv.Error) as exc:
+            db.session.rollback()
+            return _bad_request(BulkError(str(exc)))
+        return jsonify({"imported": imported, "errors": errors})
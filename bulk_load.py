@@ -0,0 +1,223 @@
+"""
+Bulk cafe loader: stream CSV / NDJSON / JSON files into the cafe table.
+
+Usage:
+    python bulk_load.py cafes.csv [more.ndjson ...] [--chunk-size 5000]
+
+Rows are upserted on the unique ``(city, name)`` in chunks, one transaction per
+chunk, through SQLAlchemy Core (executemany) — or on Postgres via ``COPY`` into
+a temp staging table followed by one ``INSERT … ON CONFLICT``. Unchanged rows
+are skipped by the conflict clause, so re-running a load is idempotent and
+cheap, and coordinates already geocoded are never overwritten with blanks.
+Rows without a ``city`` column belong to the default city (``london``).
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import DEFAULT_CITY, Cafe, parse_price, parse_seats
+
+TABLE = Cafe.__table__
+# Columns the app derives itself; never read from a file.
+DERIVED = {"id", "thumb_key"}
+# Columns parsed from ``coffee_price`` / ``seats`` here, as the model's validators
+# would: loaded, but never read from the file.
+PARSED = {"price_pence", "seats_min", "seats_max"}
+COLUMNS = [c.name for c in TABLE.columns if c.name not in DERIVED]
+BOOL_COLUMNS = {"has_sockets", "has_toilet", "has_wifi", "can_take_calls"}
+FLOAT_COLUMNS = {"lat", "lng"}
+REQUIRED = ("name", "map_url", "img_url", "location")
+# The upsert's conflict target: a cafe's name is unique within its city.
+KEY = ("city", "name")
+# Columns a load never blanks out: a NULL in the file keeps the stored value.
+KEEP_IF_NULL = {"lat", "lng"}
+
+_TRUE = {"1", "true", "t", "yes", "y"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_records(path: str, fmt: str | None = None):
+    """Yield raw dicts from a CSV, NDJSON or JSON-array file.
+
+    CSV and NDJSON are streamed line by line. A ``.json`` array is parsed in
+    one go — prefer NDJSON for very large inputs.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            yield from csv.DictReader(fh)
+        elif fmt in ("ndjson", "jsonl"):
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+        elif fmt == "json":
+            yield from json.load(fh)
+        else:
+            raise ValueError(f"unsupported format: {fmt!r}")
+
+
+def normalize(record: dict) -> dict:
+    """Coerce one raw record into cafe column values, or raise ``RowError``."""
+    row = {}
+    for col in COLUMNS:
+        if col in PARSED:
+            continue
+        value = record.get(col)
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "":
+                value = None
+        if col in BOOL_COLUMNS:
+            value = value if isinstance(value, bool) else str(value or "").lower() in _TRUE
+        elif col in FLOAT_COLUMNS and value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise RowError(f"{col} is not a number: {value!r}")
+        elif col == "city":
+            value = str(value or DEFAULT_CITY).lower()
+        elif value is not None:
+            value = str(value)
+        row[col] = value
+    row["price_pence"] = parse_price(row["coffee_price"])
+    row["seats_min"], row["seats_max"] = parse_seats(row["seats"])
+    missing = [col for col in REQUIRED if not row[col]]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    return row
+
+
+def _upsert_statement(dialect_name: str):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    stmt = dialect.insert(TABLE)
+    excluded = stmt.excluded
+    updates = {
+        col: func.coalesce(excluded[col], TABLE.c[col]) if col in KEEP_IF_NULL else excluded[col]
+        for col in COLUMNS if col not in KEY
+    }
+    # Only touch rows whose content actually changed — re-runs write nothing.
+    changed = or_(*[TABLE.c[col].is_distinct_from(expr) for col, expr in updates.items()])
+    # A new photo URL invalidates the thumbnails (python thumbnails.py re-renders).
+    updates["thumb_key"] = case((TABLE.c.img_url.is_distinct_from(excluded.img_url), None),
+                                else_=TABLE.c.thumb_key)
+    return stmt.on_conflict_do_update(index_elements=list(KEY), set_=updates, where=changed)
+
+
+def _copy_chunk(conn, rows: list[dict]) -> None:
+    """Postgres fast path: COPY the chunk into a staging table, then upsert."""
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS cafe_stage "
+        f"(LIKE {TABLE.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["" if row[c] is None else row[c] for c in COLUMNS])
+    buf.seek(0)
+    cols = ", ".join(COLUMNS)
+    raw = conn.connection.driver_connection
+    with raw.cursor() as cur:
+        cur.copy_expert(f"COPY cafe_stage ({cols}) FROM STDIN WITH (FORMAT csv, NULL '')", buf)
+
+    sets = ", ".join(
+        f"{c} = COALESCE(EXCLUDED.{c}, {TABLE.name}.{c})" if c in KEEP_IF_NULL else f"{c} = EXCLUDED.{c}"
+        for c in COLUMNS if c not in KEY
+    )
+    sets += (f", thumb_key = CASE WHEN {TABLE.name}.img_url IS DISTINCT FROM EXCLUDED.img_url "
+             f"THEN NULL ELSE {TABLE.name}.thumb_key END")
+    changed = " OR ".join(f"{TABLE.name}.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in COLUMNS if c not in KEY)
+    conn.exec_driver_sql(
+        f"INSERT INTO {TABLE.name} ({cols}) SELECT {cols} FROM cafe_stage "
+        f"ON CONFLICT ({', '.join(KEY)}) DO UPDATE SET {sets} WHERE {changed}"
+    )
+
+
+def load(records, chunk_size: int = 5000, use_copy: bool | None = None, report=print) -> dict:
+    """Upsert *records* in chunks; return ``{"rows", "errors", "seconds"}``.
+
+    Needs an app context. Each chunk commits on its own (and bumps the catalog
+    generation), so an interrupted load keeps every finished chunk and a
+    re-run skips them cheaply. The facet counts are recounted once at the end.
+    ``errors`` lists ``(record_number, message)``.
+    """
+    import catalog   # lazy: keeps the parsing helpers importable without Flask
+    import facets
+    from extensions import db
+
+    dialect = db.engine.dialect
+    if use_copy is None:
+        use_copy = dialect.name == "postgresql" and dialect.driver == "psycopg2"
+    stmt = None if use_copy else _upsert_statement(dialect.name)
+
+    loaded, errors = 0, []
+    started = time.monotonic()
+    numbered = enumerate(records, start=1)
+    while True:
+        batch = list(itertools.islice(numbered, chunk_size))
+        if not batch:
+            break
+        by_key = {}
+        for number, record in batch:
+            try:
+                row = normalize(record)
+            except RowError as exc:
+                errors.append((number, str(exc)))
+                continue
+            by_key[row["city"], row["name"]] = row   # last occurrence wins within a chunk
+        rows = list(by_key.values())
+        if rows:
+            if use_copy:
+                _copy_chunk(db.session.connection(), rows)
+            else:
+                db.session.execute(stmt, rows)
+            catalog.bump_generation()
+            db.session.commit()
+        loaded += len(rows)
+        elapsed = time.monotonic() - started
+        report(f"  {loaded:>10,} rows  {loaded / max(elapsed, 1e-9):>10,.0f} rows/s")
+
+    if loaded:
+        # Upserts can move a cafe between locations, so recount rather than
+        # tracking per-row deltas; one GROUP BY pass at the end of the load.
+        facets.rebuild(db.session.connection())
+        catalog.bump_generation()
+        db.session.commit()
+    return {"rows": loaded, "errors": errors, "seconds": time.monotonic() - started}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="CSV, NDJSON (.ndjson/.jsonl) or JSON-array files")
+    parser.add_argument("--format", choices=("csv", "ndjson", "json"), help="override extension sniffing")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per transaction (default 5000)")
+    parser.add_argument("--no-copy", action="store_true", help="skip the Postgres COPY fast path")
+    args = parser.parse_args(argv)
+
+    import bootstrap
+    from app import app
+
+    bootstrap.ensure_schema(app)
+    with app.app_context():
+        records = itertools.chain.from_iterable(iter_records(p, args.format) for p in args.paths)
+        result = load(records, args.chunk_size, use_copy=False if args.no_copy else None)
+    for number, message in result["errors"][:50]:
+        print(f"  ⚠ record {number}: {message}", file=sys.stderr)
+    rate = result["rows"] / max(result["seconds"], 1e-9)
+    print(f"✅ Upserted {result['rows']:,} rows in {result['seconds']:.1f}s "
+          f"({rate:,.0f} rows/s); {len(result['errors'])} rejected.")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Versioned in-process response cache with single-flight miss handling."""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedPage:
+    __slots__ = ("body", "etag", "last_modified", "version")
+
+    def __init__(self, body: bytes, last_modified, version):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.last_modified = last_modified
+        self.version = version
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller runs ``fn``; callers arriving while it is in flight block
+    until it finishes and receive the same result (or exception).
+    """
+
+    class _Call:
+        __slots__ = ("done", "result", "error")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class ResponseCache:
+    """LRU map of key → ``CachedPage``, valid only for one catalog version.
+
+    Entries from an older version are treated as misses and overwritten, so
+    bumping the version invalidates everything without walking the cache.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, key, version) -> CachedPage | None:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None or page.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def put(self, key, page: CachedPage) -> None:
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, version, last_modified, render) -> CachedPage:
+        """Return the cached page for *key*, calling ``render()`` (str or bytes) on a miss."""
+        page = self.get(key, version)
+        if page is not None:
+            self.hits += 1
+            return page
+        self.misses += 1
+
+        def fill() -> CachedPage:
+            page = self.get(key, version)    # a previous leader may have filled it
+            if page is None:
+                body = render()
+                page = CachedPage(body.encode("utf-8") if isinstance(body, str) else body, last_modified, version)
+                self.put(key, page)
+            return page
+
+        return self._flight.do((key, version), fill)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FragmentCache:
+    """LRU of rendered template fragments keyed by ``(item id, version, variant)``.
+
+    *version* changes whenever the item's content does, so a hit is never
+    stale; ``invalidate`` additionally drops every entry for an item at once
+    when it is written, instead of leaving them to age out.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._by_item: dict = {}           # item id → keys cached for it
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_render(self, item_id, version, variant, render):
+        """Return the fragment for the key, calling ``render()`` on a miss."""
+        key = (item_id, version, variant)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = render()
+        with self._lock:
+            self._entries[key] = fragment
+            self._by_item.setdefault(item_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+        return fragment
+
+    def _forget(self, key) -> None:
+        keys = self._by_item.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_item[key[0]]
+
+    def invalidate(self, item_id) -> None:
+        with self._lock:
+            for key in self._by_item.pop(item_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_item.clear()
@@ -0,0 +1,450 @@
+"""In-process read indexes over the cafe table, kept in sync by the write routes.
+
+Indexes are partitioned by city: each city's are built lazily from its own
+rows on first use in each worker and then patched incrementally by
+``cafe_added`` / ``cafe_deleted`` after every commit. Every write also bumps
+its city's ``City.generation`` (and the global ``CatalogState.generation``)
+in the same transaction; other workers notice the newer generation (checked
+at most every ``CATALOG_SYNC_INTERVAL`` seconds) and rebuild that city only.
+Functions taking ``city`` default to the request's city (``cities.current``).
+
+The numeric range filters and sorts (``max_price``, ``min_seats``, ``sort``)
+are not indexed here: ``sorted_page`` answers them from the database, with
+keyset scans of the ``price_pence`` / ``seats_min`` indexes.
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import func, or_, select, tuple_, update
+
+import facets
+import readmodel
+import search
+import stream
+from bitmap import BitmapIndex
+from extensions import db
+import cities
+from models import INT_MAX, Cafe, CatalogState, City
+from spatial import SpatialIndex
+from tiles import TileCache, cluster_tile, tile_bounds, tile_xy, tiles_for_bbox
+
+# Boolean columns that get their own bitset in the filter index.
+AMENITIES = facets.AMENITIES
+LOCATION_PREFIX = "location:"
+# index() ``sort`` values: (column, descending). Cafes without a value come last.
+SORTS = {"price": (Cafe.price_pence, False), "seats": (Cafe.seats_min, True)}
+
+_build_lock = threading.Lock()
+
+
+class _Indexes:
+    def __init__(self, cell_deg: float, generation: int, updated_at: datetime | None):
+        self.spatial = SpatialIndex(cell_deg=cell_deg)
+        self.filters = BitmapIndex()
+        self.search = search.TrigramIndex()
+        self.tiles = TileCache()
+        self.bounds = None
+        self.facet_counts = None        # facets.read(), loaded on first use
+        self.generation = generation
+        self.updated_at = updated_at
+        self.checked_at = time.monotonic()
+
+    def add(self, row: readmodel.CafeRow) -> None:
+        self.remove(row.id)
+        self.filters.insert(row.id, (row.name, row.id), row, _facets(row))
+        self.search.insert(row.id, (row.name, row.id), f"{row.name} {row.location}", row)
+        if row.lat is not None and row.lng is not None:
+            self.spatial.insert(row.id, row.lat, row.lng, row.map_payload())
+            self.tiles.invalidate_point(row.lat, row.lng)
+            self.bounds = None
+
+    def load(self, rows) -> None:
+        """Fill empty indexes from ``CafeRow``s in one pass (bulk-building the bitmap)."""
+        entries = []
+        for row in rows:
+            entries.append((row.id, (row.name, row.id), row, _facets(row)))
+            self.search.insert(row.id, (row.name, row.id), f"{row.name} {row.location}", row)
+            if row.lat is not None and row.lng is not None:
+                self.spatial.insert(row.id, row.lat, row.lng, row.map_payload())
+        self.filters.load(entries)
+
+    def remove(self, cafe_id: int) -> None:
+        self.filters.remove(cafe_id)
+        self.search.remove(cafe_id)
+        point = self.spatial.point(cafe_id)
+        if point is not None:
+            self.spatial.remove(cafe_id)
+            self.tiles.invalidate_point(*point)
+            self.bounds = None
+
+
+def _facets(row: readmodel.CafeRow) -> list[str]:
+    names = [amenity for amenity in AMENITIES if getattr(row, amenity)]
+    names.append(LOCATION_PREFIX + row.location)
+    return names
+
+
+def _read_state(city: str) -> tuple[int, datetime | None]:
+    row = db.session.execute(select(City.generation, City.updated_at).where(City.slug == city)).first()
+    return (row.generation, row.updated_at) if row else (0, None)
+
+
+def _build(city: str) -> _Indexes:
+    # Read the generation before the rows: a write landing in between leaves
+    # the indexes newer than their generation, which only costs a rebuild.
+    generation, updated_at = _read_state(city)
+    indexes = _Indexes(current_app.config.get("SPATIAL_CELL_DEG", 0.01), generation, updated_at)
+    stmt = readmodel.card_select(Cafe.city == city).execution_options(yield_per=5000)
+    indexes.load(readmodel.iter_rows(db.session.execute(stmt)))
+    return indexes
+
+
+def _partitions() -> dict[str, _Indexes]:
+    return current_app.extensions.setdefault("workbrew.catalog", {})
+
+
+def _indexes(city: str | None = None) -> _Indexes:
+    city = city or cities.current_slug()
+    partitions = _partitions()
+    indexes = partitions.get(city)
+    interval = current_app.config.get("CATALOG_SYNC_INTERVAL", 1.0)
+    if has_request_context() and request.environ.get("workbrew.read_your_writes"):
+        interval = 0.0                    # this client just wrote, maybe via another worker
+    if indexes is not None and time.monotonic() - indexes.checked_at < interval:
+        return indexes
+    # One sync check per request at most: every catalog read in a request
+    # then sees the same snapshot, and a page render costs one query, not four.
+    in_request = has_request_context()
+    synced = request.environ.setdefault("workbrew.catalog_synced", {}) if in_request else {}
+    if indexes is not None and synced.get(city) is indexes:
+        return indexes
+    with _build_lock:
+        indexes = partitions.get(city)
+        if indexes is None:
+            indexes = partitions[city] = _build(city)
+        elif time.monotonic() - indexes.checked_at >= interval:
+            generation, _ = _read_state(city)
+            if generation > indexes.generation:
+                indexes = partitions[city] = _build(city)
+            indexes.checked_at = time.monotonic()
+    synced[city] = indexes
+    return indexes
+
+
+def generation(city: str | None = None) -> tuple[int, datetime | None]:
+    """Return ``(generation, updated_at)`` of the city's catalog the indexes reflect."""
+    indexes = _indexes(city)
+    return indexes.generation, indexes.updated_at
+
+
+def bump_generation(city: str | None = None) -> int:
+    """Increment *city*'s catalog generation inside the current transaction.
+
+    Call before committing a catalog write; pass the returned value on to
+    ``cafe_added`` / ``cafe_deleted`` after the commit. With no city (a bulk
+    write that may span several) every city's generation moves. The global
+    ``CatalogState.generation`` moves on every write either way; replica
+    health checks compare it.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    overall = db.session.execute(
+        update(CatalogState).where(CatalogState.id == 1)
+        .values(generation=CatalogState.generation + 1, updated_at=now)
+        .returning(CatalogState.generation)
+    ).scalar()
+    if overall is None:
+        overall = 1
+        db.session.add(CatalogState(id=1, generation=overall, updated_at=now))
+    stmt = update(City).values(generation=City.generation + 1, updated_at=now)
+    if city is None:
+        bumped = dict(db.session.execute(stmt.returning(City.slug, City.generation)).all())
+    else:
+        bumped = dict(db.session.execute(stmt.where(City.slug == city).returning(City.slug, City.generation)).all())
+    # A built-in city has no row until the schema bootstrap adds one.
+    for slug in ([city] if city else cities.BUILTIN):
+        if slug not in bumped and slug in cities.BUILTIN:
+            bumped[slug] = 1
+            db.session.add(City(slug=slug, **cities.BUILTIN[slug], generation=1, updated_at=now))
+    db.session.flush()
+    return overall if city is None else bumped.get(city, 0)
+
+
+def spatial_index(city: str | None = None) -> SpatialIndex:
+    """Return the city's spatial index, building it from the DB on first call."""
+    return _indexes(city).spatial
+
+
+def filter_index(city: str | None = None) -> BitmapIndex:
+    """Return the city's amenity/location bitmap index (cards in name order)."""
+    return _indexes(city).filters
+
+
+def map_bounds(city: str | None = None) -> tuple[float, float, float, float] | None:
+    """(south, west, north, east) around every pinned cafe in the city, for the initial view."""
+    indexes = _indexes(city)
+    if indexes.bounds is None:
+        indexes.bounds = indexes.spatial.bounds()
+    return indexes.bounds
+
+
+def map_features(west: float, south: float, east: float, north: float, zoom: int, facets: list[str]) -> list[dict]:
+    """Clusters and markers for every tile in the viewport, via the tile cache."""
+    indexes = _indexes()
+    features = []
+    for x, y in tiles_for_bbox(west, south, east, north, zoom):
+        features.extend(indexes.tiles.get_or_build(
+            (zoom, x, y), tuple(facets), lambda: _build_tile(indexes, zoom, x, y, facets),
+        ))
+    return features
+
+
+def _build_tile(indexes: _Indexes, zoom: int, x: int, y: int, facets: list[str]) -> list[dict]:
+    points = [
+        p for p in indexes.spatial.within(*tile_bounds(zoom, x, y))
+        if tile_xy(p["lat"], p["lng"], zoom) == (x, y) and _matches(p, facets)
+    ]
+    return cluster_tile(zoom, points)
+
+
+def _matches(payload: dict, facets: list[str]) -> bool:
+    for name in facets:
+        if name.startswith(LOCATION_PREFIX):
+            if payload["location"] != name[len(LOCATION_PREFIX):]:
+                return False
+        elif not payload[name]:
+            return False
+    return True
+
+
+def filter_facets(wifi=None, sockets=None, calls=None, location=None) -> list[str]:
+    """Translate the index() query args into bitmap facet names."""
+    names = []
+    if wifi:     names.append("has_wifi")
+    if sockets:  names.append("has_sockets")
+    if calls:    names.append("can_take_calls")
+    if location: names.append(LOCATION_PREFIX + location)
+    return names
+
+
+def filter_clauses(wifi=None, sockets=None, calls=None, location=None, city=None) -> list:
+    """The same filters as ``filter_facets``, as SQL WHERE clauses on ``Cafe``.
+
+    *city*, when given, leads the list (it's the first column of the cafe indexes).
+    """
+    clauses = [Cafe.city == city] if city else []
+    if wifi:     clauses.append(Cafe.has_wifi.is_(True))
+    if sockets:  clauses.append(Cafe.has_sockets.is_(True))
+    if calls:    clauses.append(Cafe.can_take_calls.is_(True))
+    if location: clauses.append(Cafe.location == location)
+    return clauses
+
+
+def range_clauses(max_price: int | None = None, min_seats: int | None = None) -> list:
+    """WHERE clauses for the numeric filters: coffee at most *max_price* pence, at least *min_seats* seats."""
+    clauses = []
+    if max_price is not None: clauses.append(Cafe.price_pence <= max_price)
+    if min_seats is not None: clauses.append(Cafe.seats_min >= min_seats)
+    return clauses
+
+
+def count(clauses) -> int:
+    """Number of cafes matching *clauses* (from ``filter_clauses`` / ``range_clauses``)."""
+    return db.session.execute(select(func.count()).select_from(Cafe).where(*clauses)).scalar_one()
+
+
+def sorted_page(clauses, sort: str | None = None, after=None, limit: int = 24) -> tuple[list, object]:
+    """One keyset page of cards from SQL, for range-filtered or sorted listings.
+
+    *clauses* should lead with the city (``filter_clauses(..., city=…)``), so
+    each scan stays on one ``ix_cafe_city_*`` index. Without *sort* cards come
+    in name order, keyed ``(name, id)``; with one, by ``SORTS[sort]`` and then
+    name, keyed ``(value, name, id)``, and cafes whose value is unknown follow
+    in name order. Returns ``(rows, next_key)`` like ``BitmapIndex.page``.
+    """
+    name_key = tuple_(Cafe.name, Cafe.id)
+
+    def fetch(where, order, n, column=None):
+        stmt = readmodel.card_select(*where).order_by(*order).limit(n)
+        if column is None:
+            return [(row, (row.name, row.id)) for row in readmodel.iter_rows(db.session.execute(stmt))]
+        return [(readmodel.CafeRow(values), (values[-1], values.name, values.id))
+                for values in db.session.execute(stmt.add_columns(column))]
+
+    if sort is None:
+        where = [*clauses, name_key > tuple(after)] if after else clauses
+        rows = fetch(where, (Cafe.name, Cafe.id), limit + 1)
+    else:
+        column, descending = SORTS[sort]
+        rows = []
+        if after is None or after[0] is not None:
+            where = [*clauses, column.is_not(None)]
+            if after:
+                # ``column >= value`` gives the scan a start; the OR settles ties.
+                value, name, cafe_id = after
+                if descending:
+                    where += [column <= value, or_(column < value, name_key > (name, cafe_id))]
+                else:
+                    where += [column >= value, or_(column > value, name_key > (name, cafe_id))]
+            rows = fetch(where, (column.desc() if descending else column, Cafe.name, Cafe.id), limit + 1, column)
+        if len(rows) <= limit:
+            where = [*clauses, column.is_(None)]
+            if after and after[0] is None:
+                where.append(name_key > tuple(after[1:]))
+            rows += fetch(where, (Cafe.name, Cafe.id), limit + 1 - len(rows), column)
+    page = rows[:limit]
+    return [row for row, _ in page], (page[-1][1] if len(rows) > limit else None)
+
+
+def search_cafes(query: str, limit: int, wifi=None, sockets=None, calls=None, location=None) -> list[dict]:
+    """Cards ranked by fuzzy match on name and location, each with a ``score``.
+
+    Uses pg_trgm on Postgres (``SEARCH_BACKEND=postgres``) and the in-process
+    trigram index otherwise; the index() filters narrow either one.
+    """
+    if current_app.config.get("SEARCH_BACKEND") == "postgres":
+        clauses = filter_clauses(wifi, sockets, calls, location, city=cities.current_slug())
+        stmt = search.postgres_statement(query, clauses, limit)
+        if stmt is None:
+            return []
+        search.set_postgres_threshold(db.session)
+        return [{**readmodel.CafeRow(row), "score": round(row.score, 3)} for row in db.session.execute(stmt)]
+
+    facets = filter_facets(wifi, sockets, calls, location)
+    hits = _indexes().search.search(query, limit, accept=lambda card: _matches(card, facets))
+    return [{**card, "score": score} for score, card in hits]
+
+
+def encode_cursor(sort_key) -> str:
+    """Opaque, URL-safe form of a ``(name, id)`` or ``(value, name, id)`` keyset cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sorted_by: bool = False) -> tuple:
+    """Inverse of ``encode_cursor``; raises ``ValueError`` on anything malformed.
+
+    Expects a ``(value, name, id)`` key when *sorted_by* is set (``sorted_page``
+    with a sort), else ``(name, id)``.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        *value, name, cafe_id = key
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"bad cursor: {cursor!r}") from exc
+    def in_range(v):   # the key's numbers go straight to INTEGER comparisons
+        return isinstance(v, int) and -INT_MAX <= v <= INT_MAX
+
+    if (not isinstance(name, str) or not in_range(cafe_id)
+            or len(value) != int(sorted_by) or not all(v is None or in_range(v) for v in value)):
+        raise ValueError(f"bad cursor: {cursor!r}")
+    return (*value, name, cafe_id)
+
+
+def facet_counts(city: str | None = None) -> dict:
+    """The city's cafes per location and per amenity, from the facet-count tables.
+
+    Read once per catalog snapshot and dropped by every write, so pages
+    rendered between writes share one small query.
+    """
+    city = city or cities.current_slug()
+    indexes = _indexes(city)
+    counts = indexes.facet_counts
+    if counts is None:
+        counts = indexes.facet_counts = facets.read(city)
+    return counts
+
+
+def locations(city: str | None = None) -> list[str]:
+    """Distinct cafe locations in the city, sorted."""
+    return [name for name, _ in facet_counts(city)["locations"]]
+
+
+def document(city: str | None = None) -> dict:
+    """The whole catalog as one compact, columnar document, for client-side filtering.
+
+    One array per field, rows in listing order (name, id). Location names are
+    stored once and referenced by position, the amenities are packed into a
+    bitmask (bit *i* set when ``AMENITIES[i]`` is true) and coordinates are
+    rounded to ~1 m. ``version`` is the city's catalog generation.
+    """
+    indexes = _indexes(city)
+    rows = indexes.filters.rows(indexes.filters.all_bits)
+    locations = sorted({row.location for row in rows})
+    position = {name: i for i, name in enumerate(locations)}
+    columns = {
+        "id": [row.id for row in rows],
+        "name": [row.name for row in rows],
+        "location": [position[row.location] for row in rows],
+        "amenities": [
+            sum(1 << bit for bit, amenity in enumerate(AMENITIES) if getattr(row, amenity)) for row in rows
+        ],
+        "lat": [None if row.lat is None else round(row.lat, 5) for row in rows],
+        "lng": [None if row.lng is None else round(row.lng, 5) for row in rows],
+    }
+    for field in ("seats", "coffee_price", "img_url", "thumb_key"):
+        columns[field] = [getattr(row, field) for row in rows]
+    return {
+        "version": indexes.generation,
+        "amenities": list(AMENITIES),
+        "locations": locations,
+        "columns": columns,
+    }
+
+
+def _apply(city: str, generation: int, cafe_id: int, change) -> None:
+    cards = current_app.extensions.get("workbrew.card_cache")
+    if cards is not None:
+        cards.invalidate(cafe_id)
+    indexes = _partitions().get(city)
+    if indexes is None:
+        return
+    with _build_lock:
+        change(indexes)
+        indexes.facet_counts = None
+        if indexes.generation == generation - 1:
+            indexes.generation = generation
+            indexes.updated_at = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        else:
+            # Another worker wrote in between — force a resync on next read.
+            indexes.checked_at = float("-inf")
+
+
+def cafe_added(cafe: Cafe, generation: int) -> None:
+    """Reflect a freshly committed cafe in the loaded indexes and open streams."""
+    row = readmodel.CafeRow.from_cafe(cafe)
+    _apply(cafe.city, generation, row.id, lambda indexes: indexes.add(row))
+    stream.publish("add", cafe.city, generation, row.id, {**row})
+
+
+def cafe_updated(cafe: Cafe, generation: int) -> None:
+    """Re-index a committed change to an existing cafe (e.g. new coordinates)."""
+    row = readmodel.CafeRow.from_cafe(cafe)
+    _apply(cafe.city, generation, row.id, lambda indexes: indexes.add(row))
+    stream.publish("update", cafe.city, generation, row.id, {**row})
+
+
+def cafe_deleted(cafe: Cafe, generation: int) -> None:
+    """Drop a deleted cafe from the loaded indexes and open pages."""
+    _apply(cafe.city, generation, cafe.id, lambda indexes: indexes.remove(cafe.id))
+    stream.publish("delete", cafe.city, generation, cafe.id, {**readmodel.CafeRow.from_cafe(cafe)})
+
+
+def cafes_changed(cafe_ids) -> None:
+    """Reflect a committed bulk write: drop the cafes' cards, rebuild on next read.
+
+    Call after committing a write that bumped the generation. Patching
+    thousands of rows into the indexes one by one costs more than the
+    single rebuild the newer generation then triggers.
+    """
+    cards = current_app.extensions.get("workbrew.card_cache")
+    if cards is not None:
+        for cafe_id in cafe_ids:
+            cards.invalidate(cafe_id)
+    with _build_lock:
+        for indexes in _partitions().values():
+            indexes.facet_counts = None
+            indexes.checked_at = float("-inf")
+    stream.publish("reset", None, None)       # open pages reload rather than replay a bulk edit
@@ -0,0 +1,184 @@
+"""
+Cities: the catalog's top-level partition.
+
+Usage:
+    python cities.py                       # list cities with their cafe counts
+    python cities.py add manchester Manchester --suffix "Manchester, UK" \\
+        --countrycodes gb --centre 53.480,-2.242 [--zoom 12]
+
+Every cafe belongs to one city (``Cafe.city``; rows from before multi-city
+support are ``london``). A city's pages live under its slug — ``/manchester/``,
+``/manchester/api/map``, ``/manchester/add`` … — and ``DEFAULT_CITY`` is also
+served at the bare paths (``/``, ``/api/map`` …), so single-city URLs keep
+working. Inside a city-scoped request ``url_for`` adds the slug by itself.
+
+Per city, the catalog keeps its own in-process indexes, generation
+(``City.generation``), facet counts, page-cache entries and map bounds, and
+the city-leading indexes on ``cafe`` keep its SQL to its own rows: a city's
+pages cost what a single-city deployment's would, however many others exist.
+"""
+import argparse
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+from flask import abort, current_app, g, has_request_context, url_for
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.routing import BaseConverter
+
+from extensions import db
+from models import DEFAULT_CITY, Cafe, City
+
+# Cities a fresh database starts with (the catalog began as London-only).
+BUILTIN = {
+    DEFAULT_CITY: dict(name="London", geocode_suffix="London, UK", countrycodes="gb",
+                       lat=51.502, lng=-0.090, zoom=12),
+}
+# First path segments the app's own routes use; never valid city slugs.
+RESERVED = {"add", "admin", "api", "assets", "cafe", "cafes", "img", "metrics", "search", "static"}
+SLUG = re.compile(r"[a-z][a-z0-9-]{0,63}")
+# Columns a registry entry carries (the generation is read fresh by the catalog).
+FIELDS = ("slug", "name", "geocode_suffix", "countrycodes", "lat", "lng", "zoom")
+
+
+class CityConverter(BaseConverter):
+    """``<city:city>`` URL segments: lowercase slugs only."""
+    regex = SLUG.pattern
+
+
+class Registry:
+    """This process's view of the city table, reloaded when a slug is missing.
+
+    Reloads are rate-limited to one per ``CATALOG_SYNC_INTERVAL``, so requests
+    for made-up slugs can't turn into a query each.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.cities: dict[str, SimpleNamespace] | None = None
+        self.loaded_at = float("-inf")
+
+    def _load(self) -> None:
+        cities = {slug: SimpleNamespace(slug=slug, **fields) for slug, fields in BUILTIN.items()}
+        try:
+            rows = db.session.execute(select(*(getattr(City, f) for f in FIELDS))).all()
+        except SQLAlchemyError:
+            db.session.rollback()   # before the schema bootstrap: built-in cities only
+            rows = []
+        cities.update((row.slug, SimpleNamespace(**row._mapping)) for row in rows)
+        self.cities = cities
+        self.loaded_at = time.monotonic()
+
+    def get(self, slug: str) -> SimpleNamespace | None:
+        if self.cities is None or (
+            slug not in self.cities
+            and time.monotonic() - self.loaded_at >= self.app.config.get("CATALOG_SYNC_INTERVAL", 1.0)
+        ):
+            self._load()
+        return self.cities.get(slug)
+
+    def all(self) -> list[SimpleNamespace]:
+        if self.cities is None:
+            self._load()
+        return sorted(self.cities.values(), key=lambda city: city.name)
+
+
+def current() -> SimpleNamespace:
+    """This request's city (from its URL), else ``DEFAULT_CITY``."""
+    city = g.get("city") if has_request_context() else None
+    if city is not None:
+        return city
+    return current_app.extensions["workbrew.cities"].get(current_app.config["DEFAULT_CITY"])
+
+
+def current_slug() -> str:
+    return current().slug
+
+
+def home_url(slug: str) -> str:
+    """The listing page of city *slug* (the bare ``/`` for ``DEFAULT_CITY``)."""
+    if slug == current_app.config["DEFAULT_CITY"]:
+        return url_for("index")
+    return url_for("index", city=slug)
+
+
+def ensure_builtin(conn) -> None:
+    """Insert any missing ``BUILTIN`` city row, on connection *conn*."""
+    existing = set(conn.execute(select(City.slug)).scalars())
+    rows = [{"slug": slug, **fields} for slug, fields in BUILTIN.items() if slug not in existing]
+    if rows:
+        conn.execute(City.__table__.insert(), rows)
+
+
+def init_app(app) -> Registry:
+    """Register the ``city`` URL converter, the slug handling and template globals.
+
+    Call after ``bootstrap.init_app``, so a first-request schema check runs
+    before the city lookup.
+    """
+    app.config.setdefault("DEFAULT_CITY", DEFAULT_CITY)
+    registry = app.extensions["workbrew.cities"] = Registry(app)
+    app.url_map.converters["city"] = CityConverter
+
+    @app.url_value_preprocessor
+    def _pull_city(endpoint, values):
+        # Always (re)set: tests can share one app context, and so ``g``, across requests.
+        g.city_slug = values.pop("city", None) if values else None
+
+    @app.before_request
+    def _resolve_city():
+        slug = g.get("city_slug")
+        g.city = None if slug is None else registry.get(slug)
+        if slug is not None and g.city is None:
+            abort(404)
+
+    @app.url_defaults
+    def _add_city(endpoint, values):
+        slug = g.get("city_slug") if has_request_context() else None
+        if slug and "city" not in values and app.url_map.is_endpoint_expecting(endpoint, "city"):
+            values["city"] = slug
+
+    @app.context_processor
+    def _city_globals():
+        return {"city": current(), "cities": registry.all()}
+
+    return registry
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    add = sub.add_parser("add", help="add a city")
+    add.add_argument("slug")
+    add.add_argument("name")
+    add.add_argument("--suffix", required=True, help='appended to geocoder queries, e.g. "Manchester, UK"')
+    add.add_argument("--countrycodes", required=True, help="geocoder country filter, e.g. gb")
+    add.add_argument("--centre", required=True, help="map centre as lat,lng")
+    add.add_argument("--zoom", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    import bootstrap
+    from app import app
+
+    bootstrap.ensure_schema(app)
+    with app.app_context():
+        if args.command == "add":
+            if not SLUG.fullmatch(args.slug) or args.slug in RESERVED:
+                parser.error(f"{args.slug!r} can't be a city slug (lowercase a-z0-9-, not {sorted(RESERVED)})")
+            if db.session.get(City, args.slug) is not None:
+                parser.error(f"city {args.slug!r} already exists")
+            lat, lng = (float(v) for v in args.centre.split(","))
+            db.session.add(City(slug=args.slug, name=args.name, geocode_suffix=args.suffix,
+                                countrycodes=args.countrycodes, lat=lat, lng=lng, zoom=args.zoom))
+            db.session.commit()
+            print(f"✅ Added {args.name}: /{args.slug}/")
+        counts = dict(db.session.execute(select(Cafe.city, func.count()).group_by(Cafe.city)).all())
+        for city in db.session.execute(select(City).order_by(City.name)).scalars():
+            print(f"  /{city.slug + '/':<16} {city.name:<20} {counts.get(city.slug, 0):>7,} cafes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
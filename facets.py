@@ -0,0 +1,75 @@
+"""Facet counts: cafes per location and per amenity in each city, kept in their own tables.
+
+``adjust`` runs inside the transaction of each cafe insert or delete. It
+upserts a +1 / -1 onto the cafe's (city, location) row and onto every
+amenity the cafe has in its city, and it drops locations whose count falls
+to zero. The tables therefore always agree with the cafe table, and reading
+a city's counts is one small query whatever the catalog size. ``rebuild``
+recounts everything from scratch. It runs after bulk loads and as the
+backfill when the tables are first created (or recreated per city).
+"""
+from sqlalchemy import delete, func, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import DEFAULT_CITY, AmenityCount, Cafe, Location
+
+# Boolean cafe columns that get a count (and a filter chip or card badge).
+AMENITIES = ("has_wifi", "has_sockets", "can_take_calls", "has_toilet")
+
+
+def _increment(conn, model, key: str, values: list[dict]) -> None:
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(model.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["city", key],
+        set_={"cafe_count": model.__table__.c.cafe_count + stmt.excluded.cafe_count},
+    )
+    conn.execute(stmt, values)
+
+
+def adjust(cafe: Cafe, delta: int) -> None:
+    """Add *delta* (+1 on insert, -1 on delete) to *cafe*'s facet counts.
+
+    Call before committing the write, in the same session transaction.
+    """
+    conn = db.session.connection()
+    city = cafe.city or DEFAULT_CITY   # the column default only applies at flush
+    _increment(conn, Location, "name", [{"city": city, "name": cafe.location, "cafe_count": delta}])
+    amenities = [{"city": city, "amenity": name, "cafe_count": delta} for name in AMENITIES if getattr(cafe, name)]
+    if amenities:
+        _increment(conn, AmenityCount, "amenity", amenities)
+    if delta < 0:
+        conn.execute(delete(Location).where(Location.city == city, Location.name == cafe.location,
+                                            Location.cafe_count <= 0))
+
+
+def rebuild(conn) -> None:
+    """Recount every facet from the cafe table on connection *conn*."""
+    conn.execute(delete(Location))
+    conn.execute(delete(AmenityCount))
+    conn.execute(Location.__table__.insert().from_select(
+        ["city", "name", "cafe_count"],
+        select(Cafe.city, Cafe.location, func.count()).group_by(Cafe.city, Cafe.location),
+    ))
+    conn.execute(AmenityCount.__table__.insert().from_select(
+        ["city", "amenity", "cafe_count"],
+        union_all(*[
+            select(Cafe.city, literal(name), func.count()).where(getattr(Cafe, name).is_(True)).group_by(Cafe.city)
+            for name in AMENITIES
+        ]),
+    ))
+
+
+def read(city: str = DEFAULT_CITY) -> dict:
+    """*city*'s ``{"locations": [(name, count), ...] sorted by name, "amenities": {name: count}}``."""
+    rows = db.session.execute(union_all(
+        select(literal("location").label("kind"), Location.name, Location.cafe_count)
+        .where(Location.city == city),
+        select(literal("amenity").label("kind"), AmenityCount.amenity, AmenityCount.cafe_count)
+        .where(AmenityCount.city == city),
+    )).all()
+    locations = sorted((name, count) for kind, name, count in rows if kind == "location" and count > 0)
+    amenities = {name: 0 for name in AMENITIES}
+    amenities.update((name, count) for kind, name, count in rows if kind == "amenity")
+    return {"locations": locations, "amenities": amenities}
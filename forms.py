@@ -6,7 +6,7 @@ from wtforms.validators import DataRequired, Length, Optional, URL
 
 class CafeForm(FlaskForm):
     name           = StringField("Cafe Name",            validators=[DataRequired(), Length(max=250)])
-    location       = StringField("London Neighbourhood", validators=[DataRequired(), Length(max=250)])
+    location       = StringField("Neighbourhood",        validators=[DataRequired(), Length(max=250)])
     map_url        = URLField(  "Google Maps URL",       validators=[DataRequired(), URL()])
     img_url        = URLField(  "Photo URL",             validators=[DataRequired(), URL()])
     seats          = StringField("Seats",                validators=[Optional(), Length(max=250)])
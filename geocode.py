@@ -1,66 +1,316 @@
 """
-One-time script: populate lat/lng for all Cafe records using Nominatim (OpenStreetMap).
+Batch geocoder: populate lat/lng for Cafe records via Nominatim-compatible APIs.
 
 Usage:
-    python geocode.py
+    python geocode.py [--chunk-size 50] [--restart]
 
-Rate limit: Nominatim requires max 1 request/second.
-21 cafes ≈ ~30 seconds total. Run once before first deployment.
+Lookups go through one pooled HTTP session, are paced per provider by a token
+bucket (Nominatim's public instance allows 1 request/second) and fan out
+across every provider listed in GEOCODE_PROVIDERS. Every answer — including
+"not found" — is kept in an on-disk cache, so repeat queries never touch the
+network. Results are committed per chunk and the last processed cafe id is
+checkpointed, so an interrupted run resumes where it stopped. Each cafe is
+looked up within its city: queries end in ``City.geocode_suffix`` and are
+limited to ``City.countrycodes``.
 """
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from app import app
-from extensions import db
-from models import Cafe
+from requests.adapters import HTTPAdapter
+from sqlalchemy import update
+from urllib3.util.retry import Retry
 
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 HEADERS = {"User-Agent": "WorkBrew/1.0 (portfolio project, no commercial use)"}
 
+# Query scope when a cafe's city gives none (the default city's; see cities.BUILTIN).
+DEFAULT_SUFFIX       = "London, UK"
+DEFAULT_COUNTRYCODES = "gb"
 
-def geocode(name: str, location: str) -> tuple[float, float] | None:
-    """Return (lat, lng) for a cafe name + neighbourhood, or None on failure."""
-    for query in [f"{name}, {location}, London, UK", f"{location}, London, UK"]:
+CACHE_PATH      = os.getenv("GEOCODE_CACHE_PATH") or os.path.join("instance", "geocode_cache.db")
+CHECKPOINT_PATH = os.getenv("GEOCODE_CHECKPOINT_PATH") or os.path.join("instance", "geocode_checkpoint.json")
+
+log = logging.getLogger(__name__)
+
+
+class GeocodeUnavailable(Exception):
+    """Every provider failed for a query (network/HTTP error, not a miss)."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens/second, at most ``burst`` banked."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token would be available (0 if one is ready)."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def acquire(self) -> None:
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+class Provider:
+    def __init__(self, url: str, rate: float):
+        self.url = url
+        self.bucket = TokenBucket(rate)
+
+
+def providers_from_env() -> list[Provider]:
+    """Parse GEOCODE_PROVIDERS: comma-separated ``url@requests_per_second``."""
+    spec = os.getenv("GEOCODE_PROVIDERS", "").strip()
+    if not spec:
+        return [Provider(NOMINATIM_URL, 1.0)]
+    providers = []
+    for entry in spec.split(","):
+        url, _, rate = entry.strip().rpartition("@")
         try:
-            resp = requests.get(
-                NOMINATIM_URL,
-                params={"q": query, "format": "json", "limit": 1, "countrycodes": "gb"},
-                headers=HEADERS,
-                timeout=10,
+            providers.append(Provider(url, float(rate)))
+        except ValueError:
+            providers.append(Provider(entry.strip(), 1.0))
+    return providers
+
+
+class GeocodeCache:
+    """On-disk query → (lat, lng) map; a stored NULL pair records a known miss."""
+
+    _MISSING = object()
+
+    def __init__(self, path: str = CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode "
+            "(query TEXT PRIMARY KEY, lat REAL, lng REAL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, query: str):
+        """Return (lat, lng), None for a cached miss, or ``GeocodeCache._MISSING``."""
+        with self._lock:
+            row = self._conn.execute("SELECT lat, lng FROM geocode WHERE query = ?", (query,)).fetchone()
+        if row is None:
+            return self._MISSING
+        return None if row[0] is None else (row[0], row[1])
+
+    def put(self, query: str, result: tuple[float, float] | None) -> None:
+        lat, lng = result if result else (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (query, lat, lng, fetched_at) VALUES (?, ?, ?, ?)",
+                (query, lat, lng, time.time()),
             )
-            resp.raise_for_status()
-            results = resp.json()
-            if results:
-                return float(results[0]["lat"]), float(results[0]["lon"])
-        except requests.RequestException as exc:
-            print(f"  ⚠ Request error for '{query}': {exc}")
-        time.sleep(1)  # Nominatim rate limit
-    return None
-
-
-def run() -> None:
-    with app.app_context():
-        cafes_missing = Cafe.query.filter(Cafe.lat.is_(None)).all()
-        print(f"Found {len(cafes_missing)} cafe(s) missing coordinates.\n")
-
-        for cafe in cafes_missing:
-            print(f"Geocoding: {cafe.name} ({cafe.location}) …", end=" ", flush=True)
-            result = geocode(cafe.name, cafe.location)
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Geocoder:
+    """Cached, rate-limited lookups spread across one or more providers."""
+
+    def __init__(self, providers: list[Provider] | None = None, cache: GeocodeCache | None = None):
+        self.providers = providers or providers_from_env()
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections=len(self.providers),
+            pool_maxsize=max(4, len(self.providers) * 2),
+            # Only failed connects are retried here: a request that reached the
+            # provider (429, 5xx, read timeout) must go back through its token
+            # bucket, so it surfaces as GeocodeUnavailable for the job backoff.
+            max_retries=Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.5),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.network_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _ordered_providers(self) -> list[Provider]:
+        # Try whichever provider can serve soonest first; the rest are fallbacks.
+        return sorted(self.providers, key=lambda p: p.bucket.wait_time())
+
+    def lookup(self, query: str, countrycodes: str = DEFAULT_COUNTRYCODES) -> tuple[float, float] | None:
+        cached = self.cache.get(query)
+        if cached is not GeocodeCache._MISSING:
+            return cached
+        for provider in self._ordered_providers():
+            provider.bucket.acquire()
+            with self._calls_lock:
+                self.network_calls += 1
+            try:
+                resp = self.session.get(
+                    provider.url,
+                    params={"q": query, "format": "json", "limit": 1, "countrycodes": countrycodes},
+                    timeout=10,
+                )
+                resp.raise_for_status()
+                results = resp.json()
+            except (requests.RequestException, ValueError) as exc:
+                log.warning("geocode request for %r via %s failed: %s", query, provider.url, exc)
+                continue
+            result = (float(results[0]["lat"]), float(results[0]["lon"])) if results else None
+            self.cache.put(query, result)
+            return result
+        # Not cached: a transient outage must not be remembered as a miss.
+        raise GeocodeUnavailable(query)
+
+    def geocode(self, name: str, location: str, suffix: str = DEFAULT_SUFFIX,
+                countrycodes: str = DEFAULT_COUNTRYCODES) -> tuple[float, float] | None:
+        """Return (lat, lng) for a cafe name + neighbourhood, or None if not found.
+
+        *suffix* and *countrycodes* come from the cafe's city (``City``).
+        Raises ``GeocodeUnavailable`` when no provider could be reached.
+        """
+        for query in [f"{name}, {location}, {suffix}", f"{location}, {suffix}"]:
+            result = self.lookup(query, countrycodes)
             if result:
-                cafe.lat, cafe.lng = result
-                print(f"✅ {cafe.lat:.4f}, {cafe.lng:.4f}")
-            else:
-                print("❌ not found — skipped")
-            time.sleep(1)
+                return result
+        return None
+
+    def close(self) -> None:
+        self.session.close()
+        self.cache.close()
+
+
+def geocode(name: str, location: str, suffix: str = DEFAULT_SUFFIX,
+            countrycodes: str = DEFAULT_COUNTRYCODES) -> tuple[float, float] | None:
+    """One-off lookup with the default providers and cache."""
+    geocoder = Geocoder()
+    try:
+        return geocoder.geocode(name, location, suffix, countrycodes)
+    except GeocodeUnavailable:
+        return None
+    finally:
+        geocoder.close()
+
+
+def _read_checkpoint(path: str) -> int:
+    try:
+        with open(path) as fh:
+            return int(json.load(fh)["last_id"])
+    except (OSError, ValueError, KeyError):
+        return 0
 
-        db.session.commit()
-        print("\n✅ Geocoding complete. Coordinates saved.")
+
+def _write_checkpoint(path: str, last_id: int) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump({"last_id": last_id}, fh)
+    os.replace(tmp, path)
+
+
+def run(flask_app=None, geocoder: Geocoder | None = None, chunk_size: int = 50,
+        checkpoint_path: str = CHECKPOINT_PATH, restart: bool = False) -> None:
+    if flask_app is None:
+        from app import app as flask_app
+    import catalog
+    from extensions import db
+    from models import Cafe, City
+
+    owns_geocoder = geocoder is None
+    geocoder = geocoder or Geocoder()
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    last_id = _read_checkpoint(checkpoint_path)
+    workers = max(1, len(geocoder.providers))
+
+    with flask_app.app_context(), ThreadPoolExecutor(max_workers=workers) as pool:
+        missing = Cafe.query.filter(Cafe.lat.is_(None), Cafe.id > last_id)
+        print(f"Found {missing.count()} cafe(s) missing coordinates"
+              + (f" after checkpoint id {last_id}" if last_id else "") + ".\n")
+
+        query = missing.order_by(Cafe.id).with_entities(Cafe.id, Cafe.city, Cafe.name, Cafe.location)
+        scopes = {city.slug: (city.geocode_suffix, city.countrycodes) for city in City.query}
+        found = 0
+        started = time.monotonic()
+        cursor = last_id
+        stalled_at = None   # first id whose lookup failed; the checkpoint stops before it
+
+        def lookup(row):
+            try:
+                return geocoder.geocode(row.name, row.location,
+                                        *scopes.get(row.city, (DEFAULT_SUFFIX, DEFAULT_COUNTRYCODES)))
+            except GeocodeUnavailable as exc:
+                return exc
+
+        while True:
+            chunk = query.filter(Cafe.id > cursor).limit(chunk_size).all()
+            if not chunk:
+                break
+            # HTTP happens on the pool; the DB is only touched from this thread.
+            chunk_found = 0
+            for row, result in zip(chunk, pool.map(lookup, chunk)):
+                if isinstance(result, GeocodeUnavailable):
+                    stalled_at = stalled_at or row.id
+                    print(f"  ⚠ {row.name}: no provider reachable — will retry next run")
+                elif result:
+                    db.session.execute(
+                        update(Cafe).where(Cafe.id == row.id).values(lat=result[0], lng=result[1])
+                    )
+                    chunk_found += 1
+                    print(f"  ✅ {row.name}: {result[0]:.4f}, {result[1]:.4f}")
+                else:
+                    print(f"  ❌ {row.name}: not found — skipped")
+            if chunk_found:
+                catalog.bump_generation()   # running workers pick up the new pins
+            db.session.commit()
+            found += chunk_found
+            cursor = chunk[-1].id
+            if stalled_at is None:
+                _write_checkpoint(checkpoint_path, cursor)
+            rate = found / max(time.monotonic() - started, 1e-9)
+            print(f"— committed through id {cursor} ({found} found, {rate:.1f}/s)")
+
+        if stalled_at is not None:
+            _write_checkpoint(checkpoint_path, stalled_at - 1)
+            print(f"\n⚠ Some lookups failed; a rerun resumes from id {stalled_at}.")
+        elif os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)   # finished cleanly; next run starts fresh
+        print(f"\n✅ Geocoding complete. {geocoder.network_calls} network lookup(s).")
 
         # Summary
         total   = Cafe.query.count()
         mapped  = Cafe.query.filter(Cafe.lat.isnot(None)).count()
         print(f"   {mapped}/{total} cafes now have coordinates.")
 
+    if owns_geocoder:
+        geocoder.close()
+
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=50, help="cafes per commit (default 50)")
+    parser.add_argument("--restart", action="store_true", help="ignore any saved checkpoint")
+    args = parser.parse_args()
+    run(chunk_size=args.chunk_size, restart=args.restart)
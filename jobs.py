@@ -0,0 +1,318 @@
+"""In-process background jobs backed by the durable ``pending_job`` table.
+
+Writers call ``enqueue`` inside their transaction and ``notify`` after commit.
+Each worker process runs a small thread pool woken through a bounded in-memory
+queue; the table itself is polled every ``JOB_POLL_INTERVAL`` seconds, so jobs
+survive restarts, overflow of the in-memory queue and retries with backoff.
+Rows are claimed with a lease so several gunicorn workers can share the table
+without running a job twice. A job that exhausts ``JOB_MAX_ATTEMPTS`` is kept
+as ``dead`` (for ``/metrics`` and its ``last_error``) until the next enqueue
+for that cafe, which revives it as a fresh pending job.
+"""
+import queue
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, update
+
+from extensions import db
+from models import Cafe, PendingJob
+
+JOB_GEOCODE = "geocode"
+JOB_THUMBNAIL = "thumbnail"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _revived(now: datetime) -> dict:
+    """Column values that turn a dead job back into a fresh pending one."""
+    return {"status": "pending", "attempts": 0, "run_after": now, "locked_until": None, "last_error": None}
+
+
+def enqueue(kind: str, cafe_id: int) -> None:
+    """Record a job in the current transaction; no-op if one is already pending.
+
+    A dead job for the cafe is revived instead, so a later change (a new
+    photo, a retried add) gets another go.
+    """
+    job = db.session.execute(
+        select(PendingJob.id, PendingJob.status).where(PendingJob.kind == kind, PendingJob.cafe_id == cafe_id)
+    ).first()
+    now = _now()
+    if job is None:
+        db.session.add(PendingJob(kind=kind, cafe_id=cafe_id, status="pending",
+                                  attempts=0, run_after=now, created_at=now))
+    elif job.status == "dead":
+        db.session.execute(update(PendingJob).where(PendingJob.id == job.id).values(**_revived(now)))
+
+
+def enqueue_where(kind: str, *where, conn=None) -> int:
+    """Record a job for every cafe matching *where*, as one INSERT … SELECT.
+
+    Set-based ``enqueue`` for bulk writes: cafes with a pending job of this
+    kind are skipped and dead ones revived (one UPDATE). Runs in the request's
+    session, or on *conn* (an ``engine.begin()`` block) to stay out of it.
+    Returns the number of jobs added or revived.
+    """
+    execute = (conn or db.session).execute
+    now = _now()
+    revived = execute(
+        update(PendingJob)
+        .where(PendingJob.kind == kind, PendingJob.status == "dead",
+               PendingJob.cafe_id.in_(select(Cafe.id).where(*where)))
+        .values(**_revived(now))
+    )
+    source = select(
+        literal(kind), Cafe.id, literal("pending"), literal(0), literal(now), literal(now),
+    ).where(*where, Cafe.id.not_in(select(PendingJob.cafe_id).where(PendingJob.kind == kind)))
+    result = execute(insert(PendingJob).from_select(
+        ["kind", "cafe_id", "status", "attempts", "run_after", "created_at"], source,
+    ))
+    return revived.rowcount + result.rowcount
+
+
+def cancel(cafe_id: int) -> None:
+    """Drop every job for a cafe (e.g. when it is deleted), in the current transaction."""
+    db.session.execute(delete(PendingJob).where(PendingJob.cafe_id == cafe_id))
+
+
+def notify() -> None:
+    """Wake this process's workers after a commit that enqueued jobs."""
+    runner = current_app.extensions["workbrew.jobs"]
+    runner.start()
+    runner.wake()
+
+
+class JobRunner:
+    def __init__(self, app):
+        self.app = app
+        self.handlers = {JOB_GEOCODE: geocode_cafe, JOB_THUMBNAIL: thumbnail_cafe}
+        self._queue: queue.Queue = queue.Queue(maxsize=app.config["JOB_QUEUE_SIZE"])
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._geocoder = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._latencies: deque = deque(maxlen=1000)
+
+    # ── Lifecycle ────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the worker threads once per process (no-op with JOB_WORKERS=0)."""
+        workers = self.app.config["JOB_WORKERS"]
+        if self._threads or not workers:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for n in range(workers):
+                thread = threading.Thread(target=self._loop, name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self) -> None:
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass   # workers are busy; the row is picked up on the next poll
+
+    def _loop(self) -> None:
+        interval = self.app.config["JOB_POLL_INTERVAL"]
+        while True:
+            try:
+                self._queue.get(timeout=interval)
+            except queue.Empty:
+                pass
+            try:
+                with self.app.app_context():
+                    self.run_pending()
+            except Exception as exc:   # keep the worker alive across DB hiccups
+                self.app.logger.exception("job worker error: %s", exc)
+
+    # ── Execution ────────────────────────────────────────────────────────────
+
+    def run_pending(self, limit: int = 20) -> int:
+        """Claim and run due jobs until none are left (or *limit* ran)."""
+        ran = 0
+        while ran < limit:
+            job = self._claim()
+            if job is None:
+                break
+            self._run(job)
+            ran += 1
+        return ran
+
+    def _claim(self) -> PendingJob | None:
+        now = _now()
+        lease = now + timedelta(seconds=self.app.config["JOB_LEASE_SECONDS"])
+        due = (
+            select(PendingJob.id)
+            .where(PendingJob.status == "pending", PendingJob.run_after <= now,
+                   or_(PendingJob.locked_until.is_(None), PendingJob.locked_until < now))
+            .order_by(PendingJob.run_after)
+            .limit(5)
+        )
+        for job_id in db.session.execute(due).scalars().all():
+            claimed = db.session.execute(
+                update(PendingJob)
+                .where(PendingJob.id == job_id,
+                       or_(PendingJob.locked_until.is_(None), PendingJob.locked_until < now))
+                .values(locked_until=lease)
+            )
+            db.session.commit()
+            if claimed.rowcount == 1:
+                return db.session.get(PendingJob, job_id)
+        db.session.rollback()
+        return None
+
+    def _run(self, job: PendingJob) -> None:
+        handler = self.handlers[job.kind]
+        created_at = job.created_at
+        try:
+            handler(self, job.cafe_id)
+        except Exception as exc:
+            db.session.rollback()
+            self._fail(job.id, exc)
+            return
+        db.session.execute(delete(PendingJob).where(PendingJob.id == job.id))
+        db.session.commit()
+        with self._stats_lock:
+            self.completed += 1
+            self._latencies.append((_now() - created_at).total_seconds())
+
+    def _fail(self, job_id: int, exc: Exception) -> None:
+        job = db.session.get(PendingJob, job_id)
+        if job is None:
+            return
+        job.attempts += 1
+        job.last_error = f"{type(exc).__name__}: {exc}"[:2000]
+        job.locked_until = None
+        if job.attempts >= self.app.config["JOB_MAX_ATTEMPTS"]:
+            job.status = "dead"
+            with self._stats_lock:
+                self.failed += 1
+        else:
+            backoff = min(self.app.config["JOB_BACKOFF_BASE"] * 2 ** (job.attempts - 1), 3600)
+            job.run_after = _now() + timedelta(seconds=backoff)
+            with self._stats_lock:
+                self.retried += 1
+        db.session.commit()
+
+    @property
+    def geocoder(self):
+        if self._geocoder is None:
+            from geocode import Geocoder
+            self._geocoder = Geocoder()
+        return self._geocoder
+
+    @geocoder.setter
+    def geocoder(self, value) -> None:
+        self._geocoder = value
+
+    # ── Metrics ──────────────────────────────────────────────────────────────
+
+    def metrics(self) -> dict:
+        """Queue depth and completion latency (seconds, enqueue → done)."""
+        now = _now()
+        pending = db.session.execute(
+            select(func.count()).select_from(PendingJob).where(PendingJob.status == "pending")
+        ).scalar_one()
+        due = db.session.execute(
+            select(func.count()).select_from(PendingJob)
+            .where(and_(PendingJob.status == "pending", PendingJob.run_after <= now))
+        ).scalar_one()
+        dead = db.session.execute(
+            select(func.count()).select_from(PendingJob).where(PendingJob.status == "dead")
+        ).scalar_one()
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {"completed": self.completed, "retried": self.retried, "failed": self.failed}
+
+        def pct(p: float):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        return {
+            "pending": pending,
+            "due": due,
+            "dead": dead,
+            "workers": len(self._threads),
+            **stats,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+def init_app(app) -> JobRunner:
+    app.config.setdefault("JOB_WORKERS", 2)
+    app.config.setdefault("JOB_QUEUE_SIZE", 100)
+    app.config.setdefault("JOB_POLL_INTERVAL", 5.0)
+    app.config.setdefault("JOB_LEASE_SECONDS", 120)
+    app.config.setdefault("JOB_MAX_ATTEMPTS", 6)
+    app.config.setdefault("JOB_BACKOFF_BASE", 30)
+    runner = app.extensions["workbrew.jobs"] = JobRunner(app)
+
+    @app.before_request
+    def _start_job_workers():
+        # Started lazily so threads begin in the serving process (after any
+        # gunicorn fork) and pick up rows left over from before a restart.
+        runner.start()
+
+    return runner
+
+
+# ── Handlers ─────────────────────────────────────────────────────────────────
+
+
+def geocode_cafe(runner: JobRunner, cafe_id: int) -> None:
+    """Look up coordinates for a cafe and publish them to the catalog."""
+    import catalog
+
+    cafe = db.session.get(Cafe, cafe_id)
+    if cafe is None or cafe.lat is not None:
+        return   # deleted, or geocoded by someone else meanwhile
+    name, location = cafe.name, cafe.location
+    city = runner.app.extensions["workbrew.cities"].get(cafe.city)
+    scope = (city.geocode_suffix, city.countrycodes) if city else ()
+    db.session.rollback()   # don't hold a pooled connection across the rate limit and lookup
+    result = runner.geocoder.geocode(name, location, *scope)   # GeocodeUnavailable → retry
+    if result is None:
+        runner.app.logger.info("geocode: no match for cafe %s (%s)", cafe_id, name)
+        return
+    cafe = db.session.get(Cafe, cafe_id)
+    if cafe is None or cafe.lat is not None:
+        return   # deleted, or geocoded by someone else meanwhile
+    cafe.lat, cafe.lng = result
+    generation = catalog.bump_generation(cafe.city)
+    db.session.commit()
+    catalog.cafe_updated(cafe, generation)
+
+
+def thumbnail_cafe(runner: JobRunner, cafe_id: int) -> None:
+    """Render a cafe's photo thumbnails and point its card at them."""
+    import catalog
+    from thumbnails import ThumbnailError
+
+    cafe = db.session.get(Cafe, cafe_id)
+    if cafe is None:
+        return
+    img_url = cafe.img_url
+    db.session.rollback()   # don't hold a pooled connection across the download
+    try:
+        key = runner.app.extensions["workbrew.thumbnails"].process(img_url)   # network error → retry
+    except ThumbnailError as exc:
+        runner.app.logger.info("thumbnail: cafe %s: %s", cafe_id, exc)
+        return
+    cafe = db.session.get(Cafe, cafe_id)
+    if cafe is None or cafe.img_url != img_url or cafe.thumb_key == key:
+        return   # deleted or re-pointed meanwhile, or already current
+    cafe.thumb_key = key
+    generation = catalog.bump_generation(cafe.city)
+    db.session.commit()
+    catalog.cafe_updated(cafe, generation)
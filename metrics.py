@@ -0,0 +1,379 @@
+"""Per-request instrumentation: Server-Timing headers and Prometheus metrics.
+
+SQLAlchemy cursor events and Flask's template signals add into a per-request
+``RequestStats`` (held in a context variable, so job threads and other
+requests never mix in). When the response goes out, the request's totals are
+written to a ``Server-Timing`` header and folded into this process's
+``Registry``.
+
+Every worker keeps its own registry. With ``METRICS_DIR`` set, each worker
+also writes a JSON snapshot to ``<METRICS_DIR>/<pid>.json`` (at most every
+``METRICS_FLUSH_INTERVAL`` seconds). ``/metrics`` sums every snapshot in the
+directory, so whichever gunicorn worker answers the scrape reports the whole
+instance. Counters are absolute per worker, so summing them is always safe.
+A snapshot left by a worker that has since exited (recycled, crashed) keeps
+contributing its counters and histograms, but not its gauges: those describe
+a process that no longer exists.
+"""
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import current_app, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+
+from extensions import db
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+HELP = {
+    "workbrew_requests_total":                ("counter",   "HTTP requests by route, method and status."),
+    "workbrew_request_duration_seconds":      ("histogram", "Request latency by route."),
+    "workbrew_request_db_seconds_total":      ("counter",   "Time spent executing SQL, by route."),
+    "workbrew_request_sql_statements_total":  ("counter",   "SQL statements executed, by route."),
+    "workbrew_request_render_seconds_total":  ("counter",   "Time spent rendering templates, by route."),
+    "workbrew_pool_checkout_wait_seconds":    ("histogram", "Time a request waited to obtain a pooled DB connection."),
+    "workbrew_cache_hits_total":              ("counter",   "In-process cache hits, by cache."),
+    "workbrew_cache_misses_total":            ("counter",   "In-process cache misses, by cache."),
+    "workbrew_startup_seconds":               ("gauge",     "Cold-start phase durations, by worker."),
+    "workbrew_pool_connections":              ("gauge",     "Pool occupancy (checked_out, checked_in, overflow, size), by worker."),
+    "workbrew_pool_events_total":             ("counter",   "Pool events: new connections, checkouts, invalidations, timeouts."),
+    "workbrew_db_reads_total":                ("counter",   "Requests by database read from; target=fallback counts replica-eligible ones sent to the primary."),
+    "workbrew_replica_healthy":               ("gauge",     "1 while the read replica is reachable and within REPLICA_MAX_LAG, by worker."),
+    "workbrew_stream_clients":                ("gauge",     "Open /api/stream connections, by worker."),
+    "workbrew_stream_events_total":           ("counter",   "Catalog events fanned out to streams; outcome=dropped counts slow subscribers reset instead."),
+}
+
+
+class RequestStats:
+    __slots__ = ("db_seconds", "statements", "render_seconds", "pool_wait", "started",
+                 "_query_started", "_render_started")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.render_seconds = 0.0
+        self.pool_wait = None
+        self.started = time.perf_counter()
+        self._query_started = None
+        self._render_started = None
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("workbrew_request_stats", default=None)
+
+
+def request_stats() -> RequestStats | None:
+    """Stats for the request being handled in this context, if any."""
+    return _current.get()
+
+
+def _key(name: str, **labels) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"{name}{{{body}}}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    """This process's counters and histograms, keyed by Prometheus series name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.histograms: dict[str, dict] = {}
+
+    def inc(self, key: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def observe(self, key: str, value: float, buckets=LATENCY_BUCKETS) -> None:
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"le": list(buckets), "counts": [0] * (len(buckets) + 1),
+                                               "sum": 0.0, "count": 0}
+            for i, bound in enumerate(hist["le"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+                    break
+            else:
+                hist["counts"][-1] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def observe_request(self, route: str, method: str, status: int, stats: RequestStats, total: float) -> None:
+        self.inc(_key("workbrew_requests_total", route=route, method=method, status=status))
+        self.observe(_key("workbrew_request_duration_seconds", route=route), total)
+        self.inc(_key("workbrew_request_db_seconds_total", route=route), stats.db_seconds)
+        self.inc(_key("workbrew_request_sql_statements_total", route=route), stats.statements)
+        self.inc(_key("workbrew_request_render_seconds_total", route=route), stats.render_seconds)
+        if stats.pool_wait is not None:
+            self.observe("workbrew_pool_checkout_wait_seconds", stats.pool_wait, POOL_WAIT_BUCKETS)
+
+    def snapshot(self, app=None) -> dict:
+        """JSON-ready copy, plus *app*'s cache and startup figures read at call time."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: {**h, "le": list(h["le"]), "counts": list(h["counts"])}
+                          for k, h in self.histograms.items()}
+        gauges = {}
+        if app is None:
+            return {"counters": counters, "histograms": histograms, "gauges": gauges}
+        for cache, (hits, misses) in _cache_counts(app).items():
+            counters[_key("workbrew_cache_hits_total", cache=cache)] = hits
+            counters[_key("workbrew_cache_misses_total", cache=cache)] = misses
+        pid = os.getpid()
+        startup = app.extensions.get("workbrew.startup")
+        if startup is not None:
+            for phase, ms in startup.as_dict()["ms"].items():
+                gauges[_key("workbrew_startup_seconds", phase=phase, worker=pid)] = ms / 1000
+        pool = app.extensions.get("workbrew.pool")
+        if pool is not None:
+            health = pool.snapshot()
+            for state in ("checked_out", "checked_in", "overflow", "size"):
+                if state in health:
+                    gauges[_key("workbrew_pool_connections", state=state, worker=pid)] = health[state]
+            for kind in ("connects", "checkouts", "invalidations", "timeouts"):
+                if kind in health:
+                    counters[_key("workbrew_pool_events_total", event=kind)] = health[kind]
+        replica = app.extensions.get("workbrew.replica")
+        if replica is not None and replica.configured:
+            counters[_key("workbrew_db_reads_total", target="replica")] = replica.replica_reads
+            counters[_key("workbrew_db_reads_total", target="primary")] = replica.primary_reads
+            counters[_key("workbrew_db_reads_total", target="fallback")] = replica.fallbacks
+            gauges[_key("workbrew_replica_healthy", worker=pid)] = int(replica.healthy)
+        broker = app.extensions.get("workbrew.stream_broker")
+        if broker is not None:
+            gauges[_key("workbrew_stream_clients", worker=pid)] = broker.clients
+            counters[_key("workbrew_stream_events_total", outcome="published")] = broker.published
+            counters[_key("workbrew_stream_events_total", outcome="dropped")] = broker.dropped
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _cache_counts(app) -> dict[str, tuple[int, int]]:
+    counts = {}
+    page_cache = app.extensions.get("workbrew.page_cache")
+    if page_cache is not None:
+        counts["page"] = (page_cache.hits, page_cache.misses)
+    card_cache = app.extensions.get("workbrew.card_cache")
+    if card_cache is not None:
+        counts["card"] = (card_cache.hits, card_cache.misses)
+    partitions = app.extensions.get("workbrew.catalog")
+    if partitions:
+        counts["tile"] = (sum(indexes.tiles.hits for indexes in partitions.values()),
+                          sum(indexes.tiles.misses for indexes in partitions.values()))
+    return counts
+
+
+def merge(snapshots) -> dict:
+    """Sum counters and histograms across worker snapshots; gauges are per worker."""
+    merged = {"counters": {}, "histograms": {}, "gauges": {}}
+    for snap in snapshots:
+        for key, value in snap.get("counters", {}).items():
+            merged["counters"][key] = merged["counters"].get(key, 0.0) + value
+        for key, value in snap.get("gauges", {}).items():
+            merged["gauges"][key] = value
+        for key, hist in snap.get("histograms", {}).items():
+            into = merged["histograms"].get(key)
+            if into is None or into["le"] != hist["le"]:
+                merged["histograms"][key] = {**hist, "counts": list(hist["counts"])}
+                continue
+            into["counts"] = [a + b for a, b in zip(into["counts"], hist["counts"])]
+            into["sum"] += hist["sum"]
+            into["count"] += hist["count"]
+    return merged
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """Prometheus text exposition format (0.0.4) for a (merged) snapshot."""
+    series: dict[str, list[str]] = {}
+
+    def family(key: str) -> str:
+        return key.split("{", 1)[0]
+
+    def with_label(key: str, suffix: str, extra: str = "") -> str:
+        name, _, labels = key.partition("{")
+        labels = labels.rstrip("}")
+        joined = ",".join(part for part in (labels, extra) if part)
+        return f"{name}{suffix}{{{joined}}}" if joined else f"{name}{suffix}"
+
+    for key, value in sorted(snapshot["counters"].items()):
+        series.setdefault(family(key), []).append(f"{key} {_number(value)}")
+    for key, value in sorted(snapshot["gauges"].items()):
+        series.setdefault(family(key), []).append(f"{key} {_number(value)}")
+    for key, hist in sorted(snapshot["histograms"].items()):
+        lines = series.setdefault(family(key), [])
+        cumulative = 0
+        for bound, count in zip(hist["le"] + ["+Inf"], hist["counts"]):
+            cumulative += count
+            le = 'le="%s"' % bound
+            lines.append(f"{with_label(key, '_bucket', le)} {cumulative}")
+        lines.append(f"{with_label(key, '_sum')} {_number(hist['sum'])}")
+        lines.append(f"{with_label(key, '_count')} {hist['count']}")
+
+    out = []
+    for name, lines in sorted(series.items()):
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metrics:
+    """Per-app instrumentation state: the registry plus snapshot file handling."""
+
+    def __init__(self, app):
+        self.app = app
+        self.registry = Registry()
+        self.directory = app.config.get("METRICS_DIR")
+        self.flush_interval = app.config.get("METRICS_FLUSH_INTERVAL", 1.0)
+        self._flushed_at = float("-inf")
+        self._flush_lock = threading.Lock()
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def flush(self, force: bool = False) -> None:
+        """Write this worker's snapshot file (throttled unless *force*)."""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_interval:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return   # another thread of this worker is already writing
+        try:
+            self._flushed_at = now
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{self._path()}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(self.registry.snapshot(self.app), fh)
+            os.replace(tmp, self._path())
+        finally:
+            self._flush_lock.release()
+
+    def collect(self) -> dict:
+        """Merged snapshot of every worker (or just this one without METRICS_DIR)."""
+        if not self.directory:
+            return self.registry.snapshot(self.app)
+        self.flush(force=True)
+        snapshots = []
+        for name in os.listdir(self.directory):
+            stem, ext = os.path.splitext(name)
+            if ext != ".json" or not stem.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue   # a worker is mid-rename; it shows up on the next scrape
+            if not _alive(int(stem)):
+                snapshot["gauges"] = {}
+            snapshots.append(snapshot)
+        return merge(snapshots)
+
+
+def _alive(pid: int) -> bool:
+    """Whether process *pid* still exists (signal 0 checks without signalling)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True    # exists, owned by someone else
+    return True
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    parts = [
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} queries"',
+        f"render;dur={stats.render_seconds * 1000:.1f}",
+    ]
+    if stats.pool_wait is not None:
+        parts.append(f"pool;dur={stats.pool_wait * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app) -> Metrics:
+    app.config.setdefault("METRICS_DIR", None)
+    app.config.setdefault("METRICS_FLUSH_INTERVAL", 1.0)
+    metrics = app.extensions["workbrew.metrics"] = Metrics(app)
+
+    with app.app_context():
+        engines = [db.engine]
+    replica = app.extensions.get("workbrew.replica")
+    if replica is not None and replica.engine is not None:
+        engines.append(replica.engine)
+
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is not None:
+            stats._query_started = time.perf_counter()
+
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is not None and stats._query_started is not None:
+            stats.db_seconds += time.perf_counter() - stats._query_started
+            stats.statements += 1
+            stats._query_started = None
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+
+    def _render_started(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats._render_started = time.perf_counter()
+
+    def _render_finished(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats._render_started is not None:
+            stats.render_seconds += time.perf_counter() - stats._render_started
+            stats._render_started = None
+
+    before_render_template.connect(_render_started, app, weak=False)
+    template_rendered.connect(_render_finished, app, weak=False)
+
+    @app.before_request
+    def _start_request_stats():
+        _current.set(RequestStats())
+
+    @app.after_request
+    def _finish_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.started
+        response.headers["Server-Timing"] = server_timing(stats, total)
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        metrics.registry.observe_request(route, request.method, response.status_code, stats, total)
+        metrics.flush()
+        return response
+
+    @app.teardown_request
+    def _clear_request_stats(exc):
+        _current.set(None)
+
+    return metrics
+
+
+def authorized() -> bool:
+    """``/metrics`` access: open unless METRICS_TOKEN is set, then bearer-only."""
+    token = current_app.config.get("METRICS_TOKEN")
+    return not token or request.headers.get("Authorization") == f"Bearer {token}"
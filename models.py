@@ -1,12 +1,73 @@
-"""SQLAlchemy ORM model for the Cafe entity."""
+"""SQLAlchemy ORM models: the Cafe entity plus catalog bookkeeping."""
+import re
+
+from sqlalchemy.orm import validates
+
 from extensions import db
 
+# The city every cafe from before multi-city support belongs to.
+DEFAULT_CITY = "london"
+
+_PRICE = re.compile(r"(\d+)(?:[.,](\d{1,2}))?")
+_NUMBER = re.compile(r"\d+")
+# Largest value the INTEGER columns hold (Postgres' is 32-bit); parsed numbers
+# beyond it are treated as unparseable.
+INT_MAX = 2**31 - 1
+
+
+def _bounded(value: int) -> int | None:
+    return value if value <= INT_MAX else None
+
+
+def _number(digits: str) -> int | None:
+    """``int(digits)``, or None past ``INT_MAX``; a huge digit run never reaches ``int``."""
+    return _bounded(int(digits)) if len(digits) <= len(str(INT_MAX)) else None
+
+
+def parse_price(text: str | None) -> int | None:
+    """Pence from a free-text price: ``"£2.40"`` → 240, ``"£3"`` → 300, ``"95p"`` → 95."""
+    match = _PRICE.search(text or "")
+    if match is None:
+        return None
+    whole, fraction = match.groups()
+    pounds = _number(whole)
+    if pounds is None:
+        return None
+    if fraction is None and text.strip().lower().endswith("p"):
+        return pounds
+    return _bounded(pounds * 100 + int((fraction or "0").ljust(2, "0")))
+
+
+def parse_seats(text: str | None) -> tuple[int | None, int | None]:
+    """``(min, max)`` seats from free text: ``"20-30"`` → (20, 30), ``"50+"`` → (50, None), ``"10"`` → (10, 10)."""
+    numbers = [_number(n) for n in _NUMBER.findall(text or "")[:2]]
+    if not numbers or None in numbers:
+        return None, None
+    if len(numbers) == 2:
+        return min(numbers), max(numbers)
+    return numbers[0], None if "+" in text else numbers[0]
+
 
 class Cafe(db.Model):
     __tablename__ = "cafe"
+    # City-leading indexes: the catalog loads one city at a time in listing
+    # order, and every filtered query (exports, Postgres search) starts with
+    # ``city = ?``, so a city's reads never touch another city's rows.
+    __table_args__ = (
+        # Names are unique within a city; two cities may each have a "Full House".
+        db.UniqueConstraint("city", "name", name="uq_cafe_city_name"),
+        db.Index("ix_cafe_city_name", "city", "name", "id"),
+        db.Index("ix_cafe_city_location", "city", "location"),
+        # The listing's range filters and sorts (``max_price``, ``min_seats``,
+        # ``sort=price`` cheapest first, ``sort=seats`` most first) are keyset
+        # scans of these two.
+        db.Index("ix_cafe_city_price", "city", "price_pence", "name", "id"),
+        db.Index("ix_cafe_city_seats", "city", db.text("seats_min DESC"), "name", "id"),
+    )
 
     id             = db.Column(db.Integer,      primary_key=True)
-    name           = db.Column(db.String(250),  unique=True, nullable=False)
+    city           = db.Column(db.String(64),   nullable=False, default=DEFAULT_CITY, server_default=DEFAULT_CITY)
+    name           = db.Column(db.String(250),  nullable=False)
     map_url        = db.Column(db.String(500),  nullable=False)
     img_url        = db.Column(db.String(500),  nullable=False)
     location       = db.Column(db.String(250),  nullable=False)
@@ -18,16 +79,126 @@ class Cafe(db.Model):
     coffee_price   = db.Column(db.String(250),  nullable=True)
     lat            = db.Column(db.Float,        nullable=True)
     lng            = db.Column(db.Float,        nullable=True)
+    # Numeric forms of ``coffee_price`` / ``seats``, kept in step by the
+    # validators below (and by bulk_load for Core writes); NULL when unparseable.
+    price_pence    = db.Column(db.Integer,      nullable=True)
+    seats_min      = db.Column(db.Integer,      nullable=True)
+    seats_max      = db.Column(db.Integer,      nullable=True)
+    # Content key of the rendered thumbnails (see thumbnails.py); NULL until
+    # the background job has fetched img_url.
+    thumb_key      = db.Column(db.String(32),   nullable=True)
+
+    @validates("coffee_price")
+    def _parse_price(self, key, value):
+        self.price_pence = parse_price(value)
+        return value
+
+    @validates("seats")
+    def _parse_seats(self, key, value):
+        self.seats_min, self.seats_max = parse_seats(value)
+        return value
 
     def to_dict(self) -> dict:
         """Return a JSON-serialisable dict for Leaflet map consumption."""
-        return {
-            "id":            self.id,
-            "name":          self.name,
-            "location":      self.location,
-            "lat":           self.lat,
-            "lng":           self.lng,
-            "has_wifi":      self.has_wifi,
-            "has_sockets":   self.has_sockets,
-            "can_take_calls": self.can_take_calls,
-        }
+        return {field: getattr(self, field) for field in MAP_FIELDS}
+
+
+# Field sets for the two read payloads — the map pins and the listing cards.
+MAP_FIELDS  = ("id", "name", "location", "lat", "lng", "has_wifi", "has_sockets", "can_take_calls", "thumb_key")
+CARD_FIELDS = MAP_FIELDS + ("img_url", "has_toilet", "seats", "coffee_price")
+
+
+class CatalogState(db.Model):
+    """Single-row table whose ``generation`` is bumped by every catalog write.
+
+    Workers compare it with the generation their in-process indexes were built
+    at, and response caches key on it, so a write in one gunicorn worker is
+    picked up by the others.
+    """
+    __tablename__ = "catalog_state"
+
+    id         = db.Column(db.Integer,  primary_key=True)
+    generation = db.Column(db.Integer,  nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+
+class City(db.Model):
+    """A city the catalog covers; every cafe belongs to one (``Cafe.city``).
+
+    ``slug`` is the first path segment of the city's pages (``/manchester/``).
+    ``geocode_suffix`` and ``countrycodes`` scope geocoder queries, and the
+    centre/zoom place the map before any cafe has coordinates. ``generation``
+    is this city's share of ``CatalogState``: bumped by writes to its cafes
+    only, so they never invalidate another city's indexes or cached pages.
+    """
+    __tablename__ = "city"
+
+    slug           = db.Column(db.String(64),  primary_key=True)
+    name           = db.Column(db.String(120), nullable=False)
+    geocode_suffix = db.Column(db.String(250), nullable=False)
+    countrycodes   = db.Column(db.String(32),  nullable=False)
+    lat            = db.Column(db.Float,       nullable=False)
+    lng            = db.Column(db.Float,       nullable=False)
+    zoom           = db.Column(db.Integer,     nullable=False, default=12)
+    generation     = db.Column(db.Integer,     nullable=False, default=0)
+    updated_at     = db.Column(db.DateTime,    nullable=True)
+
+
+class Location(db.Model):
+    """One row per distinct (city, cafe location), with how many cafes it has.
+
+    Together with ``AmenityCount`` this is the facet-count table: both are
+    adjusted in the same transaction as every cafe insert/delete (see
+    ``facets.py``), so the location dropdown and the filter chip counts never
+    need a scan of the cafe table. Both are derived data: the bootstrap drops
+    and rebuilds them when their shape changes.
+    """
+    __tablename__ = "location"
+    __table_args__ = (db.UniqueConstraint("city", "name", name="uq_location_city_name"),)
+
+    id         = db.Column(db.Integer,     primary_key=True)
+    city       = db.Column(db.String(64),  nullable=False)
+    name       = db.Column(db.String(250), nullable=False)
+    cafe_count = db.Column(db.Integer,     nullable=False, default=0)
+
+
+class AmenityCount(db.Model):
+    """Number of cafes in each city with each boolean amenity (``has_wifi`` etc.) set."""
+    __tablename__ = "amenity_count"
+
+    city       = db.Column(db.String(64), primary_key=True)
+    amenity    = db.Column(db.String(50), primary_key=True)
+    cafe_count = db.Column(db.Integer,    nullable=False, default=0)
+
+
+class SchemaState(db.Model):
+    """Single-row record of the schema fingerprint the last bootstrap applied.
+
+    Lets ``bootstrap.ensure_schema`` skip all DDL when nothing changed since
+    the previous deploy.
+    """
+    __tablename__ = "schema_state"
+
+    id          = db.Column(db.Integer,    primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    applied_at  = db.Column(db.DateTime,   nullable=False)
+
+
+class PendingJob(db.Model):
+    """Durable background job row; at most one per (kind, cafe).
+
+    Rows are written in the same transaction as the change that needs them,
+    so a job can't be lost to a crash or restart between commit and enqueue.
+    """
+    __tablename__ = "pending_job"
+    __table_args__ = (db.UniqueConstraint("kind", "cafe_id", name="uq_pending_job_kind_cafe"),)
+
+    id           = db.Column(db.Integer,     primary_key=True)
+    kind         = db.Column(db.String(50),  nullable=False)
+    cafe_id      = db.Column(db.Integer,     nullable=False, index=True)
+    status       = db.Column(db.String(16),  nullable=False, default="pending")
+    attempts     = db.Column(db.Integer,     nullable=False, default=0)
+    run_after    = db.Column(db.DateTime,    nullable=False)
+    locked_until = db.Column(db.DateTime,    nullable=True)
+    created_at   = db.Column(db.DateTime,    nullable=False)
+    last_error   = db.Column(db.Text,        nullable=True)
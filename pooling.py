@@ -0,0 +1,165 @@
+"""Database connection pooling: environment-driven engine options and pool health.
+
+Two modes, chosen with ``DB_POOL_MODE``:
+
+* ``session`` (default) — direct Postgres connections. ``search_path`` and
+  ``statement_timeout`` are set once per connection through libpq ``options``.
+* ``transaction`` — for pgbouncer in transaction pooling mode, where a server
+  connection may change between transactions and startup ``options`` are
+  rejected. Nothing is kept in session state: both settings are re-applied
+  with ``SET LOCAL`` at the start of every transaction. (psycopg2 never uses
+  server-side prepared statements, so there is none of that to disable.)
+
+``pool_recycle`` is jittered per process so connections opened together on a
+deploy are not all recycled in the same second, and the pool is LIFO so
+surplus connections go idle and age out instead of being kept warm.
+
+Under gevent workers (``WORKER_CLASS=gevent``) psycopg2 is made cooperative
+with ``psycogreen``, so a slow query yields to the worker's other greenlets
+(open live-update streams included) instead of stalling them.
+"""
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+import metrics
+from extensions import db
+
+MODES = ("session", "transaction")
+# pool_recycle is stretched by up to this fraction, at random, per process.
+RECYCLE_JITTER = 0.1
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that charges checkout time to the current request and counts timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeouts = 0
+
+    def _do_get(self):
+        stats = metrics.request_stats()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            if stats is not None:
+                stats.pool_wait = (stats.pool_wait or 0.0) + time.perf_counter() - started
+
+
+def cooperative_driver(worker_class: str) -> None:
+    """Let psycopg2 wait on the gevent hub when running under gevent workers."""
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def engine_options(config, db_url: str) -> dict:
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for the DB_POOL_* / DB_* settings in *config*."""
+    mode = config["DB_POOL_MODE"]
+    if mode not in MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {MODES}, not {mode!r}")
+    if db_url == "sqlite://" or ":memory:" in db_url:
+        return {}   # a single shared in-memory connection; nothing to pool
+
+    recycle = config["DB_POOL_RECYCLE"]
+    options = {
+        "poolclass":     TimedQueuePool,
+        "pool_size":     config["DB_POOL_SIZE"],
+        "max_overflow":  config["DB_MAX_OVERFLOW"],
+        "pool_timeout":  config["DB_POOL_TIMEOUT"],
+        "pool_recycle":  int(recycle * (1 + random.uniform(0, RECYCLE_JITTER))) if recycle > 0 else -1,
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_use_lifo": True,
+    }
+    if db_url.startswith("postgresql") and mode == "session":
+        startup = []
+        if config.get("DB_SCHEMA"):
+            startup.append(f"-csearch_path={config['DB_SCHEMA']},public")
+        if config["DB_STATEMENT_TIMEOUT_MS"]:
+            startup.append(f"-cstatement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}")
+        if startup:
+            options["connect_args"] = {"options": " ".join(startup)}
+    return options
+
+
+def transaction_settings(config) -> list[str]:
+    """The ``SET LOCAL`` statements transaction mode runs at each BEGIN."""
+    statements = []
+    if config.get("DB_SCHEMA"):
+        statements.append(f"SET LOCAL search_path TO {config['DB_SCHEMA']}, public")
+    if config["DB_STATEMENT_TIMEOUT_MS"]:
+        statements.append(f"SET LOCAL statement_timeout = {int(config['DB_STATEMENT_TIMEOUT_MS'])}")
+    return statements
+
+
+class PoolStats:
+    """Counters fed by pool events, plus the pool's live occupancy."""
+
+    def __init__(self, engine, mode: str):
+        self.engine = engine
+        self.mode = mode
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool
+        occupancy = {}
+        if isinstance(pool, QueuePool):
+            occupancy = {
+                "size":        pool.size(),
+                "checked_in":  pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow":    max(pool.overflow(), 0),
+                "timeouts":    getattr(pool, "timeouts", 0),
+            }
+        with self._lock:
+            counters = {"connects": self.connects, "checkouts": self.checkouts,
+                        "invalidations": self.invalidations}
+        return {"mode": self.mode, "pool": type(pool).__name__, **occupancy, **counters}
+
+
+def instrument(engine, config) -> PoolStats:
+    """Attach pool event counters and, in transaction mode, the per-transaction SETs."""
+    stats = PoolStats(engine, config["DB_POOL_MODE"])
+
+    # Registered on the engine so they survive engine.dispose() recreating the pool.
+    event.listen(engine, "connect", lambda dbapi_conn, record: stats._bump("connects"))
+    event.listen(engine, "checkout", lambda dbapi_conn, record, proxy: stats._bump("checkouts"))
+    event.listen(engine, "invalidate", lambda dbapi_conn, record, exc: stats._bump("invalidations"))
+
+    statements = transaction_settings(config)
+    if config["DB_POOL_MODE"] == "transaction" and statements and engine.dialect.name == "postgresql":
+        @event.listens_for(engine, "begin")
+        def _set_local(conn):
+            # Straight on the DBAPI cursor: psycopg2 opens the transaction on
+            # this first statement, so the SETs land inside it.
+            cursor = conn.connection.driver_connection.cursor()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+            finally:
+                cursor.close()
+
+    return stats
+
+
+def init_app(app) -> PoolStats:
+    """Instrument the primary engine (the read replica's, if any, is done by ``replicas``)."""
+    with app.app_context():
+        engine = db.engine
+    app.extensions["workbrew.pool"] = stats = instrument(engine, app.config)
+    return stats
@@ -0,0 +1,63 @@
+"""Read model for listing pages: column-projected cafe rows without ORM hydration.
+
+The catalog is filled from a Core ``SELECT`` of just the card columns. This
+skips ``map_url``, the session identity map and per-instance ORM state. Each
+result row becomes one ``CafeRow`` (a ``__slots__`` object), and its map pin
+payload is built from it in the same pass.
+"""
+from sqlalchemy import select
+
+from models import CARD_FIELDS, MAP_FIELDS, Cafe
+
+CARD_COLUMNS = tuple(Cafe.__table__.c[field] for field in CARD_FIELDS)
+
+
+class CafeRow:
+    """One listing card. Reads like a dict (``row["name"]``, ``{**row}``) as well
+    as by attribute, so templates and JSON responses take it unchanged."""
+
+    __slots__ = CARD_FIELDS + ("_version",)
+
+    def __init__(self, values):
+        for field, value in zip(CARD_FIELDS, values):
+            setattr(self, field, value)
+        self._version = None
+
+    @classmethod
+    def from_cafe(cls, cafe: Cafe) -> "CafeRow":
+        """Project an ORM instance (the write path) down to a row."""
+        return cls([getattr(cafe, field) for field in CARD_FIELDS])
+
+    @property
+    def version(self) -> int:
+        """Hash of the card's field values: changes whenever the row does."""
+        if self._version is None:
+            self._version = hash(tuple(getattr(self, field) for field in CARD_FIELDS))
+        return self._version
+
+    def __getitem__(self, field: str):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def keys(self) -> tuple:
+        return CARD_FIELDS
+
+    def __repr__(self) -> str:
+        return f"CafeRow(id={self.id!r}, name={self.name!r})"
+
+    def map_payload(self) -> dict:
+        """The fields the Leaflet map consumes, as a JSON-ready dict."""
+        return {field: getattr(self, field) for field in MAP_FIELDS}
+
+
+def card_select(*where):
+    """``SELECT`` of the card columns only, in ``CARD_FIELDS`` order."""
+    return select(*CARD_COLUMNS).where(*where)
+
+
+def iter_rows(result):
+    """Yield a ``CafeRow`` per row of a ``card_select`` result."""
+    for values in result:
+        yield CafeRow(values)
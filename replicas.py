@@ -0,0 +1,194 @@
+"""Read-replica routing: listing and API reads on ``DATABASE_URL_READ``, the rest on the primary.
+
+When a replica is configured it gets its own engine and pool (same
+``DB_POOL_*`` settings as the primary), and ``RoutingSession`` sends a
+request's reads there if all of these hold:
+
+* the request is a GET/HEAD from a non-admin session;
+* the client has no read-your-writes marker (``session["primary_until"]``,
+  set for ``READ_YOUR_WRITES_TTL`` seconds after any request that wrote);
+* the last health check reached the replica and found it at most
+  ``REPLICA_MAX_LAG`` seconds behind.
+
+Writes — and every statement after the first write in a request — always go
+to the primary, as do background jobs and CLI scripts (no request context).
+
+Lag is measured on the catalog generation every writer bumps: when the
+replica's ``catalog_state`` is behind the primary's, it has been missing a
+write for at least ``now - primary.updated_at`` seconds. Checks run at most
+every ``REPLICA_CHECK_INTERVAL`` seconds per process. A replica connection
+error marks it down at once, until the next successful check.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine as sa_create_engine, event, make_url, select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible reads to the replica engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True             # the rest of the request reads its own writes
+            elif g.get("db_read_replica") and not g.get("db_wrote"):
+                return current_app.extensions["workbrew.replica"].engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Health/lag state of the replica plus routing counters, per process."""
+
+    def __init__(self, app, engine=None):
+        self.app = app
+        self.engine = engine
+        self.healthy = False
+        self.lag = None                   # seconds, None until the first check
+        self.checked_at = float("-inf")
+        self.last_error = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0                # eligible reads sent to the primary
+        self.pool = None                  # pooling.PoolStats of the replica engine
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self.engine is not None
+
+    def mark_down(self, error) -> None:
+        self.healthy = False
+        self.last_error = f"{type(error).__name__}: {error}"[:500]
+
+    def check(self) -> None:
+        """Measure replica reachability and lag against the primary."""
+        from extensions import db
+        from models import CatalogState
+
+        state = select(CatalogState.generation, CatalogState.updated_at).where(CatalogState.id == 1)
+        try:
+            with self.engine.connect() as conn:
+                replica = conn.execute(state).first()
+            with db.engine.connect() as conn:
+                primary = conn.execute(state).first()
+        except SQLAlchemyError as exc:
+            self.mark_down(exc)
+            return
+        replica_generation = replica.generation if replica else 0
+        if primary is None or replica_generation >= primary.generation:
+            lag = 0.0
+        else:
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            lag = max((now - primary.updated_at).total_seconds(), 0.0) if primary.updated_at else float("inf")
+        self.lag = lag
+        self.healthy = lag <= self.app.config["REPLICA_MAX_LAG"]
+        self.last_error = None if self.healthy else f"lagging {lag:.1f}s"
+
+    def _maybe_check(self) -> None:
+        if time.monotonic() - self.checked_at < self.app.config["REPLICA_CHECK_INTERVAL"]:
+            return
+        if not self._lock.acquire(blocking=False):
+            return                        # another thread is checking; use the last result
+        try:
+            self.check()
+            self.checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def route(self) -> bool:
+        """Decide (and record in ``g``) whether this request reads from the replica."""
+        eligible = request.method in READ_METHODS and not session.get("is_admin") and not sticky()
+        use_replica = False
+        if eligible and self.configured:
+            self._maybe_check()
+            use_replica = self.healthy
+            if not use_replica:
+                self.fallbacks += 1
+        if use_replica:
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+        g.db_read_replica = use_replica
+        # The client just wrote: make the catalog check the primary's generation
+        # now rather than within CATALOG_SYNC_INTERVAL (see catalog._indexes),
+        # even when the request lands on a worker that didn't do the write.
+        request.environ["workbrew.read_your_writes"] = not use_replica and sticky()
+        return use_replica
+
+    def snapshot(self) -> dict:
+        return {
+            "configured": self.configured,
+            "healthy": self.healthy,
+            "lag_seconds": None if self.lag is None else round(self.lag, 3),
+            "last_error": self.last_error,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "pool": self.pool.snapshot() if self.pool is not None else None,
+        }
+
+
+def sticky() -> bool:
+    """True while this client's read-your-writes window is open."""
+    return session.get("primary_until", 0) > time.time()
+
+
+def read_engine():
+    """The engine this request should stream bulk reads from (exports)."""
+    from extensions import db
+
+    if has_request_context() and g.get("db_read_replica"):
+        return current_app.extensions["workbrew.replica"].engine
+    return db.engine
+
+
+def create_engine(app, url: str):
+    """An engine for *url* with the primary's pool options."""
+    import pooling
+
+    url = make_url(url)
+    if url.drivername.startswith("sqlite") and url.database not in (None, "", ":memory:") \
+            and not os.path.isabs(url.database):
+        # Relative SQLite paths live in the instance folder, as Flask-SQLAlchemy does for the primary.
+        url = url.set(database=os.path.join(app.instance_path, url.database))
+    return sa_create_engine(url, **pooling.engine_options(app.config, url.render_as_string(hide_password=False)))
+
+
+def init_app(app) -> ReplicaRouter:
+    app.config.setdefault("DATABASE_URL_READ", None)
+    app.config.setdefault("REPLICA_CHECK_INTERVAL", 5.0)
+    app.config.setdefault("REPLICA_MAX_LAG", 5.0)
+    app.config.setdefault("READ_YOUR_WRITES_TTL", 10.0)
+    engine = create_engine(app, app.config["DATABASE_URL_READ"]) if app.config["DATABASE_URL_READ"] else None
+    router = app.extensions["workbrew.replica"] = ReplicaRouter(app, engine)
+
+    if engine is not None:
+        import pooling
+
+        router.pool = pooling.instrument(engine, app.config)
+
+        @event.listens_for(engine, "handle_error")
+        def _replica_error(context):
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                router.mark_down(context.original_exception)
+
+    @app.before_request
+    def _route_reads():
+        router.route()
+
+    @app.after_request
+    def _open_read_your_writes_window(response):
+        if g.get("db_wrote"):
+            session["primary_until"] = time.time() + app.config["READ_YOUR_WRITES_TTL"]
+        return response
+
+    return router
@@ -0,0 +1,207 @@
+"""Typo-tolerant type-ahead search over cafe names and neighbourhoods.
+
+Two backends answer ``/search``:
+
+* ``TrigramIndex`` — an in-process inverted index, kept in the catalog next to
+  the bitmap and spatial indexes (the default on SQLite).
+* ``pg_trgm`` + ``tsvector`` — GIN expression indexes over the same text,
+  queried with ``word_similarity`` and prefix ``tsquery`` (the default on
+  Postgres; see ``POSTGRES_DDL``).
+
+The in-process index scores every query word against the words of
+``"<name> <location>"``: an exact word scores 1.0, a word prefix 0.9, otherwise
+the trigram similarity (pg_trgm's padded-trigram Jaccard). A cafe matches when
+every query word reaches ``SIMILARITY_THRESHOLD`` on some word; its score is
+the mean. Postgres ranks by ``word_similarity`` of the whole query, lifted to
+0.9 when every word is a prefix match — close to, not identical with, the
+in-process ranking.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from sqlalchemy import case, func, literal, literal_column, or_, select, text
+
+import readmodel
+from models import Cafe
+
+# pg_trgm's default ``similarity_threshold``.
+SIMILARITY_THRESHOLD = 0.3
+PREFIX_SCORE = 0.9
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+# Expression indexes backing the Postgres backend; the expressions must match
+# ``_document()`` exactly for the planner to use them.
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_cafe_search_trgm ON cafe "
+    "USING gin ((name || ' ' || location) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_cafe_search_tsv ON cafe "
+    "USING gin (to_tsvector('simple', name || ' ' || location))",
+)
+
+
+def words(value: str) -> list[str]:
+    """Lower-cased, accent-stripped alphanumeric words of *value*."""
+    folded = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode().lower()
+    return [w for w in _NON_WORD.split(folded) if w]
+
+
+def trigrams(word: str) -> frozenset[str]:
+    """pg_trgm-style trigrams: the word padded with two spaces before, one after."""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """Inverted index: trigram → vocabulary words → document ids.
+
+    Fuzzy matching works on the (small) vocabulary rather than on documents:
+    a query word's trigrams pick candidate words, exact similarities are
+    computed only for words sharing enough trigrams to possibly reach the
+    threshold, and prefix matches come from a bisect over the sorted words.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._docs: dict = {}                       # id → (sort key, words, payload)
+        self._vocab: dict[str, set] = {}            # word → ids containing it
+        self._grams: dict[str, set[str]] = {}       # trigram → words containing it
+        self._sorted: list[str] = []                # vocabulary, for prefix lookups
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def insert(self, doc_id, sort_key, value: str, payload) -> None:
+        with self._lock:
+            self.remove(doc_id)
+            doc_words = tuple(dict.fromkeys(words(value)))
+            self._docs[doc_id] = (sort_key, doc_words, payload)
+            for word in doc_words:
+                ids = self._vocab.get(word)
+                if ids is None:
+                    ids = self._vocab[word] = set()
+                    bisect.insort(self._sorted, word)
+                    for gram in trigrams(word):
+                        self._grams.setdefault(gram, set()).add(word)
+                ids.add(doc_id)
+
+    def remove(self, doc_id) -> None:
+        with self._lock:
+            entry = self._docs.pop(doc_id, None)
+            if entry is None:
+                return
+            for word in entry[1]:
+                ids = self._vocab[word]
+                ids.discard(doc_id)
+                if ids:
+                    continue
+                del self._vocab[word]
+                del self._sorted[bisect.bisect_left(self._sorted, word)]
+                for gram in trigrams(word):
+                    holders = self._grams[gram]
+                    holders.discard(word)
+                    if not holders:
+                        del self._grams[gram]
+
+    def _word_scores(self, query_word: str) -> dict[str, float]:
+        """Vocabulary words matching *query_word*, with their scores."""
+        scores = {}
+        vocabulary = self._sorted
+        # Walk the prefix range in place: slicing would copy the vocabulary's tail.
+        for i in range(bisect.bisect_left(vocabulary, query_word), len(vocabulary)):
+            word = vocabulary[i]
+            if not word.startswith(query_word):
+                break
+            scores[word] = 1.0 if word == query_word else PREFIX_SCORE
+
+        grams = trigrams(query_word)
+        shared = Counter(word for gram in grams for word in self._grams.get(gram, ()))
+        # Jaccard ≥ t needs at least t·|grams| shared trigrams; skip the rest.
+        floor = self.threshold * len(grams)
+        for word, common in shared.items():
+            if common < floor or word in scores:
+                continue
+            similarity = common / (len(grams) + len(trigrams(word)) - common)
+            if similarity >= self.threshold:
+                scores[word] = similarity
+        return scores
+
+    def search(self, query: str, limit: int = 10, accept=None) -> list[tuple[float, object]]:
+        """Best *limit* ``(score, payload)`` pairs for *query*, best first.
+
+        *accept*, if given, is called with each candidate payload and drops
+        those it returns false for (used to apply the amenity filters).
+        """
+        query_words = list(dict.fromkeys(words(query)))
+        if not query_words:
+            return []
+        with self._lock:
+            totals: dict | None = None
+            for query_word in query_words:
+                best: dict = {}
+                for word, score in self._word_scores(query_word).items():
+                    for doc_id in self._vocab[word]:
+                        if score > best.get(doc_id, 0.0):
+                            best[doc_id] = score
+                if totals is None:
+                    totals = best
+                else:
+                    totals = {d: totals[d] + s for d, s in best.items() if d in totals}
+                if not totals:
+                    return []
+            ranked = sorted(
+                ((total / len(query_words), self._docs[d]) for d, total in totals.items()),
+                key=lambda hit: (-hit[0], hit[1][0]),
+            )
+            results = []
+            for score, (_, _, payload) in ranked:
+                if accept is None or accept(payload):
+                    results.append((round(score, 3), payload))
+                    if len(results) == limit:
+                        break
+            return results
+
+
+def _document():
+    # An inline ' ' (not a bound VARCHAR parameter) keeps the expression
+    # identical to the indexed one.
+    return Cafe.name + literal_column("' '") + Cafe.location
+
+
+def postgres_statement(query: str, clauses: list, limit: int):
+    """``SELECT`` ranking cafes for *query* with pg_trgm and a prefix tsquery.
+
+    Returns ``None`` when *query* has no searchable words. *clauses* are extra
+    WHERE conditions (the amenity filters).
+    """
+    query_words = words(query)
+    if not query_words:
+        return None
+    document = _document()
+    normalized = " ".join(query_words)
+    prefix = func.to_tsquery("simple", " & ".join(f"{w}:*" for w in query_words))
+    matches_prefix = func.to_tsvector("simple", document).op("@@")(prefix)
+    similarity = func.word_similarity(normalized, document)
+    score = func.greatest(similarity, case((matches_prefix, PREFIX_SCORE), else_=0.0))
+    return (
+        select(*readmodel.CARD_COLUMNS, score.label("score"))
+        .where(or_(literal(normalized).op("<%")(document.self_group()), matches_prefix), *clauses)
+        .order_by(score.desc(), Cafe.name, Cafe.id)
+        .limit(limit)
+    )
+
+
+def set_postgres_threshold(session) -> None:
+    """Align ``<%`` with ``SIMILARITY_THRESHOLD`` for the current transaction."""
+    session.execute(text(f"SET LOCAL pg_trgm.word_similarity_threshold = {SIMILARITY_THRESHOLD}"))
+
+
+def install_postgres(conn) -> None:
+    """Create the pg_trgm extension and search indexes (idempotent)."""
+    for statement in POSTGRES_DDL:
+        conn.execute(text(statement))
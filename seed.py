@@ -9,9 +9,15 @@ Usage (Render one-off job):
 
 Coordinates were geocoded via Nominatim on 2026-02-27 and are baked in here
 so no external API calls are needed at seed time.
+
+Only an empty catalog is seeded (through ``bulk_load.load``), so running this
+on every deploy never resurrects deleted cafes or reverts admin edits. To
+re-apply or update rows on purpose, use ``python bulk_load.py <file>``, which
+upserts on the cafe name.
 """
+import bootstrap
+import bulk_load
 from app import app
-from extensions import db
 from models import Cafe
 
 CAFES = [
@@ -146,14 +152,13 @@ CAFES = [
 
 def run() -> None:
     with app.app_context():
-        db.create_all()
+        bootstrap.ensure_schema(app)   # once per deploy; a no-op when up to date
         existing = Cafe.query.count()
         if existing:
-            print(f"DB already has {existing} cafe(s) — skipping seed to avoid duplicates.")
+            print(f"DB already has {existing} cafe(s) — skipping seed.")
             return
-        db.session.add_all([Cafe(**c) for c in CAFES])
-        db.session.commit()
-        print(f"Seeded {len(CAFES)} cafes successfully.")
+        result = bulk_load.load(CAFES, report=lambda line: None)
+        print(f"Seeded {result['rows']} cafes successfully ({Cafe.query.count()} in the DB).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+"""Grid-bucket spatial index for radius and k-nearest cafe lookups."""
+import heapq
+import math
+import threading
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT  = 111.32
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in kilometres between two (lat, lng) points."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """Points bucketed into fixed lat/lng cells.
+
+    A query only visits the cells that can contain an answer, so cost scales
+    with local density rather than catalog size. Each point carries an opaque
+    payload (the cafe's map dict) so hits can be served without a DB trip.
+    """
+
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = defaultdict(dict)
+        self._points: dict[int, tuple[float, float]] = {}
+        self._payloads: dict[int, object] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def insert(self, key: int, lat: float, lng: float, payload=None) -> None:
+        with self._lock:
+            self.remove(key)
+            self._cells[self._cell(lat, lng)][key] = (lat, lng)
+            self._points[key] = (lat, lng)
+            self._payloads[key] = payload
+
+    def remove(self, key: int) -> None:
+        with self._lock:
+            point = self._points.pop(key, None)
+            if point is None:
+                return
+            self._payloads.pop(key, None)
+            cell_key = self._cell(*point)
+            cell = self._cells[cell_key]
+            cell.pop(key, None)
+            if not cell:
+                del self._cells[cell_key]
+
+    def point(self, key: int) -> tuple[float, float] | None:
+        return self._points.get(key)
+
+    def within(self, south: float, west: float, north: float, east: float) -> list:
+        """Payloads of every point inside the box (edges inclusive)."""
+        r0, c0 = self._cell(south, west)
+        r1, c1 = self._cell(north, east)
+        hits = []
+        with self._lock:
+            if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self._cells):
+                # Box spans more cells than are occupied: scan those instead.
+                cells = self._cells.values()
+            else:
+                cells = (self._cells.get((r, c)) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+            for cell in cells:
+                if not cell:
+                    continue
+                for key, (plat, plng) in cell.items():
+                    if south <= plat <= north and west <= plng <= east:
+                        hits.append(self._payloads[key])
+        return hits
+
+    def bounds(self) -> tuple[float, float, float, float] | None:
+        """(south, west, north, east) enclosing every point, or None if empty."""
+        with self._lock:
+            if not self._points:
+                return None
+            lats = [lat for lat, _ in self._points.values()]
+            lngs = [lng for _, lng in self._points.values()]
+            return min(lats), min(lngs), max(lats), max(lngs)
+
+    def radius(self, lat: float, lng: float, radius_km: float, limit: int | None = None) -> list[tuple[float, object]]:
+        """Return ``(distance_km, payload)`` pairs within *radius_km*, nearest first."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        r0, c0 = self._cell(lat - dlat, lng - dlng)
+        r1, c1 = self._cell(lat + dlat, lng + dlng)
+
+        hits = []
+        with self._lock:
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    cell = self._cells.get((r, c))
+                    if not cell:
+                        continue
+                    for key, (plat, plng) in cell.items():
+                        d = haversine_km(lat, lng, plat, plng)
+                        if d <= radius_km:
+                            hits.append((d, key))
+            hits = heapq.nsmallest(limit, hits) if limit else sorted(hits)
+            return [(d, self._payloads[key]) for d, key in hits]
+
+    def nearest(self, lat: float, lng: float, k: int) -> list[tuple[float, object]]:
+        """Return the *k* closest ``(distance_km, payload)`` pairs, nearest first.
+
+        Searches outward ring by ring and stops once the next ring is provably
+        farther away than the current k-th best hit.
+        """
+        if k <= 0:
+            return []
+        # Smallest ground distance spanned by one cell around this latitude —
+        # a lower bound on how far away anything in ring n+1 can be.
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * min(1.0, max(math.cos(math.radians(lat)), 1e-6))
+        r0, c0 = self._cell(lat, lng)
+
+        best: list[tuple[float, int]] = []   # max-heap via negated distance
+        with self._lock:
+            total = len(self._points)
+            seen = 0
+            ring = 0
+            while seen < total:
+                if 8 * ring > len(self._cells):
+                    # Sparse tail: walking empty rings would cost more than
+                    # visiting the remaining occupied cells directly.
+                    cells = [cell for (r, c), cell in self._cells.items()
+                             if max(abs(r - r0), abs(c - c0)) >= ring]
+                else:
+                    cells = [self._cells.get(key) for key in _ring_cells(r0, c0, ring)]
+                for cell in cells:
+                    if not cell:
+                        continue
+                    for key, (plat, plng) in cell.items():
+                        seen += 1
+                        d = haversine_km(lat, lng, plat, plng)
+                        if len(best) < k:
+                            heapq.heappush(best, (-d, key))
+                        elif d < -best[0][0]:
+                            heapq.heapreplace(best, (-d, key))
+                if 8 * ring > len(self._cells):
+                    break
+                if len(best) == k and -best[0][0] <= ring * cell_km:
+                    break
+                ring += 1
+            return [(-nd, self._payloads[key]) for nd, key in sorted(best, reverse=True)]
+
+
+def _ring_cells(r0: int, c0: int, ring: int):
+    """Yield the cell keys on the square ring *ring* cells out from (r0, c0)."""
+    if ring == 0:
+        yield r0, c0
+        return
+    for c in range(c0 - ring, c0 + ring + 1):
+        yield r0 - ring, c
+        yield r0 + ring, c
+    for r in range(r0 - ring + 1, r0 + ring):
+        yield r, c0 - ring
+        yield r, c0 + ring
@@ -0,0 +1,387 @@
+"""
+Live catalog changes pushed to open pages over Server-Sent Events.
+
+``GET /api/stream?v=<version>`` (or ``/<city>/api/stream``) is an
+``text/event-stream`` of the city's catalog writes after *version*, the
+generation the page was rendered at::
+
+    id: 42
+    event: add
+    data: {"type": "add", "city": "london", "version": 42, "id": 7, "cafe": {...}}
+
+Each carries the cafe's card fields (``readmodel.CARD_FIELDS``), so the
+page patches its card grid, filter counts and map pins in place.
+
+Versions are the city's ``City.generation``: a client that sees a gap (a
+bulk write, or events it missed) gets ``reset`` and reloads instead. Recent
+events are replayed from a per-city ring buffer, so ``EventSource``
+reconnects (which send ``Last-Event-ID``) lose nothing.
+
+``catalog.cafe_added`` / ``cafe_updated`` / ``cafe_deleted`` publish after
+each commit. ``STREAM_BACKEND`` decides how events reach the other worker
+processes:
+
+* ``memory`` — this process only (a single worker, or tests);
+* ``file`` — appended as JSON lines to ``STREAM_FILE``, which each worker tails;
+* ``postgres`` — ``NOTIFY``, with one ``LISTEN`` connection per worker. A
+  ``LISTEN`` needs a session of its own, so this is refused with
+  ``DB_POOL_MODE=transaction`` (pgbouncer would hand the session to another
+  client and the notifications would never arrive); use ``file`` there.
+
+Open streams cost a blocked thread or greenlet each and hold no database
+connection; run gunicorn with ``-k gevent`` (or ``gthread`` and enough
+threads) to keep thousands open, and cap them with ``STREAM_MAX_CLIENTS``.
+On a sync worker each stream would hold the whole worker, so the app only
+turns live updates on by default for the worker classes in
+``STREAMING_WORKERS``.
+
+Each subscriber buffers at most ``STREAM_QUEUE_SIZE`` events: a consumer
+that falls that far behind is sent ``reset`` and its backlog dropped, so a
+slow client can never make the process hold an unbounded queue.
+"""
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from flask import abort, current_app, request
+
+# Postgres NOTIFY channel.
+CHANNEL = "workbrew_catalog"
+BACKENDS = ("memory", "file", "postgres")
+# gunicorn worker classes that can park an open stream without blocking others.
+STREAMING_WORKERS = ("gevent", "eventlet", "gthread")
+# Browsers wait this long (ms) before reconnecting a dropped stream.
+RETRY_MS = 3000
+
+
+class Subscriber:
+    """One open stream: a bounded backlog and a wake-up flag."""
+
+    __slots__ = ("city", "backlog", "wake", "overflowed")
+
+    def __init__(self, city: str, size: int):
+        self.city = city
+        self.backlog: deque = deque(maxlen=size)
+        self.wake = threading.Event()
+        self.overflowed = False
+
+    def push(self, event: dict) -> bool:
+        """Queue *event*; False when this subscriber has fallen too far behind.
+
+        An overflowing subscriber's backlog is dropped and it gets ``reset``
+        next; until it has been sent, further events are discarded too.
+        """
+        if self.overflowed:
+            return False
+        if len(self.backlog) == self.backlog.maxlen:
+            self.backlog.clear()
+            self.overflowed = True
+        else:
+            self.backlog.append(event)
+        self.wake.set()
+        return not self.overflowed
+
+
+class Broker:
+    """Fans events out to this process's open streams, with a replay buffer per city."""
+
+    def __init__(self, queue_size: int = 64, replay: int = 256, max_clients: int = 1000):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.replay = replay
+        self._recent: dict[str, deque] = {}
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def clients(self) -> int:
+        return len(self._subscribers)
+
+    def dispatch(self, event: dict) -> None:
+        """Deliver an event (from any worker, via the backend) to local subscribers."""
+        city = event.get("city")
+        with self._lock:
+            if event["type"] != "reset":
+                recent = self._recent.setdefault(city, deque(maxlen=self.replay))
+                if recent and event["version"] <= recent[-1]["version"]:
+                    return        # already seen (a backend can deliver twice)
+                recent.append(event)
+            elif city is None:
+                self._recent.clear()
+            else:
+                self._recent.pop(city, None)
+            self.published += 1
+            for subscriber in self._subscribers:
+                if (city is None or subscriber.city == city) and not subscriber.push(event):
+                    self.dropped += 1
+
+    def subscribe(self, city: str, since: int | None, current: int) -> Subscriber | None:
+        """A new subscriber, primed with the events after *since*; None when full.
+
+        *current* is the city's generation now: a client behind it whose missed
+        events have left the replay buffer starts with ``reset``.
+        """
+        subscriber = Subscriber(city, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            if since is not None:
+                missed = [e for e in self._recent.get(city, ()) if e["version"] > since]
+                gap = missed[0]["version"] != since + 1 if missed else since < current
+                if gap:
+                    subscriber.push({"type": "reset", "city": city, "version": current})
+                else:
+                    for event in missed:
+                        subscriber.push(event)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self) -> dict:
+        return {"clients": self.clients, "published": self.published, "dropped": self.dropped}
+
+
+# ── Backends ─────────────────────────────────────────────────────────────────
+
+
+class MemoryBackend:
+    """Single-process delivery: publishing is dispatching."""
+
+    def __init__(self, app, broker: Broker):
+        self.broker = broker
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, event: dict) -> None:
+        self.broker.dispatch(event)
+
+
+class FileBackend:
+    """Cross-process delivery through an append-only JSON-lines file.
+
+    Every worker (the publisher included) tails the file on a daemon thread,
+    polling every ``STREAM_POLL_INTERVAL`` seconds. Appends are single
+    ``O_APPEND`` writes, so lines from concurrent workers never interleave.
+    Past ``STREAM_FILE_MAX_BYTES`` the publisher starts a fresh file; tailers
+    follow the rename, and anything they miss surfaces as a version gap.
+    """
+
+    def __init__(self, app, broker: Broker):
+        self.broker = broker
+        self.path = app.config["STREAM_FILE"]
+        self.interval = app.config["STREAM_POLL_INTERVAL"]
+        self.max_bytes = app.config["STREAM_FILE_MAX_BYTES"]
+        self.logger = app.logger
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._started:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            try:
+                stat = os.stat(self.path)
+                position = stat.st_ino, stat.st_size      # only events from now on
+            except OSError:
+                position = None, 0
+            threading.Thread(target=self._tail, args=position, name="stream-tail", daemon=True).start()
+            self._started = True
+
+    def publish(self, event: dict) -> None:
+        line = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass          # not created yet, or another worker rotated it first
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _tail(self, inode: int | None, offset: int) -> None:
+        partial = b""
+        while True:
+            time.sleep(self.interval)
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                continue
+            if stat.st_ino != inode:
+                inode, offset, partial = stat.st_ino, 0, b""
+            if stat.st_size <= offset:
+                continue
+            try:
+                with open(self.path, "rb") as fh:
+                    fh.seek(offset)
+                    chunk = fh.read(stat.st_size - offset)
+            except OSError:
+                continue
+            offset += len(chunk)
+            *lines, partial = (partial + chunk).split(b"\n")
+            for line in lines:
+                try:
+                    self.broker.dispatch(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    self.logger.warning("stream: skipping malformed event line %r", line[:200])
+
+
+class PostgresBackend:
+    """Cross-process delivery through ``NOTIFY`` / ``LISTEN`` on ``CHANNEL``.
+
+    Each worker keeps one dedicated connection (outside the pool) listening on
+    a daemon thread, reconnecting with backoff. Notifications are sent after
+    the write commits; payloads are the event JSON, well under Postgres's
+    8000-byte limit.
+    """
+
+    def __init__(self, app, broker: Broker):
+        self.app = app
+        self.broker = broker
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if not self._started:
+                threading.Thread(target=self._listen, name="stream-listen", daemon=True).start()
+                self._started = True
+
+    def publish(self, event: dict) -> None:
+        from sqlalchemy import text
+
+        from extensions import db
+        with db.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": CHANNEL, "payload": json.dumps(event, separators=(",", ":"))})
+
+    def _listen(self) -> None:
+        from extensions import db
+        delay = 1.0
+        while True:
+            try:
+                with self.app.app_context():
+                    raw = db.engine.raw_connection()
+                raw.detach()                      # never handed back to the pool
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                delay = 1.0
+                while True:
+                    if select.select([conn], [], [], 30)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self.broker.dispatch(json.loads(conn.notifies.pop(0).payload))
+            except Exception as exc:          # lost connection: reconnect with backoff
+                self.app.logger.warning("stream: LISTEN connection failed (%s); retrying in %.0fs", exc, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+
+# ── Publishing and the endpoint ──────────────────────────────────────────────
+
+
+def publish(kind: str, city: str | None, version: int | None, cafe_id: int | None = None,
+            card: dict | None = None) -> None:
+    """Send one catalog change to every open stream of *city* (all cities when None)."""
+    event = {"type": kind, "city": city, "version": version}
+    if cafe_id is not None:
+        event["id"] = cafe_id
+    if card is not None:
+        event["cafe"] = card
+    backend = current_app.extensions.get("workbrew.stream")
+    if backend is None:
+        return
+    try:
+        backend.publish(event)
+    except Exception:
+        # The write has committed; a lost event shows up as a version gap.
+        current_app.logger.exception("stream: failed to publish %s event", kind)
+
+
+def format_event(event: dict) -> str:
+    """One SSE message; change events carry their version as the event id."""
+    lines = [f"event: {event['type']}"]
+    if event["type"] != "reset":
+        lines.insert(0, f"id: {event['version']}")
+    lines.append("data: " + json.dumps(event, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def _events(broker: Broker, subscriber: Subscriber, heartbeat: float):
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            if not subscriber.backlog and not subscriber.overflowed:
+                if not subscriber.wake.wait(heartbeat):
+                    yield ": keepalive\n\n"       # also how a vanished client is noticed
+                    continue
+            subscriber.wake.clear()
+            if subscriber.overflowed:
+                subscriber.overflowed = False
+                yield format_event({"type": "reset", "city": subscriber.city, "version": None})
+                continue
+            while subscriber.backlog:
+                yield format_event(subscriber.backlog.popleft())
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+def init_app(app):
+    """Create the broker and backend, and register ``/api/stream``."""
+    import catalog
+    import cities
+
+    app.config.setdefault("STREAM_BACKEND", "memory")
+    app.config.setdefault("STREAM_FILE", os.path.join(app.instance_path, "stream.jsonl"))
+    app.config.setdefault("STREAM_FILE_MAX_BYTES", 1024 * 1024)
+    app.config.setdefault("STREAM_POLL_INTERVAL", 0.25)
+    app.config.setdefault("STREAM_QUEUE_SIZE", 64)
+    app.config.setdefault("STREAM_REPLAY", 256)
+    app.config.setdefault("STREAM_MAX_CLIENTS", 1000)
+    app.config.setdefault("STREAM_HEARTBEAT", 15.0)
+    kind = app.config["STREAM_BACKEND"]
+    if kind not in BACKENDS:
+        raise ValueError(f"STREAM_BACKEND must be one of {BACKENDS}, not {kind!r}")
+    if kind == "postgres" and app.config.get("DB_POOL_MODE") == "transaction":
+        raise ValueError("STREAM_BACKEND=postgres needs session connections for LISTEN; "
+                         "use STREAM_BACKEND=file with DB_POOL_MODE=transaction")
+
+    broker = app.extensions["workbrew.stream_broker"] = Broker(
+        app.config["STREAM_QUEUE_SIZE"], app.config["STREAM_REPLAY"], app.config["STREAM_MAX_CLIENTS"],
+    )
+    backend_class = {"memory": MemoryBackend, "file": FileBackend, "postgres": PostgresBackend}[kind]
+    backend = app.extensions["workbrew.stream"] = backend_class(app, broker)
+
+    @app.route("/api/stream")
+    @app.route("/<city:city>/api/stream")
+    def catalog_stream():
+        """Catalog changes for open pages: ``?v=<version>`` or ``Last-Event-ID``."""
+        since = request.headers.get("Last-Event-ID", type=int)
+        if since is None:
+            since = request.args.get("v", type=int)
+        city = cities.current_slug()
+        current = catalog.generation(city)[0]
+        backend.start()                           # lazily, so threads start after any fork
+        subscriber = broker.subscribe(city, since, current)
+        if subscriber is None:
+            abort(503)
+        resp = app.response_class(_events(broker, subscriber, app.config["STREAM_HEARTBEAT"]),
+                                  mimetype="text/event-stream")
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Accel-Buffering"] = "no"   # don't let nginx buffer the stream
+        return resp
+
+    return backend
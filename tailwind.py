@@ -0,0 +1,280 @@
+"""Offline Tailwind: CSS for just the utility classes the templates use.
+
+A subset of Tailwind CSS v3 — its preflight, default theme (spacing, type
+scale, palettes used here), ``hover:``/``focus:`` and ``sm:``/``md:``/``lg:``
+variants, opacity modifiers and arbitrary values — generated in Python so the
+asset build needs neither Node nor the network. As with Tailwind's JIT,
+``candidates()`` scans template source for class-like tokens and ``generate()``
+emits rules only for the ones it recognises; anything else is ignored.
+"""
+import re
+
+# Font stacks from the old in-browser ``tailwind.config``; the web fonts
+# themselves are used when installed locally (see assets/app.css).
+FONT_FAMILY = {
+    "sans":  "Inter, ui-sans-serif, system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif",
+    "serif": "'Instrument Serif', ui-serif, Georgia, Cambria, 'Times New Roman', serif",
+}
+
+COLORS = {
+    "white": "#ffffff", "black": "#000000",
+    "stone": ["#fafaf9", "#f5f5f4", "#e7e5e4", "#d6d3d1", "#a8a29e", "#78716c",
+              "#57534e", "#44403c", "#292524", "#1c1917", "#0c0a09"],
+    "amber": ["#fffbeb", "#fef3c7", "#fde68a", "#fcd34d", "#fbbf24", "#f59e0b",
+              "#d97706", "#b45309", "#92400e", "#78350f", "#451a03"],
+    "red":   ["#fef2f2", "#fee2e2", "#fecaca", "#fca5a5", "#f87171", "#ef4444",
+              "#dc2626", "#b91c1c", "#991b1b", "#7f1d1d", "#450a0a"],
+    "green": ["#f0fdf4", "#dcfce7", "#bbf7d0", "#86efac", "#4ade80", "#22c55e",
+              "#16a34a", "#15803d", "#166534", "#14532d", "#052e16"],
+}
+_SHADES = (50, 100, 200, 300, 400, 500, 600, 700, 800, 900, 950)
+
+FONT_SIZE = {
+    "xs": ("0.75rem", "1rem"), "sm": ("0.875rem", "1.25rem"), "base": ("1rem", "1.5rem"),
+    "lg": ("1.125rem", "1.75rem"), "xl": ("1.25rem", "1.75rem"), "2xl": ("1.5rem", "2rem"),
+    "3xl": ("1.875rem", "2.25rem"), "4xl": ("2.25rem", "2.5rem"), "5xl": ("3rem", "1"),
+    "6xl": ("3.75rem", "1"),
+}
+FONT_WEIGHT = {"light": "300", "normal": "400", "medium": "500", "semibold": "600", "bold": "700"}
+LEADING = {"none": "1", "tight": "1.25", "snug": "1.375", "normal": "1.5", "relaxed": "1.625", "loose": "2"}
+TRACKING = {"tighter": "-0.05em", "tight": "-0.025em", "normal": "0em", "wide": "0.025em",
+            "wider": "0.05em", "widest": "0.1em"}
+RADIUS = {"": "0.25rem", "none": "0", "sm": "0.125rem", "md": "0.375rem", "lg": "0.5rem",
+          "xl": "0.75rem", "2xl": "1rem", "3xl": "1.5rem", "full": "9999px"}
+MAX_WIDTH = {"xs": "20rem", "sm": "24rem", "md": "28rem", "lg": "32rem", "xl": "36rem", "2xl": "42rem",
+             "3xl": "48rem", "4xl": "56rem", "5xl": "64rem", "6xl": "72rem", "7xl": "80rem", "full": "100%"}
+SHADOW = {
+    "sm": "0 1px 2px 0 rgb(0 0 0 / 0.05)",
+    "":   "0 1px 3px 0 rgb(0 0 0 / 0.1), 0 1px 2px -1px rgb(0 0 0 / 0.1)",
+    "md": "0 4px 6px -1px rgb(0 0 0 / 0.1), 0 2px 4px -2px rgb(0 0 0 / 0.1)",
+    "lg": "0 10px 15px -3px rgb(0 0 0 / 0.1), 0 4px 6px -4px rgb(0 0 0 / 0.1)",
+    "xl": "0 20px 25px -5px rgb(0 0 0 / 0.1), 0 8px 10px -6px rgb(0 0 0 / 0.1)",
+}
+SCREENS = {"sm": "640px", "md": "768px", "lg": "1024px", "xl": "1280px"}
+PSEUDO = {"hover": ":hover", "focus": ":focus"}
+
+STATIC = {
+    "block": "display:block", "inline-block": "display:inline-block", "inline": "display:inline",
+    "flex": "display:flex", "inline-flex": "display:inline-flex", "grid": "display:grid",
+    "hidden": "display:none",
+    "static": "position:static", "relative": "position:relative", "absolute": "position:absolute",
+    "fixed": "position:fixed", "sticky": "position:sticky",
+    "flex-1": "flex:1 1 0%", "flex-col": "flex-direction:column", "flex-row": "flex-direction:row",
+    "flex-wrap": "flex-wrap:wrap",
+    "items-center": "align-items:center", "items-start": "align-items:flex-start",
+    "items-end": "align-items:flex-end",
+    "justify-between": "justify-content:space-between", "justify-center": "justify-content:center",
+    "justify-end": "justify-content:flex-end",
+    "overflow-hidden": "overflow:hidden", "overflow-x-auto": "overflow-x:auto", "object-cover": "object-fit:cover",
+    "select-none": "user-select:none", "cursor-pointer": "cursor:pointer",
+    "min-h-screen": "min-height:100vh",
+    "uppercase": "text-transform:uppercase", "underline": "text-decoration-line:underline",
+    "text-left": "text-align:left", "text-center": "text-align:center", "text-right": "text-align:right",
+    "italic": "font-style:italic",
+    "border": "border-width:1px", "border-0": "border-width:0", "border-2": "border-width:2px",
+    "border-t": "border-top-width:1px", "border-b": "border-bottom-width:1px",
+    "border-l": "border-left-width:1px", "border-r": "border-right-width:1px",
+    "outline-none": "outline:2px solid transparent;outline-offset:2px",
+    "backdrop-blur": "backdrop-filter:blur(8px)",
+    "transition-colors": "transition-property:color,background-color,border-color,text-decoration-color,fill,stroke;"
+                         "transition-timing-function:cubic-bezier(0.4,0,0.2,1);transition-duration:150ms",
+    "bg-gradient-to-r": "background-image:linear-gradient(to right,var(--tw-gradient-stops))",
+    "ring-1": "box-shadow:0 0 0 1px var(--tw-ring-color,rgb(59 130 246 / 0.5))",
+    "ring-2": "box-shadow:0 0 0 2px var(--tw-ring-color,rgb(59 130 246 / 0.5))",
+}
+
+SPACING_PROPS = {
+    "p": ("padding",), "px": ("padding-left", "padding-right"), "py": ("padding-top", "padding-bottom"),
+    "pt": ("padding-top",), "pr": ("padding-right",), "pb": ("padding-bottom",), "pl": ("padding-left",),
+    "m": ("margin",), "mx": ("margin-left", "margin-right"), "my": ("margin-top", "margin-bottom"),
+    "mt": ("margin-top",), "mr": ("margin-right",), "mb": ("margin-bottom",), "ml": ("margin-left",),
+    "gap": ("gap",), "w": ("width",), "h": ("height",),
+    "top": ("top",), "right": ("right",), "bottom": ("bottom",), "left": ("left",),
+    "inset": ("inset",),
+}
+COLOR_PROPS = {
+    "text": "color", "bg": "background-color", "border": "border-color",
+    "accent": "accent-color", "ring": "--tw-ring-color",
+}
+
+PREFLIGHT = (
+    "*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb}"
+    "html{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:" + FONT_FAMILY["sans"] + "}"
+    "body{margin:0;line-height:inherit}"
+    "h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}"
+    "a{color:inherit;text-decoration:inherit}"
+    "b,strong{font-weight:bolder}"
+    "button,input,optgroup,select,textarea{font-family:inherit;font-size:100%;font-weight:inherit;"
+    "line-height:inherit;color:inherit;margin:0;padding:0}"
+    "button,select{text-transform:none}"
+    "button,[type=button],[type=reset],[type=submit]{-webkit-appearance:button;background-color:transparent;"
+    "background-image:none}"
+    "[type=search]{-webkit-appearance:textfield;outline-offset:-2px}"
+    "blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}"
+    "fieldset{margin:0;padding:0}legend{padding:0}"
+    "ol,ul,menu{list-style:none;margin:0;padding:0}"
+    "textarea{resize:vertical}"
+    "input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}"
+    "button,[role=button]{cursor:pointer}"
+    "img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}"
+    "img,video{max-width:100%;height:auto}"
+    "[hidden]{display:none}"
+)
+
+_TOKEN = re.compile(r"[^\s\"'`<>={}()|,;]+")
+_CSS_SPECIAL = re.compile(r"([^a-zA-Z0-9_-])")
+
+
+def candidates(text: str) -> set[str]:
+    """Every class-like token in *text* (template or script source)."""
+    return set(_TOKEN.findall(text))
+
+
+def _escape(name: str) -> str:
+    return _CSS_SPECIAL.sub(r"\\\1", name)
+
+
+def _spacing(value: str) -> str | None:
+    if value == "0":
+        return "0px"
+    if value == "px":
+        return "1px"
+    if value == "auto":
+        return "auto"
+    if value == "full":
+        return "100%"
+    if re.fullmatch(r"\d+/\d+", value):
+        num, den = value.split("/")
+        return f"{int(num) / int(den) * 100:g}%"
+    if re.fullmatch(r"\d+(\.5)?", value):
+        return f"{float(value) / 4:g}rem"
+    return None
+
+
+def _color(value: str) -> str | None:
+    name, _, alpha = value.partition("/")
+    if name.startswith("[#") and name.endswith("]"):
+        hexcode = name[1:-1]
+    elif name in ("white", "black"):
+        hexcode = COLORS[name]
+    else:
+        family, _, shade = name.rpartition("-")
+        if family not in COLORS or not shade.isdigit() or int(shade) not in _SHADES:
+            return None
+        hexcode = COLORS[family][_SHADES.index(int(shade))]
+    if not re.fullmatch(r"#[0-9a-fA-F]{6}", hexcode):
+        return None
+    if not alpha:
+        return hexcode.lower()
+    if not alpha.isdigit():
+        return None
+    r, g, b = (int(hexcode[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgb({r} {g} {b} / {int(alpha) / 100:g})"
+
+
+def declarations(utility: str) -> str | None:
+    """CSS declarations for one utility (no variants), or None if unknown."""
+    if utility in STATIC:
+        return STATIC[utility]
+    negative = utility.startswith("-")
+    base = utility[1:] if negative else utility
+    head, _, value = base.rpartition("-")
+
+    if base.startswith("translate-y-"):
+        amount = _spacing(base[len("translate-y-"):])
+        return amount and f"transform:translateY({'-' if negative else ''}{amount})"
+    if negative:
+        return None
+    if head in SPACING_PROPS:
+        amount = _spacing(value)
+        if amount is not None:
+            return ";".join(f"{prop}:{amount}" for prop in SPACING_PROPS[head])
+    if head == "space-y" and _spacing(value):
+        return "@space-y:" + _spacing(value)
+    if head == "z" and value.isdigit():
+        return f"z-index:{value}"
+    if head == "max-w" and value in MAX_WIDTH:
+        return f"max-width:{MAX_WIDTH[value]}"
+    if head == "grid-cols" and value.isdigit():
+        return f"grid-template-columns:repeat({value},minmax(0,1fr))"
+    if head == "col-span" and value.isdigit():
+        return f"grid-column:span {value}/span {value}"
+    if base.startswith("text-["):
+        return f"font-size:{base[6:-1]}" if base.endswith("]") and base[6:7].isdigit() else None
+    if head == "text" and value in FONT_SIZE:
+        size, line = FONT_SIZE[value]
+        return f"font-size:{size};line-height:{line}"
+    if head == "font" and value in FONT_WEIGHT:
+        return f"font-weight:{FONT_WEIGHT[value]}"
+    if head == "font" and value in FONT_FAMILY:
+        return f"font-family:{FONT_FAMILY[value]}"
+    if head == "leading" and value in LEADING:
+        return f"line-height:{LEADING[value]}"
+    if head == "tracking" and value in TRACKING:
+        return f"letter-spacing:{TRACKING[value]}"
+    if base == "rounded" or head == "rounded" and value in RADIUS:
+        return f"border-radius:{RADIUS['' if base == 'rounded' else value]}"
+    if base == "shadow" or head == "shadow" and value in SHADOW:
+        return f"box-shadow:{SHADOW['' if base == 'shadow' else value]}"
+
+    prefix, _, color_name = base.partition("-")
+    color = _color(color_name) if color_name else None
+    if color is not None:
+        if prefix in COLOR_PROPS:
+            return f"{COLOR_PROPS[prefix]}:{color}"
+        if prefix == "from":
+            return (f"--tw-gradient-from:{color};--tw-gradient-to:rgb(255 255 255 / 0);"
+                    "--tw-gradient-stops:var(--tw-gradient-from),var(--tw-gradient-to)")
+        if prefix == "to":
+            return f"--tw-gradient-to:{color}"
+    return None
+
+
+def rule(candidate: str) -> tuple[str | None, str] | None:
+    """``(media query or None, CSS rule)`` for *candidate*, or None if it isn't a utility."""
+    *variants, utility = candidate.split(":")
+    screen, pseudo = None, ""
+    for variant in variants:
+        if variant in SCREENS and screen is None and not pseudo:
+            screen = variant
+        elif variant in PSEUDO and not pseudo:
+            pseudo = PSEUDO[variant]
+        else:
+            return None
+    body = declarations(utility)
+    if body is None:
+        return None
+    selector = "." + _escape(candidate) + pseudo
+    if body.startswith("@space-y:"):
+        selector += ">:not([hidden])~:not([hidden])"
+        body = "margin-top:" + body[len("@space-y:"):]
+    media = f"(min-width:{SCREENS[screen]})" if screen else None
+    return media, f"{selector}{{{body}}}"
+
+
+def generate(classes) -> tuple[str, list[str]]:
+    """Minified CSS (preflight + utilities) for *classes*; also the names used.
+
+    Plain rules come first in a stable order, then ``hover:``/``focus:``
+    variants, then each breakpoint's rules in ascending screen order, so
+    responsive variants override as in Tailwind.
+    """
+    plain, states, screens, used = [], [], {}, []
+    for candidate in sorted(set(classes)):
+        generated = rule(candidate)
+        if generated is None:
+            continue
+        used.append(candidate)
+        media, css = generated
+        if media is not None:
+            screens.setdefault(media, []).append(css)
+        elif ":" in candidate:
+            states.append(css)
+        else:
+            plain.append(css)
+    responsive = []
+    for width in SCREENS.values():
+        media = f"(min-width:{width})"
+        if media in screens:
+            responsive.append(f"@media {media}{{{''.join(screens[media])}}}")
+    return PREFLIGHT + "".join(plain) + "".join(states) + "".join(responsive), used
@@ -0,0 +1,78 @@
+"""Shared fixtures: a throwaway SQLite-backed app seeded with four known cafes."""
+import os
+import tempfile
+
+import pytest
+
+import facets
+from app import create_app
+from extensions import db
+from models import Cafe
+
+# ── Fixtures ─────────────────────────────────────────────────────────────────
+
+
+@pytest.fixture
+def app():
+    # Temp-file SQLite: file-based DB means all connections (outer test context,
+    # request contexts) see committed state independently — no shared-connection
+    # transaction ambiguity that plagues in-memory SQLite in multi-context tests.
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    test_app = create_app()
+    test_app.config.update({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,           # disable CSRF in tests; tested separately
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "SECRET_KEY": "test-secret",
+        "JOB_WORKERS": 0,                    # no background threads; tests drain jobs inline
+        "SCHEMA_BOOTSTRAP": "deploy",        # tables come from create_all() below
+        "THUMBNAILS_ENABLED": False,         # no photo fetches; test_thumbnails.py turns them on
+    })
+    with test_app.app_context():
+        db.create_all()
+        _seed()
+        yield test_app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()      # release pool connections → suppress ResourceWarning
+    os.close(db_fd)
+    os.unlink(db_path)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client):
+    """Client with an active admin session."""
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+    return client
+
+
+def _seed():
+    """Insert a small set of known cafes for predictable filter tests."""
+    cafes = [
+        Cafe(name="WiFi Only",     map_url="http://g.co/1", img_url="http://img/1.jpg",
+             location="Peckham",    has_wifi=True,  has_sockets=False,
+             has_toilet=False, can_take_calls=False, seats="10", coffee_price="£2.00",
+             lat=51.47, lng=-0.07),
+        Cafe(name="Sockets Only",  map_url="http://g.co/2", img_url="http://img/2.jpg",
+             location="Hackney",    has_wifi=False, has_sockets=True,
+             has_toilet=True,  can_take_calls=False, seats="20", coffee_price="£2.50",
+             lat=51.54, lng=-0.06),
+        Cafe(name="Full House",    map_url="http://g.co/3", img_url="http://img/3.jpg",
+             location="Shoreditch", has_wifi=True,  has_sockets=True,
+             has_toilet=True,  can_take_calls=True,  seats="50+", coffee_price="£3.00",
+             lat=51.52, lng=-0.08),
+        Cafe(name="No Amenities",  map_url="http://g.co/4", img_url="http://img/4.jpg",
+             location="Peckham",    has_wifi=False, has_sockets=False,
+             has_toilet=False, can_take_calls=False, seats="5",  coffee_price="£1.50",
+             lat=51.47, lng=-0.07),
+    ]
+    db.session.add_all(cafes)
+    db.session.flush()
+    facets.rebuild(db.session.connection())
+    db.session.commit()
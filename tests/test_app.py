@@ -9,79 +9,31 @@ Coverage areas:
   - Admin delete (authenticated, unauthenticated → 403)
   - CSRF protection (POST without token → 400)
   - Empty-state rendering (no cafes match filters)
+  - Nearby API (radius + k-nearest, index kept in sync on add/delete)
+  - Page cache (ETag/304, generation invalidation, admin CSRF splice, card fragments)
+  - Keyset pagination ("load more" fragment)
+  - Bulk export (NDJSON / CSV streaming, filters)
+  - Map API (viewport tiles, clustering per zoom, tile invalidation)
+  - Background geocoding jobs (durable queue, retry/backoff, metrics)
+  - Search (fuzzy + prefix type-ahead, filters, index sync)
+  - Schema bootstrap (no DB work on import, fingerprinted check, added columns, startup report)
+  - Instrumentation (Server-Timing, SQL counts, /metrics merged across workers, pool health)
+  - Facet counts (chip/dropdown counts, transactional upkeep, bootstrap backfill)
+  - Client-side filtering (columnar catalog document, version caching, card template)
+  - Price & seat ranges (parsed columns, indexed range filters / sorts, backfill)
 """
-import os
-import tempfile
+import csv
+import io
+import json
 
 import pytest
 
-from app import create_app
+import catalog
+import facets
+import jobs
+from app import CSRF_PLACEHOLDER
 from extensions import db
-from models import Cafe
-
-# ── Fixtures ─────────────────────────────────────────────────────────────────
-
-
-@pytest.fixture
-def app():
-    # Temp-file SQLite: file-based DB means all connections (outer test context,
-    # request contexts) see committed state independently — no shared-connection
-    # transaction ambiguity that plagues in-memory SQLite in multi-context tests.
-    db_fd, db_path = tempfile.mkstemp(suffix=".db")
-    test_app = create_app()
-    test_app.config.update({
-        "TESTING": True,
-        "WTF_CSRF_ENABLED": False,           # disable CSRF in tests; tested separately
-        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
-        "SECRET_KEY": "test-secret",
-    })
-    with test_app.app_context():
-        db.create_all()
-        _seed()
-        yield test_app
-        db.session.remove()
-        db.drop_all()
-        db.engine.dispose()      # release pool connections → suppress ResourceWarning
-    os.close(db_fd)
-    os.unlink(db_path)
-
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-
-@pytest.fixture
-def admin_client(client):
-    """Client with an active admin session."""
-    with client.session_transaction() as sess:
-        sess["is_admin"] = True
-    return client
-
-
-def _seed():
-    """Insert a small set of known cafes for predictable filter tests."""
-    cafes = [
-        Cafe(name="WiFi Only",     map_url="http://g.co/1", img_url="http://img/1.jpg",
-             location="Peckham",    has_wifi=True,  has_sockets=False,
-             has_toilet=False, can_take_calls=False, seats="10", coffee_price="£2.00",
-             lat=51.47, lng=-0.07),
-        Cafe(name="Sockets Only",  map_url="http://g.co/2", img_url="http://img/2.jpg",
-             location="Hackney",    has_wifi=False, has_sockets=True,
-             has_toilet=True,  can_take_calls=False, seats="20", coffee_price="£2.50",
-             lat=51.54, lng=-0.06),
-        Cafe(name="Full House",    map_url="http://g.co/3", img_url="http://img/3.jpg",
-             location="Shoreditch", has_wifi=True,  has_sockets=True,
-             has_toilet=True,  can_take_calls=True,  seats="50+", coffee_price="£3.00",
-             lat=51.52, lng=-0.08),
-        Cafe(name="No Amenities",  map_url="http://g.co/4", img_url="http://img/4.jpg",
-             location="Peckham",    has_wifi=False, has_sockets=False,
-             has_toilet=False, can_take_calls=False, seats="5",  coffee_price="£1.50",
-             lat=51.47, lng=-0.07),
-    ]
-    db.session.add_all(cafes)
-    db.session.commit()
-
+from models import Cafe, Location, PendingJob, SchemaState
 
 # ── Helper ────────────────────────────────────────────────────────────────────
 
@@ -166,6 +118,21 @@ class TestFilters:
         assert b"WiFi Only" in resp.data
         assert b"No Amenities" in resp.data
 
+    def test_filter_reflects_added_cafe(self, client):
+        client.get("/?wifi=1")                       # build the filter index
+        client.post("/add", data={**TestAddCafe.VALID, "name": "Fresh WiFi"})
+        resp = client.get("/?wifi=1&location=Brixton")
+        assert b"Fresh WiFi</h3>" in resp.data
+        assert b"Brixton (1)</option>" in resp.data
+
+    def test_filter_reflects_deleted_cafe(self, admin_client):
+        admin_client.get("/?location=Hackney")       # build the filter index
+        cafe_id = Cafe.query.filter_by(name="Sockets Only").first().id
+        admin_client.post(f"/cafe/{cafe_id}/delete")
+        resp = admin_client.get("/")
+        assert b"Sockets Only</h3>" not in resp.data
+        assert b'value="Hackney"' not in resp.data
+
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # 3. ADD CAFE FORM
@@ -361,3 +328,721 @@ class TestCSRF:
             sess["is_admin"] = True
         resp = csrf_client.post("/cafe/1/delete")
         assert resp.status_code == 400
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 7. NEARBY API
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestNearby:
+    def test_nearest_sorted_by_distance(self, client):
+        resp = client.get("/api/cafes/near?lat=51.52&lng=-0.08&limit=2")
+        assert resp.status_code == 200
+        names = [c["name"] for c in resp.json["results"]]
+        assert names[0] == "Full House"
+        assert len(names) == 2
+        dists = [c["distance_km"] for c in resp.json["results"]]
+        assert dists == sorted(dists)
+
+    def test_radius_excludes_far_cafes(self, client):
+        resp = client.get("/api/cafes/near?lat=51.47&lng=-0.07&radius=1")
+        names = {c["name"] for c in resp.json["results"]}
+        assert names == {"WiFi Only", "No Amenities"}
+
+    def test_missing_coordinates_rejected(self, client):
+        assert client.get("/api/cafes/near?lat=51.5").status_code == 400
+        assert client.get("/api/cafes/near?lat=abc&lng=0").status_code == 400
+
+    def test_out_of_range_rejected(self, client):
+        assert client.get("/api/cafes/near?lat=95&lng=0").status_code == 400
+        assert client.get("/api/cafes/near?lat=51&lng=0&radius=-1").status_code == 400
+
+    def test_index_tracks_delete(self, admin_client):
+        admin_client.get("/api/cafes/near?lat=51.52&lng=-0.08")   # build index
+        cafe_id = Cafe.query.filter_by(name="Full House").first().id
+        admin_client.post(f"/cafe/{cafe_id}/delete")
+        resp = admin_client.get("/api/cafes/near?lat=51.52&lng=-0.08&radius=0.5")
+        assert "Full House" not in {c["name"] for c in resp.json["results"]}
+
+    def test_index_tracks_add(self, client, app):
+        client.get("/api/cafes/near?lat=51.52&lng=-0.08")         # build index
+        client.post("/add", data={**TestAddCafe.VALID, "name": "Geo Cafe"})
+        db.session.expire_all()
+        cafe = Cafe.query.filter_by(name="Geo Cafe").first()
+        # New submissions have no coordinates yet, so they must not appear.
+        assert cafe.lat is None
+        resp = client.get("/api/cafes/near?lat=51.52&lng=-0.08&limit=100")
+        assert "Geo Cafe" not in {c["name"] for c in resp.json["results"]}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 8. PAGE CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestPageCache:
+    def test_repeat_view_served_from_cache_with_etag(self, client, app):
+        first = client.get("/?wifi=1")
+        second = client.get("/?wifi=1")
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert first.data == second.data
+        assert app.extensions["workbrew.page_cache"].hits == 1
+
+    def test_conditional_request_returns_304(self, client):
+        etag = client.get("/").headers["ETag"]
+        resp = client.get("/", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.data == b""
+
+    def test_filter_args_are_normalised(self, client, app):
+        client.get("/?wifi=1")
+        client.get("/?wifi=yes")
+        assert app.extensions["workbrew.page_cache"].hits == 1
+
+    def test_write_invalidates_cached_page(self, client):
+        etag = client.get("/").headers["ETag"]
+        client.post("/add", data=TestAddCafe.VALID, follow_redirects=True)
+        resp = client.get("/", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert b"Test Cafe</h3>" in resp.data
+
+    def test_write_from_another_worker_is_picked_up(self, client, app):
+        app.config["CATALOG_SYNC_INTERVAL"] = 0
+        client.get("/")
+        # Simulate a different worker: write + bump without touching our indexes.
+        db.session.add(Cafe(name="Elsewhere", map_url="http://g.co/5", img_url="http://img/5.jpg",
+                            location="Soho", has_wifi=True))
+        catalog.bump_generation()
+        db.session.commit()
+        assert b"Elsewhere</h3>" in client.get("/").data
+
+    def test_admin_page_gets_real_csrf_token(self, admin_client):
+        first = admin_client.get("/")
+        second = admin_client.get("/")
+        assert CSRF_PLACEHOLDER.encode() not in second.data
+        assert b'name="csrf_token" value="' in second.data
+        assert "ETag" not in first.headers
+
+    def test_admin_and_public_views_cached_separately(self, client):
+        client.get("/")
+        with client.session_transaction() as sess:
+            sess["is_admin"] = True
+        assert b"Delete Listing" in client.get("/").data
+
+    def test_cards_reused_across_filtered_pages(self, client, app):
+        cards = app.extensions["workbrew.card_cache"]
+        client.get("/")
+        client.get("/?wifi=1")                       # both cards already rendered
+        assert (cards.hits, cards.misses) == (2, 4)
+
+    def test_uncached_admin_page_splices_csrf_into_cards(self, admin_client):
+        admin_client.get("/")                        # cache the admin cards
+        with admin_client.session_transaction() as sess:
+            sess["_flashes"] = [("info", "hello")]
+        resp = admin_client.get("/")
+        assert b"hello" in resp.data
+        assert CSRF_PLACEHOLDER.encode() not in resp.data
+        assert b'name="csrf_token" value="' in resp.data
+
+    def test_write_invalidates_card_fragment(self, admin_client, app):
+        admin_client.get("/")
+        cafe = Cafe.query.filter_by(name="Full House").one()
+        admin_client.post(f"/cafe/{cafe.id}/delete")
+        keys = app.extensions["workbrew.card_cache"]._by_item
+        assert cafe.id not in keys and len(keys) == 3
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 9. KEYSET PAGINATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestPagination:
+    @pytest.fixture
+    def paged_client(self, app, client):
+        app.config["PAGE_SIZE"] = 2
+        return client
+
+    def _cursor(self, html: bytes) -> str:
+        marker = b'data-next="'
+        start = html.index(marker) + len(marker)
+        return html[start:html.index(b'"', start)].decode()
+
+    def test_first_page_is_capped(self, paged_client):
+        resp = paged_client.get("/")
+        # Name order: Full House, No Amenities | Sockets Only, WiFi Only
+        assert b"Full House</h3>" in resp.data
+        assert b"No Amenities</h3>" in resp.data
+        assert b"Sockets Only</h3>" not in resp.data
+        assert b"<strong class=\"text-stone-700 font-semibold\">4</strong>" in resp.data
+        assert b"Load more cafes" in resp.data
+
+    def test_fragment_returns_next_page(self, paged_client):
+        cursor = self._cursor(paged_client.get("/").data)
+        resp = paged_client.get(f"/cafes/page?after={cursor}")
+        assert resp.status_code == 200
+        assert b"Sockets Only</h3>" in resp.data
+        assert b"WiFi Only</h3>" in resp.data
+        assert b"Full House</h3>" not in resp.data
+        assert b'id="next-cursor" data-next=""' in resp.data     # last page
+
+    def test_fragment_respects_filters(self, paged_client):
+        resp = paged_client.get("/?location=Peckham")
+        assert b'id="load-more"' not in resp.data              # only 2 in Peckham
+
+    def test_bad_cursor_rejected(self, paged_client):
+        assert paged_client.get("/cafes/page?after=not-a-cursor").status_code == 400
+        assert paged_client.get("/cafes/page").status_code == 400
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 10. BULK EXPORT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestExport:
+    def test_ndjson_exports_every_row(self, client):
+        resp = client.get("/api/cafes/export.ndjson")
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in resp.data.decode().splitlines()]
+        assert {r["name"] for r in rows} == {"WiFi Only", "Sockets Only", "Full House", "No Amenities"}
+        assert rows[0]["map_url"].startswith("http://g.co/")
+
+    def test_csv_has_header_and_rows(self, client):
+        resp = client.get("/api/cafes/export.csv")
+        assert resp.mimetype == "text/csv"
+        assert "attachment" in resp.headers["Content-Disposition"]
+        rows = list(csv.DictReader(io.StringIO(resp.data.decode())))
+        assert len(rows) == 4
+        assert rows[0]["coffee_price"] == "£2.00"
+
+    def test_export_applies_index_filters(self, client):
+        resp = client.get("/api/cafes/export.ndjson?wifi=1&location=Peckham")
+        rows = [json.loads(line) for line in resp.data.decode().splitlines()]
+        assert [r["name"] for r in rows] == ["WiFi Only"]
+
+    def test_export_is_streamed(self, client):
+        resp = client.get("/api/cafes/export.csv")
+        assert resp.is_streamed
+
+    def test_unknown_format_404(self, client):
+        assert client.get("/api/cafes/export.xml").status_code == 404
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 11. MAP API
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestMapApi:
+    LONDON = "bbox=-0.2,51.4,0.0,51.6"
+
+    def _features(self, client, query):
+        resp = client.get(f"/api/map?{query}")
+        assert resp.status_code == 200
+        return resp.json["features"]
+
+    def test_low_zoom_clusters(self, client):
+        features = self._features(client, f"{self.LONDON}&zoom=8")
+        clusters = [f for f in features if f["type"] == "cluster"]
+        assert sum(f["count"] for f in clusters) == 4
+        assert sum(f["amenities"]["has_wifi"] for f in clusters) == 2
+
+    def test_high_zoom_returns_markers(self, client):
+        # Both Peckham cafes share coordinates: clustered until zoom 16.
+        peckham = "bbox=-0.075,51.465,-0.065,51.475"
+        assert [f["type"] for f in self._features(client, f"{peckham}&zoom=15")] == ["cluster"]
+        features = self._features(client, f"{peckham}&zoom=16")
+        assert {f["cafe"]["name"] for f in features} == {"WiFi Only", "No Amenities"}
+
+    def test_viewport_excludes_outside_pins(self, client):
+        features = self._features(client, "bbox=-0.085,51.515,-0.075,51.525&zoom=16")
+        assert [f["cafe"]["name"] for f in features] == ["Full House"]
+
+    def test_filters_apply(self, client):
+        features = self._features(client, f"{self.LONDON}&zoom=8&calls=1")
+        assert [f["cafe"]["name"] for f in features] == ["Full House"]
+
+    def test_tiles_cached_and_invalidated_on_delete(self, admin_client, app):
+        self._features(admin_client, f"{self.LONDON}&zoom=8")
+        self._features(admin_client, f"{self.LONDON}&zoom=8")
+        tiles = app.extensions["workbrew.catalog"]["london"].tiles
+        assert tiles.hits > 0
+        cafe_id = Cafe.query.filter_by(name="Full House").first().id
+        admin_client.post(f"/cafe/{cafe_id}/delete")
+        features = self._features(admin_client, f"{self.LONDON}&zoom=8")
+        assert sum(f.get("count", 1) for f in features) == 3
+
+    def test_bad_params_rejected(self, client):
+        assert client.get("/api/map?zoom=3").status_code == 400
+        assert client.get("/api/map?bbox=1,2,3&zoom=3").status_code == 400
+        assert client.get(f"/api/map?{self.LONDON}&zoom=25").status_code == 400
+        assert client.get("/api/map?bbox=-180,-85,180,85&zoom=12").status_code == 400
+        assert client.get("/api/map?bbox=nan,nan,nan,nan&zoom=12").status_code == 400
+        assert client.get("/api/map?bbox=-inf,51.4,inf,51.6&zoom=12").status_code == 400
+
+    def test_page_frames_pinned_cafes(self, client):
+        assert b"map.fitBounds([[51.47, -0.08]" in client.get("/").data
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 12. BACKGROUND GEOCODING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class _FakeGeocoder:
+    def __init__(self, result=(51.46, -0.11), error=None):
+        self.result, self.error, self.calls, self.scopes = result, error, 0, []
+
+    def geocode(self, name, location, *scope):
+        self.calls += 1
+        self.scopes.append(scope)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestGeocodeJobs:
+    @pytest.fixture
+    def runner(self, app):
+        return app.extensions["workbrew.jobs"]
+
+    def _add(self, client, name="Queued Cafe"):
+        client.post("/add", data={**TestAddCafe.VALID, "name": name})
+        db.session.expire_all()
+        return Cafe.query.filter_by(name=name).one()
+
+    def test_add_enqueues_durable_job(self, client):
+        cafe = self._add(client)
+        job = PendingJob.query.filter_by(cafe_id=cafe.id).one()
+        assert job.kind == "geocode" and job.status == "pending"
+
+    def test_job_geocodes_and_updates_map(self, client, runner):
+        cafe = self._add(client)
+        runner.geocoder = _FakeGeocoder()
+        assert runner.run_pending() == 1
+        db.session.expire_all()
+        assert db.session.get(Cafe, cafe.id).lat == 51.46
+        assert PendingJob.query.count() == 0
+        resp = client.get("/api/cafes/near?lat=51.46&lng=-0.11&radius=0.1")
+        assert [c["name"] for c in resp.json["results"]] == ["Queued Cafe"]
+
+    def test_lookup_runs_outside_a_transaction(self, client, runner):
+        from sqlalchemy import update
+        cafe_id = self._add(client).id
+
+        class _Racing(_FakeGeocoder):
+            def geocode(self, name, location, *scope):
+                self.in_transaction = db.session().in_transaction()
+                with db.engine.begin() as conn:     # someone else geocodes it meanwhile
+                    conn.execute(update(Cafe).where(Cafe.id == cafe_id).values(lat=1.0, lng=2.0))
+                return super().geocode(name, location, *scope)
+
+        runner.geocoder = fake = _Racing()
+        assert runner.run_pending() == 1
+        db.session.expire_all()
+        assert fake.in_transaction is False
+        assert db.session.get(Cafe, cafe_id).lat == 1.0    # re-checked before writing
+
+    def test_jobs_deduplicated_per_cafe(self, client, app):
+        cafe = self._add(client)
+        jobs.enqueue(jobs.JOB_GEOCODE, cafe.id)
+        db.session.commit()
+        assert PendingJob.query.filter_by(cafe_id=cafe.id).count() == 1
+
+    def test_outage_retries_with_backoff_then_dies(self, client, runner, app):
+        from geocode import GeocodeUnavailable
+        app.config["JOB_MAX_ATTEMPTS"] = 2
+        cafe = self._add(client)
+        runner.geocoder = _FakeGeocoder(error=GeocodeUnavailable("down"))
+        runner.run_pending()
+        job = PendingJob.query.filter_by(cafe_id=cafe.id).one()
+        assert job.attempts == 1 and job.status == "pending"
+        assert runner.run_pending() == 0             # backing off: not due yet
+
+        job.run_after = job.created_at               # fast-forward the backoff
+        db.session.commit()
+        runner.run_pending()
+        db.session.expire_all()
+        assert PendingJob.query.filter_by(cafe_id=cafe.id).one().status == "dead"
+
+    def test_enqueue_revives_a_dead_job(self, client, runner, app):
+        from geocode import GeocodeUnavailable
+        app.config["JOB_MAX_ATTEMPTS"] = 1
+        cafe = self._add(client)
+        cafe_id = cafe.id
+        runner.geocoder = _FakeGeocoder(error=GeocodeUnavailable("down"))
+        runner.run_pending()
+        jobs.enqueue(jobs.JOB_GEOCODE, cafe_id)
+        db.session.commit()
+        job = PendingJob.query.filter_by(cafe_id=cafe_id).one()
+        assert (job.status, job.attempts, job.last_error) == ("pending", 0, None)
+
+        runner.run_pending()                         # dies again
+        assert jobs.enqueue_where(jobs.JOB_GEOCODE, Cafe.id == cafe_id) == 1
+        db.session.commit()
+        db.session.expire_all()
+        assert PendingJob.query.filter_by(cafe_id=cafe_id).one().status == "pending"
+        runner.geocoder = _FakeGeocoder()
+        assert runner.run_pending() == 1 and PendingJob.query.count() == 0
+
+    def test_delete_cancels_pending_job(self, client):
+        cafe = self._add(client)
+        with client.session_transaction() as sess:
+            sess["is_admin"] = True
+        client.post(f"/cafe/{cafe.id}/delete")
+        assert PendingJob.query.count() == 0
+
+    def test_metrics_admin_only(self, client, runner):
+        self._add(client)
+        assert client.get("/admin/jobs").status_code == 403
+        with client.session_transaction() as sess:
+            sess["is_admin"] = True
+        runner.geocoder = _FakeGeocoder()
+        runner.run_pending()
+        metrics = client.get("/admin/jobs").json
+        assert metrics["pending"] == 0
+        assert metrics["completed"] == 1
+        assert metrics["latency_p50"] is not None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 13. SEARCH
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestSearch:
+    def _names(self, client, query_string):
+        return [c["name"] for c in client.get(f"/search?{query_string}").json["results"]]
+
+    def test_fuzzy_name_and_location(self, client):
+        assert self._names(client, "q=ful+hose") == ["Full House"]
+        assert self._names(client, "q=peckam") == ["No Amenities", "WiFi Only"]
+
+    def test_prefix_type_ahead(self, client):
+        resp = client.get("/search?q=sock")
+        assert resp.json["count"] == 1
+        assert resp.json["results"][0]["name"] == "Sockets Only"
+        assert resp.json["results"][0]["score"] == 0.9
+
+    def test_combines_with_amenity_filters(self, client):
+        assert self._names(client, "q=peckham&wifi=1") == ["WiFi Only"]
+        assert self._names(client, "q=peckham&location=Hackney") == []
+
+    def test_empty_query_and_limit(self, client):
+        assert client.get("/search?q=").json == {"query": "", "results": [], "count": 0}
+        assert len(self._names(client, "q=o&limit=1")) <= 1
+
+    def test_index_follows_add_and_delete(self, client, admin_client):
+        client.post("/add", data={**TestAddCafe.VALID, "name": "Zebra Roasters"})
+        assert self._names(client, "q=zebra") == ["Zebra Roasters"]
+        cafe = Cafe.query.filter_by(name="Zebra Roasters").one()
+        admin_client.post(f"/cafe/{cafe.id}/delete")
+        assert self._names(client, "q=zebra") == []
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 14. SCHEMA BOOTSTRAP & STARTUP REPORT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestStartup:
+    def test_create_app_does_not_connect(self):
+        from app import create_app
+        fresh = create_app()
+        assert "db_connect" not in fresh.extensions["workbrew.startup"].timings
+
+    def test_ensure_schema_runs_once_per_fingerprint(self, app):
+        import bootstrap
+        assert bootstrap.ensure_schema(app) is True      # fixture's create_all left no marker
+        assert bootstrap.ensure_schema(app) is False
+        assert SchemaState.query.one().fingerprint == bootstrap.schema_fingerprint(app, db.engine.dialect)
+
+    def test_ensure_schema_adds_new_columns_to_existing_tables(self, app):
+        import bootstrap
+        from sqlalchemy import inspect, text
+        db.session.execute(text("ALTER TABLE cafe DROP COLUMN thumb_key"))   # a pre-thumbnail table
+        db.session.commit()
+        assert bootstrap.ensure_schema(app) is True
+        assert "thumb_key" in {c["name"] for c in inspect(db.engine).get_columns("cafe")}
+        assert Cafe.query.count() == 4
+
+    def test_first_request_mode_checks_schema_and_reports(self, app, client):
+        app.config["SCHEMA_BOOTSTRAP"] = "first-request"
+        client.get("/")
+        client.get("/")
+        report = app.extensions["workbrew.startup"].as_dict()
+        assert {"schema_check", "first_request"} <= set(report["ms"])
+        assert report["schema_applied"] is True
+        assert SchemaState.query.count() == 1
+
+    def test_deploy_mode_skips_schema_check(self, app, client):
+        client.get("/")
+        assert "schema_check" not in app.extensions["workbrew.startup"].timings
+        assert "first_request" in app.extensions["workbrew.startup"].timings
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 15. INSTRUMENTATION & /metrics
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestMetrics:
+    def test_server_timing_header(self, client):
+        timing = client.get("/").headers["Server-Timing"]
+        assert timing.startswith("db;dur=")
+        assert "render;dur=" in timing and "total;dur=" in timing
+        assert 'desc="' in timing and "queries" in timing
+
+    def test_statements_counted_per_request(self, client):
+        client.get("/")                                      # warm the catalog
+        timing = client.get("/?wifi=1").headers["Server-Timing"]
+        # Served from the in-process indexes: no SQL beyond the sync check.
+        assert int(timing.split('desc="')[1].split(" ")[0]) <= 1
+
+    def test_metrics_exposition(self, client):
+        client.get("/")
+        client.get("/")
+        client.get("/cafes/page?after=%%%")
+        text = client.get("/metrics").get_data(as_text=True)
+        assert 'workbrew_requests_total{route="/",method="GET",status="200"} 2' in text
+        assert 'workbrew_requests_total{route="/cafes/page",method="GET",status="400"} 1' in text
+        assert 'workbrew_request_duration_seconds_count{route="/"} 2' in text
+        assert 'workbrew_cache_hits_total{cache="page"} 1' in text
+        assert "workbrew_request_sql_statements_total" in text
+        assert "# TYPE workbrew_pool_checkout_wait_seconds histogram" in text
+
+    def test_metrics_token(self, app, client):
+        app.config["METRICS_TOKEN"] = "s3cret"
+        assert client.get("/metrics").status_code == 401
+        resp = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+        assert resp.status_code == 200
+
+    def test_workers_merged_through_metrics_dir(self, app, client, tmp_path):
+        import json
+        metrics_state = app.extensions["workbrew.metrics"]
+        metrics_state.directory = str(tmp_path)
+        other = {"counters": {'workbrew_requests_total{route="/",method="GET",status="200"}': 5},
+                 "histograms": {}, "gauges": {}}
+        (tmp_path / "99999.json").write_text(json.dumps(other))
+        client.get("/")
+        text = client.get("/metrics").get_data(as_text=True)
+        assert 'workbrew_requests_total{route="/",method="GET",status="200"} 6' in text
+
+    def test_pool_health_admin_only(self, client, admin_client):
+        client.get("/")
+        stats = admin_client.get("/admin/pool").json
+        assert stats["mode"] == "session" and stats["pool"] == "TimedQueuePool"
+        assert stats["checkouts"] >= 1 and {"size", "checked_in", "overflow", "timeouts"} <= set(stats)
+        text = client.get("/metrics").get_data(as_text=True)
+        assert 'workbrew_pool_events_total{event="checkouts"}' in text
+        with client.session_transaction() as sess:
+            sess.pop("is_admin", None)
+        assert client.get("/admin/pool").status_code == 403
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 16. FACET COUNTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestFacetCounts:
+    """Location and amenity counts come from tables kept in step with each write."""
+
+    def test_counts_on_chips_and_dropdown(self, client):
+        resp = client.get("/")
+        assert b'WiFi <span class="chip-count">(2)</span>' in resp.data
+        assert b'Calls OK <span class="chip-count">(1)</span>' in resp.data
+        assert b"Peckham (2)</option>" in resp.data
+
+    def test_add_and_delete_adjust_counts(self, admin_client):
+        admin_client.post("/add", data={**TestAddCafe.VALID, "name": "Counted", "has_wifi": "y"})
+        counts = facets.read()
+        assert dict(counts["locations"])["Brixton"] == 1
+        assert counts["amenities"]["has_wifi"] == 3
+
+        cafe_id = Cafe.query.filter_by(name="Counted").one().id
+        admin_client.post(f"/cafe/{cafe_id}/delete")
+        counts = facets.read()
+        assert "Brixton" not in dict(counts["locations"])      # empty locations are dropped
+        assert counts["amenities"]["has_wifi"] == 2
+        assert b"Brixton" not in admin_client.get("/").data
+
+    def test_dropdown_does_not_scan_cafe_table(self, client):
+        import bench
+        with bench.QueryCounter(db.engine) as counter:
+            client.get("/")                                  # cold: catalog build scans once
+        with bench.QueryCounter(db.engine) as warm:
+            client.get("/?wifi=1")
+        assert not any("GROUP BY" in s or "DISTINCT" in s for s in counter.statements + warm.statements)
+
+    def test_bootstrap_backfills_counts(self, app):
+        import bootstrap
+        db.session.execute(db.delete(SchemaState))
+        db.session.execute(db.delete(Location))
+        db.session.commit()
+        bootstrap.ensure_schema(app)
+        assert dict(facets.read()["locations"]) == {"Hackney": 1, "Peckham": 2, "Shoreditch": 1}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 17. CLIENT-SIDE FILTERING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestClientFiltering:
+    """FILTER_MODE=client: one versioned columnar catalog document, filtered in the browser."""
+
+    def test_document_is_columnar_and_versioned(self, client):
+        doc = client.get("/api/catalog.json").json
+        cols = doc["columns"]
+        assert doc["version"] == catalog.generation()[0]
+        assert doc["locations"] == ["Hackney", "Peckham", "Shoreditch"]
+        assert cols["name"] == ["Full House", "No Amenities", "Sockets Only", "WiFi Only"]
+        assert [doc["locations"][i] for i in cols["location"]] == ["Shoreditch", "Peckham", "Hackney", "Peckham"]
+        assert cols["amenities"] == [0b1111, 0, 0b1010, 0b0001]     # bit i ↔ doc["amenities"][i]
+        assert doc["amenities"] == list(catalog.AMENITIES)
+        assert {len(values) for values in cols.values()} == {4}
+
+    def test_caching_by_version(self, client):
+        version = catalog.generation()[0]
+        current = client.get(f"/api/catalog.json?v={version}")
+        assert current.headers["Cache-Control"].endswith("immutable")
+        unversioned = client.get("/api/catalog.json")
+        assert unversioned.headers["Cache-Control"] == "no-cache"
+        assert client.get("/api/catalog.json", headers={"If-None-Match": unversioned.headers["ETag"].strip('"')}
+                          ).status_code == 304
+
+        client.post("/add", data={**TestAddCafe.VALID, "name": "Versioned"})
+        doc = client.get(f"/api/catalog.json?v={version}").json
+        assert doc["version"] > version and "Versioned" in doc["columns"]["name"]
+        assert client.get(f"/api/catalog.json?v={version}").headers["Cache-Control"] == "no-cache"
+
+    def test_gzip_when_accepted(self, client):
+        resp = client.get("/api/catalog.json", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["Content-Encoding"] == "gzip"
+        import gzip
+        assert json.loads(gzip.decompress(resp.data))["columns"]["id"]
+
+    def test_page_ships_card_template_in_client_mode(self, app, client):
+        app.config["LIVE_UPDATES"] = False                                 # live updates ship it too
+        assert b'id="card-template"' not in client.get("/").data
+        app.config["FILTER_MODE"] = "client"
+        page = client.get("/?wifi=1").data.decode()
+        assert 'id="card-template"' in page and 'data-amenity="has_toilet"' in page
+        assert f"/api/catalog.json?v={catalog.generation()[0]}" in page
+        assert 'id="empty-state" style="display:none"' in page
+        with client.session_transaction() as sess:
+            sess["is_admin"] = True
+        assert b'id="card-template"' not in client.get("/").data           # admins stay server-side
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# 18. PRICE & SEAT RANGES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+
+class TestPriceAndSeats:
+    """Numeric price_pence / seats_min / seats_max: parsed on write, filtered and sorted in SQL."""
+
+    def _names(self, html: bytes) -> list[str]:
+        names = ("Full House", "No Amenities", "Sockets Only", "WiFi Only", "Mystery Seats")
+        found = [(html.find(f"{name}</h3>".encode()), name) for name in names]
+        return [name for position, name in sorted(found) if position >= 0]
+
+    def _cursor(self, html: bytes) -> str:
+        return TestPagination._cursor(self, html)
+
+    def test_text_columns_are_parsed_on_write(self, app):
+        cafe = Cafe.query.filter_by(name="Full House").one()
+        assert (cafe.price_pence, cafe.seats_min, cafe.seats_max) == (300, 50, None)
+        cafe.coffee_price, cafe.seats = "£2.45", "20-30"
+        assert (cafe.price_pence, cafe.seats_min, cafe.seats_max) == (245, 20, 30)
+        cafe.coffee_price = "ask at the counter"
+        assert cafe.price_pence is None
+
+    @pytest.mark.parametrize("seats,price", [("99999999999999999999999", "£99999999999999999999999"),
+                                             ("3000000000", "£21474837")])
+    def test_out_of_range_numbers_are_stored_unparsed(self, client, seats, price):
+        resp = client.post("/add", data={**TestAddCafe.VALID, "name": "Huge", "seats": seats, "coffee_price": price})
+        assert resp.status_code == 302
+        cafe = Cafe.query.filter_by(name="Huge").one()
+        assert (cafe.seats, cafe.coffee_price) == (seats, price)
+        assert (cafe.price_pence, cafe.seats_min, cafe.seats_max) == (None, None, None)
+
+    @pytest.mark.parametrize("query", ["max_price=99999999999999999999999", "min_seats=99999999999999999999999",
+                                       "min_seats=3000000000", "min_seats=-1"])
+    def test_out_of_range_query_numbers_are_ignored(self, client, query):
+        resp = client.get(f"/?{query}")
+        assert resp.status_code == 200 and len(self._names(resp.data)) == 4
+        huge_cursor = catalog.encode_cursor((10**30, "Full House", 3))
+        assert client.get(f"/cafes/page?sort=price&after={huge_cursor}").status_code == 400
+
+    def test_cheapest_coffee_with_enough_seats(self, client):
+        resp = client.get("/?min_seats=20&sort=price")
+        assert self._names(resp.data) == ["Sockets Only", "Full House"]
+        assert b"<strong class=\"text-stone-700 font-semibold\">2</strong>" in resp.data
+        assert b'<option value="price" selected>' in resp.data
+
+    def test_max_price_in_pounds(self, client):
+        assert self._names(client.get("/?max_price=2.50").data) == ["No Amenities", "Sockets Only", "WiFi Only"]
+        assert self._names(client.get("/?max_price=2.5&wifi=1").data) == ["WiFi Only"]
+
+    def test_sorted_pages_keep_unknown_values_last(self, app, client):
+        client.post("/add", data={**TestAddCafe.VALID, "name": "Mystery Seats", "seats": ""})
+        app.config["PAGE_SIZE"] = 2
+        first = client.get("/?sort=seats").data
+        assert self._names(first) == ["Full House", "Sockets Only"]
+        cursor = self._cursor(first)
+        second = client.get(f"/cafes/page?sort=seats&after={cursor}").data
+        assert self._names(second) == ["WiFi Only", "No Amenities"]
+        cursor = self._cursor(second)
+        last = client.get(f"/cafes/page?sort=seats&after={cursor}").data
+        assert self._names(last) == ["Mystery Seats"] and b'data-next=""' in last
+
+    def test_sorted_cursor_shape_is_checked(self, client):
+        name_cursor = catalog.encode_cursor(("Full House", 3))
+        assert client.get(f"/cafes/page?sort=price&after={name_cursor}").status_code == 400
+        assert client.get(f"/cafes/page?after={catalog.encode_cursor((300, 'Full House', 3))}").status_code == 400
+
+    def test_ranged_pages_are_server_rendered(self, app, client):
+        app.config["FILTER_MODE"] = "client"
+        page = client.get("/?sort=price").get_data(as_text=True)
+        assert "/api/catalog.json" not in page and "new EventSource" not in page
+
+    def test_export_applies_ranges(self, client):
+        resp = client.get("/api/cafes/export.ndjson?min_seats=20")
+        assert {json.loads(line)["name"] for line in resp.data.decode().splitlines()} == {"Sockets Only", "Full House"}
+
+    def test_bootstrap_backfills_existing_rows(self, app):
+        import bootstrap
+        from sqlalchemy import text
+        db.session.execute(text("UPDATE cafe SET price_pence = NULL, seats_min = NULL, seats_max = NULL"))
+        db.session.commit()
+        assert bootstrap.ensure_schema(app) is True
+        db.session.expire_all()
+        assert {c.name: (c.price_pence, c.seats_min, c.seats_max) for c in Cafe.query} == {
+            "WiFi Only": (200, 10, 10), "Sockets Only": (250, 20, 20),
+            "Full House": (300, 50, None), "No Amenities": (150, 5, 5),
+        }
+
+    def _plan(self, client, url: str, marker: str) -> str:
+        """SQLite's query plan for the statement containing *marker* that *url* runs."""
+        from sqlalchemy import event
+        statements = []
+        record = lambda conn, cursor, sql, params, context, many: statements.append((sql, params))
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            client.get(url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        sql, params = next((sql, params) for sql, params in statements if marker in sql)
+        return " ".join(row[-1] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params))
+
+    def test_ranges_and_sorts_are_index_scans(self, client):
+        for sort in ("price", "seats"):
+            plan = self._plan(client, f"/?sort={sort}", "ORDER BY cafe.")
+            assert f"USING INDEX ix_cafe_city_{sort}" in plan and "TEMP B-TREE" not in plan
+        plan = self._plan(client, "/?min_seats=20&sort=price", "ORDER BY cafe.price_pence")
+        assert "USING INDEX ix_cafe_city_" in plan and "SCAN cafe" not in plan
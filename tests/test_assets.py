@@ -0,0 +1,81 @@
+"""Asset pipeline tests: utility CSS generation, hashed build output, /assets/ serving."""
+import glob
+import gzip
+import json
+import os
+import re
+
+import assets
+import tailwind
+
+# Component classes defined in assets/app.css or a template's own <style>.
+COMPONENT_CLASSES = {"cafe-card", "chip", "chip-active", "chip-count", "form-input", "shake"}
+
+
+def test_utilities_with_variants_modifiers_and_arbitrary_values():
+    css, used = tailwind.generate([
+        "py-1.5", "top-1/2", "-translate-y-1/2", "bg-amber-900/90", "bg-[#FDFAF6]", "text-[1.1rem]",
+        "hover:bg-amber-900", "focus:ring-amber-700", "lg:grid-cols-3", "space-y-5", "not-a-class",
+    ])
+    assert ".py-1\\.5{padding-top:0.375rem;padding-bottom:0.375rem}" in css
+    assert ".top-1\\/2{top:50%}" in css and ".-translate-y-1\\/2{transform:translateY(-50%)}" in css
+    assert ".bg-amber-900\\/90{background-color:rgb(120 53 15 / 0.9)}" in css
+    assert ".bg-\\[\\#FDFAF6\\]{background-color:#fdfaf6}" in css
+    assert ".text-\\[1\\.1rem\\]{font-size:1.1rem}" in css
+    assert ".hover\\:bg-amber-900:hover{background-color:#78350f}" in css
+    assert ".space-y-5>:not([hidden])~:not([hidden]){margin-top:1.25rem}" in css
+    assert css.endswith("@media (min-width:1024px){.lg\\:grid-cols-3{grid-template-columns:repeat(3,minmax(0,1fr))}}")
+    assert "not-a-class" not in used
+
+
+def test_every_template_class_is_generated_or_a_component():
+    _, used = tailwind.generate(assets.template_classes())
+    missing = set()
+    for path in glob.glob(os.path.join(assets.TEMPLATE_DIR, "*.html")):
+        with open(path, encoding="utf-8") as fh:
+            for attr in re.findall(r'class="([^"]*)"', fh.read()):
+                missing |= set(re.sub(r"\{[{%].*?[%}]\}", " ", attr).split())
+    assert missing - set(used) - COMPONENT_CLASSES == set()
+
+
+def test_build_writes_hashed_precompressed_files(tmp_path):
+    manifest = assets.build(out_dir=str(tmp_path))
+    assert set(manifest) >= {"app.css", "leaflet.css", "leaflet.js", "images/layers.png"}
+    assert re.fullmatch(r"app\.[0-9a-f]{10}\.css", manifest["app.css"])
+    app_css = tmp_path / manifest["app.css"]
+    assert gzip.decompress((tmp_path / (manifest["app.css"] + ".gz")).read_bytes()) == app_css.read_bytes()
+    assert "/*" not in app_css.read_text() and ".chip-active{" in app_css.read_text()
+    leaflet_css = (tmp_path / manifest["leaflet.css"]).read_text()
+    assert f"url({manifest['images/layers.png']})" in leaflet_css
+    assert f"url({manifest['fonts/inter-latin.woff2']})" in app_css.read_text()
+    assert not (tmp_path / (manifest["fonts/inter-latin.woff2"] + ".gz")).exists()
+    assert json.loads((tmp_path / "manifest.json").read_text()) == manifest
+    assert assets.build(out_dir=str(tmp_path)) == manifest        # deterministic
+
+
+def test_pages_link_only_self_hosted_assets(client):
+    html = client.get("/").get_data(as_text=True)
+    assert "cdn.tailwindcss.com" not in html and "unpkg.com" not in html and "googleapis" not in html
+    assert re.search(r'href="/assets/app\.[0-9a-f]{10}\.css"', html)
+    assert re.search(r'src="/assets/leaflet\.[0-9a-f]{10}\.js"', html)
+
+
+def test_assets_served_precompressed_and_immutable(app, client):
+    name = app.extensions["workbrew.assets"]["app.css"]
+    plain = client.get(f"/assets/{name}")
+    assert plain.status_code == 200 and plain.mimetype == "text/css"
+    assert plain.headers["Cache-Control"] == assets.IMMUTABLE
+    assert "Content-Encoding" not in plain.headers and "Accept-Encoding" in plain.headers["Vary"]
+
+    gz = client.get(f"/assets/{name}", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gz.data) == plain.data
+    if assets.brotli is not None:
+        br = client.get(f"/assets/{name}", headers={"Accept-Encoding": "gzip, br"})
+        assert br.headers["Content-Encoding"] == "br"
+        assert assets.brotli.decompress(br.data) == plain.data
+
+
+def test_missing_or_escaping_asset_is_404(client):
+    assert client.get("/assets/app.0000000000.css").status_code == 404
+    assert client.get("/assets/../app.py").status_code == 404
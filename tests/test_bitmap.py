@@ -0,0 +1,95 @@
+"""Unit tests for the bitmap filter index."""
+import random
+
+from bitmap import BitmapIndex
+
+
+def _index(rows):
+    index = BitmapIndex()
+    for row_id, name, facets in rows:
+        index.insert(row_id, (name, row_id), name, facets)
+    return index
+
+
+def test_rows_come_back_in_sort_order():
+    index = _index([(1, "c", []), (2, "a", []), (3, "b", [])])
+    assert index.rows(index.match([])) == ["a", "b", "c"]
+
+
+def test_match_is_intersection():
+    index = _index([
+        (1, "a", ["wifi", "sockets"]),
+        (2, "b", ["wifi"]),
+        (3, "c", ["sockets"]),
+    ])
+    assert index.rows(index.match(["wifi"])) == ["a", "b"]
+    assert index.rows(index.match(["wifi", "sockets"])) == ["a"]
+    assert index.match(["unknown"]) == 0
+
+
+def test_insert_and_remove_shift_bits():
+    index = _index([(1, "a", ["x"]), (3, "c", ["x"])])
+    index.insert(2, ("b", 2), "b", [])          # lands between a and c
+    assert index.rows(index.match(["x"])) == ["a", "c"]
+    index.remove(1)
+    assert index.rows(index.match(["x"])) == ["c"]
+    assert index.rows(index.match([])) == ["b", "c"]
+    index.remove(3)
+    assert index.facet_names() == []
+
+
+def test_matches_naive_filter_after_random_writes():
+    rng = random.Random(3)
+    facets = ["f0", "f1", "f2"]
+    truth = {}
+    index = BitmapIndex()
+    for step in range(500):
+        row_id = rng.randrange(60)
+        if rng.random() < 0.3:
+            index.remove(row_id)
+            truth.pop(row_id, None)
+        else:
+            tags = [f for f in facets if rng.random() < 0.5]
+            name = f"cafe-{rng.randrange(1000):04d}"
+            index.insert(row_id, (name, row_id), row_id, tags)
+            truth[row_id] = ((name, row_id), set(tags))
+    for want in ([], ["f0"], ["f1", "f2"], facets):
+        expected = [rid for key, rid in sorted((k, rid) for rid, (k, tags) in truth.items()
+                                               if set(want) <= tags)]
+        assert index.rows(index.match(want)) == expected
+
+
+def test_keyset_pages_cover_matches_exactly_once():
+    index = BitmapIndex()
+    for i in range(1000):
+        index.insert(i, (f"cafe-{i:04d}", i), i, ["odd"] if i % 2 else [])
+    bits = index.match(["odd"])
+    seen, after = [], None
+    while True:
+        rows, after = index.page(bits, after, limit=37)
+        seen.extend(rows)
+        if after is None:
+            break
+    assert seen == list(range(1, 1000, 2))
+
+
+def test_keyset_cursor_survives_deleted_row():
+    index = _index([(1, "a", []), (2, "b", []), (3, "c", [])])
+    rows, after = index.page(index.match([]), limit=2)
+    assert rows == ["a", "b"]
+    index.remove(2)                       # the cursor row itself goes away
+    assert index.page(index.match([]), after, limit=2) == (["c"], None)
+
+
+def test_load_matches_repeated_insert():
+    rng = random.Random(7)
+    rows = [(i, f"name{rng.randrange(1000):04d}", [f for f in ("wifi", "sockets", "calls") if rng.random() < 0.5])
+            for i in range(300)]
+    incremental = _index(rows)
+    bulk = BitmapIndex()
+    bulk.load((row_id, (name, row_id), name, facets) for row_id, name, facets in rows)
+    for facets in ([], ["wifi"], ["wifi", "calls"], ["sockets", "calls"]):
+        assert bulk.rows(bulk.match(facets)) == incremental.rows(incremental.match(facets))
+    bulk.remove(rows[0][0])
+    bulk.insert(1000, ("aaaa", 1000), "aaaa", ["wifi"])
+    assert bulk.rows(bulk.match(["wifi"]))[0] == "aaaa"
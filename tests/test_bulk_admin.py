@@ -0,0 +1,185 @@
+"""Admin bulk endpoints: multi-delete, batch amenity edits and CSV import."""
+import io
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+import catalog
+import facets
+from extensions import db
+from models import Cafe, City, PendingJob
+
+CSV_HEADER = "name,location,map_url,img_url,seats,coffee_price,has_wifi,has_sockets,lat,lng\n"
+
+
+def _ids(*names):
+    return [cafe.id for cafe in Cafe.query.filter(Cafe.name.in_(names))]
+
+
+def _upload(client, text, name="cafes.csv"):
+    return client.post("/admin/cafes/import", data={"file": (io.BytesIO(text.encode()), name)},
+                       content_type="multipart/form-data")
+
+
+# ── Access ───────────────────────────────────────────────────────────────────
+
+
+def test_bulk_endpoints_are_admin_only(client):
+    for path in ("/admin/cafes/delete", "/admin/cafes/flags", "/admin/cafes/import"):
+        assert client.post(path, json={"ids": [1]}).status_code == 403
+    assert client.get("/admin/bulk").status_code == 403
+    assert Cafe.query.count() == 4
+
+
+def test_bulk_endpoints_require_csrf(app, admin_client):
+    app.config["WTF_CSRF_ENABLED"] = True
+    assert admin_client.post("/admin/cafes/delete", json={"ids": _ids("WiFi Only")}).status_code == 400
+    assert Cafe.query.count() == 4
+    page = admin_client.get("/admin/bulk").get_data(as_text=True)
+    assert 'name="csrf_token"' in page and "X-CSRFToken" in page
+
+
+# ── Delete ───────────────────────────────────────────────────────────────────
+
+
+def test_delete_by_ids_reports_unknown_ids(admin_client):
+    catalog.filter_index()                                   # indexes loaded before the write
+    ids = _ids("WiFi Only", "Full House")
+    resp = admin_client.post("/admin/cafes/delete", json={"ids": [ids[0], 999, "x", ids[1]]})
+    assert resp.status_code == 200
+    report = resp.json
+    assert report["deleted"] == 2 and sorted(report["ids"]) == sorted(ids)
+    assert report["errors"] == [
+        {"row": 3, "id": "x", "errors": {"id": ["Not a cafe id."]}},
+        {"row": 2, "id": 999, "errors": {"id": ["No such cafe."]}},
+    ]
+    assert {c.name for c in Cafe.query} == {"Sockets Only", "No Amenities"}
+    assert facets.read()["amenities"]["has_wifi"] == 0
+    assert "Full House" not in admin_client.get("/").get_data(as_text=True)
+
+
+def test_delete_by_filter_and_form_ids(admin_client):
+    resp = admin_client.post("/admin/cafes/delete", data={"location": "Peckham", "wifi": "1"})
+    assert resp.json["deleted"] == 1 and resp.json["errors"] == []
+    assert db.session.execute(select(func.count()).where(Cafe.name == "WiFi Only")).scalar() == 0
+
+    ids = _ids("Sockets Only", "No Amenities")
+    resp = admin_client.post("/admin/cafes/delete", data={"ids": f"{ids[0]}, {ids[1]}"})
+    assert resp.json["deleted"] == 2
+
+
+def test_delete_without_target_is_rejected(admin_client):
+    resp = admin_client.post("/admin/cafes/delete", json={})
+    assert resp.status_code == 400 and "filter" in resp.json["error"]
+    assert Cafe.query.count() == 4
+
+
+def test_delete_drops_pending_jobs(admin_client):
+    import jobs
+    cafe_id = _ids("WiFi Only")[0]
+    jobs.enqueue(jobs.JOB_GEOCODE, cafe_id)
+    db.session.commit()
+    admin_client.post("/admin/cafes/delete", json={"ids": [cafe_id]})
+    assert PendingJob.query.count() == 0
+
+
+# ── Flags ────────────────────────────────────────────────────────────────────
+
+
+def test_flags_by_ids_and_filter(admin_client):
+    ids = _ids("No Amenities", "Sockets Only")
+    resp = admin_client.post("/admin/cafes/flags", json={"ids": ids + [999], "set_has_wifi": True})
+    assert resp.json["updated"] == 2 and [e["id"] for e in resp.json["errors"]] == [999]
+    db.session.expire_all()
+    assert Cafe.query.filter_by(has_wifi=True).count() == 4
+    assert facets.read()["amenities"]["has_wifi"] == 4
+
+    resp = admin_client.post("/admin/cafes/flags", data={"location": "Peckham", "set_can_take_calls": "1",
+                                                         "set_has_toilet": "0"})
+    assert resp.json["updated"] == 2
+    html = admin_client.get("/?calls=1").get_data(as_text=True)
+    assert "WiFi Only" in html and "No Amenities" in html
+
+
+def test_flags_need_a_value(admin_client):
+    resp = admin_client.post("/admin/cafes/flags", json={"ids": [1]})
+    assert resp.status_code == 400 and "set_has_wifi" in resp.json["error"]
+
+
+# ── CSV import ───────────────────────────────────────────────────────────────
+
+
+def test_import_validates_like_the_add_form(admin_client):
+    text = CSV_HEADER + (
+        "New Place,Brixton,https://maps.google.com/?q=a,https://example.com/a.jpg,10,£2.00,yes,,51.46,-0.11\n"
+        ",Brixton,https://maps.google.com/?q=b,https://example.com/b.jpg,,,,,,\n"
+        "Bad Url,Brixton,not a url,https://example.com/c.jpg,,,,,,\n"
+        '"Quoted, Name",Soho,https://maps.google.com/?q=d,https://example.com/d.jpg,"5\n0",,1,1,,\n'
+        "Bad Lat,Soho,https://maps.google.com/?q=e,https://example.com/e.jpg,,,,,north,\n"
+        "Full House,Shoreditch,https://maps.google.com/?q=f,https://example.com/f.jpg,60,£3.10,1,1,,\n"
+    )
+    resp = _upload(admin_client, text)
+    assert resp.status_code == 200
+    report = resp.json
+    assert report["imported"] == 3
+    assert report["errors"] == [
+        {"row": 3, "errors": {"name": ["This field is required."]}},
+        {"row": 4, "errors": {"map_url": ["Invalid URL."]}},
+        {"row": 7, "errors": {"row": ["lat is not a number: 'north'"]}},
+    ]
+    db.session.expire_all()
+    new = Cafe.query.filter_by(name="New Place").one()
+    assert new.has_wifi and not new.has_sockets and new.lat == 51.46
+    assert Cafe.query.filter_by(name="Quoted, Name").one().seats == "5\n0"
+    full = Cafe.query.filter_by(name="Full House").one()
+    assert full.seats == "60" and full.lat == 51.52            # existing coordinates kept
+    # Only the cafe without coordinates needs geocoding.
+    assert [j.cafe_id for j in PendingJob.query.filter_by(kind="geocode")] == _ids("Quoted, Name")
+    assert "Quoted, Name" in admin_client.get("/").get_data(as_text=True)
+    assert dict(facets.read()["locations"])["Soho"] == 1
+
+
+def test_import_keeps_same_named_cafes_in_other_cities(admin_client):
+    db.session.add(City(slug="manchester", name="Manchester", geocode_suffix="Manchester, UK",
+                        countrycodes="gb", lat=53.480, lng=-2.242, zoom=13))
+    london = Cafe.query.filter_by(name="Full House").one()
+    london.lat = london.lng = None
+    db.session.commit()
+    london_id = london.id
+    resp = _upload(admin_client, "city," + CSV_HEADER
+                   + "manchester,Full House,Ancoats,https://maps.google.com/?q=m,https://example.com/m.jpg,8,£2.20,1,,,\n")
+    assert resp.json == {"imported": 1, "errors": []}
+    db.session.expire_all()
+    assert {(c.city, c.location, c.seats) for c in Cafe.query.filter_by(name="Full House")} == {
+        ("london", "Shoreditch", "50+"), ("manchester", "Ancoats", "8")}
+    manchester_id = Cafe.query.filter_by(city="manchester", name="Full House").one().id
+    assert [j.cafe_id for j in PendingJob.query.filter_by(kind="geocode")] == [manchester_id]   # not london_id
+
+
+def test_import_rejects_missing_columns_and_files(admin_client):
+    resp = _upload(admin_client, "name,location\nA,Soho\n")
+    assert resp.status_code == 400 and "map_url" in resp.json["error"]
+    assert admin_client.post("/admin/cafes/import", data={}).status_code == 400
+    assert Cafe.query.count() == 4
+
+
+def test_import_thousands_of_rows_quickly(admin_client):
+    rows = "".join(
+        f"Bulk {i},Area {i % 20},https://maps.google.com/?q={i},https://example.com/{i}.jpg,10,£2,1,,51.5,-0.1\n"
+        for i in range(3000)
+    )
+    started = time.perf_counter()
+    resp = _upload(admin_client, CSV_HEADER + rows)
+    assert resp.json == {"imported": 3000, "errors": []}
+    ids = [cafe_id for (cafe_id,) in db.session.execute(select(Cafe.id).where(Cafe.name.like("Bulk %")))]
+    assert admin_client.post("/admin/cafes/flags", json={"ids": ids, "set_has_toilet": True}).json["updated"] == 3000
+    assert admin_client.post("/admin/cafes/delete", json={"ids": ids}).json["deleted"] == 3000
+    assert time.perf_counter() - started < 3.0       # generous for CI; all three take ~0.6 s locally
+    assert Cafe.query.count() == 4
+
+
+@pytest.mark.parametrize("payload", [{"ids": []}, {"ids": "  "}])
+def test_empty_id_list_changes_nothing(admin_client, payload):
+    resp = admin_client.post("/admin/cafes/delete", json=payload)
+    assert resp.json == {"deleted": 0, "ids": [], "errors": []}
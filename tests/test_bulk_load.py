@@ -0,0 +1,101 @@
+"""Bulk loader tests: file parsing, chunked upserts and per-row error reporting."""
+import json
+
+import pytest
+
+import bulk_load
+import catalog
+import facets
+from extensions import db
+from models import Cafe
+
+
+def _record(name, **overrides):
+    record = dict(name=name, map_url="http://g.co/b", img_url="http://img/b.jpg",
+                  location="Brixton", has_wifi="true", has_sockets="0",
+                  has_toilet="yes", can_take_calls="", seats="10-20", coffee_price="£2.20",
+                  lat="51.46", lng="-0.11")
+    record.update(overrides)
+    return record
+
+
+def _load(records, **kwargs):
+    return bulk_load.load(records, report=lambda line: None, **kwargs)
+
+
+def test_iter_records_reads_csv_and_ndjson(tmp_path):
+    csv_path = tmp_path / "cafes.csv"
+    csv_path.write_text("name,location\nA,Peckham\nB,Soho\n", encoding="utf-8")
+    ndjson_path = tmp_path / "cafes.ndjson"
+    ndjson_path.write_text('{"name": "C"}\n\n{"name": "D"}\n', encoding="utf-8")
+
+    assert [r["name"] for r in bulk_load.iter_records(str(csv_path))] == ["A", "B"]
+    assert [r["name"] for r in bulk_load.iter_records(str(ndjson_path))] == ["C", "D"]
+    with pytest.raises(ValueError):
+        list(bulk_load.iter_records(str(csv_path), fmt="xml"))
+
+
+def test_normalize_coerces_types_and_rejects_bad_rows():
+    row = bulk_load.normalize(_record("Typed"))
+    assert row["has_wifi"] is True and row["has_sockets"] is False
+    assert row["can_take_calls"] is False and row["lat"] == 51.46
+    assert (row["price_pence"], row["seats_min"], row["seats_max"]) == (220, 10, 20)
+    assert bulk_load.normalize(_record("Forged", price_pence="1"))["price_pence"] == 220   # never read from the file
+
+    with pytest.raises(bulk_load.RowError, match="map_url"):
+        bulk_load.normalize(_record("No Link", map_url=" "))
+    with pytest.raises(bulk_load.RowError, match="lat"):
+        bulk_load.normalize(_record("Bad Lat", lat="north"))
+
+
+def test_load_inserts_in_chunks_and_bumps_generation(app):
+    before = catalog._read_state("london")[0]
+    result = _load([_record(f"Bulk {n}") for n in range(7)], chunk_size=3)
+    assert result["rows"] == 7 and result["errors"] == []
+    assert Cafe.query.filter(Cafe.name.like("Bulk %")).count() == 7
+    assert catalog._read_state("london")[0] == before + 4          # one bump per chunk + the facet recount
+
+
+def test_load_upserts_and_keeps_coordinates(app):
+    _load([_record("Full House", location="Old Street", lat="", lng="", coffee_price="£3.40")])
+    db.session.expire_all()
+    cafe = Cafe.query.filter_by(name="Full House").one()
+    assert cafe.location == "Old Street" and cafe.coffee_price == "£3.40"
+    assert (cafe.lat, cafe.lng) == (51.52, -0.08)       # blank file coords never erase
+    assert Cafe.query.count() == 4                      # updated in place, no duplicate
+    locations = dict(facets.read()["locations"])          # facets recounted
+    assert locations["Old Street"] == 1 and "Shoreditch" not in locations
+
+
+def test_load_is_idempotent(app):
+    records = [_record("Again 1"), _record("Again 2")]
+    _load(records)
+    ids = {c.name: c.id for c in Cafe.query.filter(Cafe.name.like("Again %"))}
+    _load(records)
+    assert {c.name: c.id for c in Cafe.query.filter(Cafe.name.like("Again %"))} == ids
+
+
+def test_new_photo_url_drops_thumbnails(app):
+    db.session.execute(db.update(Cafe).values(thumb_key="f" * 32))
+    db.session.commit()
+    _load([_record("Full House", img_url="http://img/3.jpg", thumb_key="ignored"),
+           _record("WiFi Only", img_url="http://img/new.jpg")])
+    db.session.expire_all()
+    assert Cafe.query.filter_by(name="Full House").one().thumb_key == "f" * 32   # same photo
+    assert Cafe.query.filter_by(name="WiFi Only").one().thumb_key is None        # re-render
+
+
+def test_load_reports_bad_rows_and_keeps_good_ones(app):
+    result = _load([_record("Good"), {"name": "Broken"}, _record("Also Good", lat="x")])
+    assert result["rows"] == 1
+    assert [n for n, _ in result["errors"]] == [2, 3]
+    assert Cafe.query.filter_by(name="Good").count() == 1
+
+
+def test_cli_loads_ndjson_file(app, tmp_path, capsys, monkeypatch):
+    path = tmp_path / "cafes.ndjson"
+    path.write_text("\n".join(json.dumps(_record(f"Cli {n}")) for n in range(3)), encoding="utf-8")
+    monkeypatch.setattr("app.app", app)
+    assert bulk_load.main([str(path), "--chunk-size", "2"]) == 0
+    assert "Upserted 3 rows" in capsys.readouterr().out
+    assert Cafe.query.filter(Cafe.name.like("Cli %")).count() == 3
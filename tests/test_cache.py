@@ -0,0 +1,71 @@
+"""Unit tests for the versioned response and fragment caches and the single-flight helper."""
+import threading
+import time
+
+from cache import FragmentCache, ResponseCache, SingleFlight
+
+
+def test_version_change_is_a_miss():
+    cache = ResponseCache()
+    cache.get_or_render("k", 1, None, lambda: "v1")
+    assert cache.get_or_render("k", 1, None, lambda: "other").body == b"v1"
+    assert cache.get_or_render("k", 2, None, lambda: "v2").body == b"v2"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_bound():
+    cache = ResponseCache(max_entries=2)
+    for key in "abc":
+        cache.get_or_render(key, 1, None, lambda: key)
+    assert cache.get("a", 1) is None
+    assert cache.get("c", 1) is not None
+
+
+def test_single_flight_collapses_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def slow():
+        calls.append(1)
+        gate.wait(1)
+        return "done"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == ["done"] * 5
+    assert len(calls) == 1
+
+
+def test_fragment_keyed_by_version_and_variant():
+    cache = FragmentCache()
+    assert cache.get_or_render(1, "v1", False, lambda: "a") == "a"
+    assert cache.get_or_render(1, "v1", False, lambda: "other") == "a"
+    assert cache.get_or_render(1, "v1", True, lambda: "admin") == "admin"
+    assert cache.get_or_render(1, "v2", False, lambda: "b") == "b"
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_fragment_invalidate_drops_every_entry_for_the_item():
+    cache = FragmentCache()
+    for variant in (False, True):
+        cache.get_or_render(1, "v1", variant, lambda: "x")
+    cache.get_or_render(2, "v1", False, lambda: "y")
+    cache.invalidate(1)
+    assert len(cache) == 1
+    assert cache.get_or_render(1, "v1", False, lambda: "fresh") == "fresh"
+
+
+def test_fragment_lru_bound():
+    cache = FragmentCache(max_entries=2)
+    for item in (1, 2, 3):
+        cache.get_or_render(item, "v", False, lambda: str(item))
+    assert len(cache) == 2
+    cache.invalidate(1)                      # already evicted: a no-op
+    assert cache.get_or_render(1, "v", False, lambda: "again") == "again"
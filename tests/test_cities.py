@@ -0,0 +1,132 @@
+"""Multi-city catalog: per-city listings, facets, caches, geocoding and URLs."""
+import pytest
+from flask import url_for
+from sqlalchemy import inspect, text
+
+import bootstrap
+import bulk_load
+import catalog
+import facets
+from extensions import db
+from models import Cafe, City, Location
+
+MANCHESTER = dict(slug="manchester", name="Manchester", geocode_suffix="Manchester, UK",
+                  countrycodes="gb", lat=53.480, lng=-2.242, zoom=13)
+# The cafe table as it was before cities (and the parsed price/seat columns).
+OLD_CAFE_COLUMNS = ("id, name, map_url, img_url, location, has_sockets, has_toilet, has_wifi, can_take_calls,"
+                    " seats, coffee_price, lat, lng, thumb_key")
+OLD_CAFE_TABLE = (
+    "CREATE TABLE cafe (id INTEGER PRIMARY KEY, name VARCHAR(250) NOT NULL, map_url VARCHAR(500) NOT NULL,"
+    " img_url VARCHAR(500) NOT NULL, location VARCHAR(250) NOT NULL, has_sockets BOOLEAN NOT NULL,"
+    " has_toilet BOOLEAN NOT NULL, has_wifi BOOLEAN NOT NULL, can_take_calls BOOLEAN NOT NULL,"
+    " seats VARCHAR(250), coffee_price VARCHAR(250), lat FLOAT, lng FLOAT, thumb_key VARCHAR(32), UNIQUE (name))"
+)
+VALID = {"map_url": "https://maps.google.com/?q=x", "img_url": "https://example.com/x.jpg",
+         "seats": "10-20", "coffee_price": "£2.80", "has_wifi": "y"}
+
+
+@pytest.fixture
+def two_cities(app):
+    db.session.add(City(**MANCHESTER))
+    db.session.add(Cafe(city="manchester", name="Northern Quarter Beans", map_url="http://g.co/9",
+                        img_url="http://img/9.jpg", location="Ancoats", has_wifi=True, lat=53.484, lng=-2.228))
+    db.session.flush()
+    facets.rebuild(db.session.connection())
+    db.session.commit()
+    return app
+
+
+def test_each_city_lists_only_its_own_cafes(two_cities, client):
+    london = client.get("/").get_data(as_text=True)
+    manchester = client.get("/manchester/").get_data(as_text=True)
+    assert "Full House</h3>" in london and "Northern Quarter Beans" not in london
+    assert "Northern Quarter Beans</h3>" in manchester and "Full House" not in manchester
+    assert "across Manchester" in manchester and "setView([53.48, -2.242], 13)" in manchester
+    assert 'href="/manchester/add"' in manchester            # url_for keeps the city prefix
+    assert client.get("/london/").get_data(as_text=True).count('class="cafe-card') == 4
+
+
+def test_facets_search_and_map_are_per_city(two_cities, client):
+    assert facets.read("manchester") == {"locations": [("Ancoats", 1)],
+                                         "amenities": {"has_wifi": 1, "has_sockets": 0,
+                                                       "can_take_calls": 0, "has_toilet": 0}}
+    assert "Ancoats" not in dict(facets.read()["locations"])
+    assert [r["name"] for r in client.get("/manchester/search?q=beans").json["results"]] == [
+        "Northern Quarter Beans"]
+    assert client.get("/search?q=beans").json["count"] == 0
+    features = client.get("/manchester/api/map?bbox=-2.4,53.4,-2.1,53.6&zoom=12").json["features"]
+    assert sum(f.get("count", 1) for f in features) == 1
+    doc = client.get("/manchester/api/catalog.json").json
+    assert doc["columns"]["name"] == ["Northern Quarter Beans"]
+    export = client.get("/manchester/api/cafes/export.ndjson").get_data(as_text=True)
+    assert export.count("\n") == 1 and '"city": "manchester"' in export
+
+
+def test_one_cafe_name_in_two_cities(two_cities, client):
+    resp = client.post("/manchester/add", data={**VALID, "name": "Full House", "location": "Ancoats"})
+    assert resp.status_code == 302
+    again = client.post("/manchester/add", data={**VALID, "name": "Full House", "location": "Ancoats"})
+    assert again.status_code == 200 and "Full House is already listed in Manchester." in again.get_data(as_text=True)
+    assert {(c.city, c.location) for c in Cafe.query.filter_by(name="Full House")} == {
+        ("london", "Shoreditch"), ("manchester", "Ancoats")}
+
+    bulk_load.load([{**VALID, "city": "manchester", "name": "Full House", "location": "Deansgate"}],
+                   report=lambda line: None)
+    assert {(c.city, c.location) for c in Cafe.query.filter_by(name="Full House")} == {
+        ("london", "Shoreditch"), ("manchester", "Deansgate")}
+
+
+def test_unknown_city_is_404(client):
+    assert client.get("/atlantis/").status_code == 404
+    assert client.get("/atlantis/api/map?bbox=0,0,1,1&zoom=5").status_code == 404
+
+
+def test_add_in_a_city_leaves_other_cities_cached(two_cities, client):
+    client.get("/")
+    london_generation = catalog.generation("london")[0]
+    resp = client.post("/manchester/add", data={**VALID, "name": "Piccadilly Pour", "location": "Piccadilly"})
+    assert resp.status_code == 302 and resp.headers["Location"] == "/manchester/"
+    assert Cafe.query.filter_by(name="Piccadilly Pour").one().city == "manchester"
+    assert catalog.generation("london")[0] == london_generation
+    assert "Piccadilly Pour</h3>" in client.get("/manchester/").get_data(as_text=True)
+    assert "Piccadilly Pour" not in client.get("/").get_data(as_text=True)
+    assert dict(facets.read("manchester")["locations"]) == {"Ancoats": 1, "Piccadilly": 1}
+
+
+def test_geocode_job_uses_the_city_scope(two_cities, client):
+    from test_app import _FakeGeocoder
+    client.post("/manchester/add", data={**VALID, "name": "Piccadilly Pour", "location": "Piccadilly"})
+    runner = two_cities.extensions["workbrew.jobs"]
+    runner.geocoder = fake = _FakeGeocoder(result=(53.477, -2.231))
+    assert runner.run_pending() == 1
+    assert fake.scopes == [("Manchester, UK", "gb")]
+
+
+def test_url_for_outside_a_city_uses_bare_paths(app):
+    with app.test_request_context("/"):
+        assert url_for("index") == "/"
+        assert url_for("map_data", city="manchester") == "/manchester/api/map"
+
+
+def test_schema_upgrade_adds_city_and_recounts_facets(app):
+    # A pre-multi-city database: no city column, cafe and location names unique on their own.
+    db.session.execute(text("ALTER TABLE cafe RENAME TO cafe_old"))
+    db.session.execute(text(OLD_CAFE_TABLE))
+    db.session.execute(text(f"INSERT INTO cafe SELECT {OLD_CAFE_COLUMNS} FROM cafe_old"))
+    db.session.execute(text("DROP TABLE cafe_old"))
+    db.session.execute(text("DROP TABLE location"))
+    db.session.execute(text("CREATE TABLE location (id INTEGER PRIMARY KEY, name VARCHAR(250) UNIQUE NOT NULL,"
+                            " cafe_count INTEGER NOT NULL)"))
+    db.session.execute(text("DROP TABLE city"))
+    db.session.commit()
+
+    assert bootstrap.ensure_schema(app) is True
+    inspector = inspect(db.engine)
+    assert "city" in {c["name"] for c in inspector.get_columns("cafe")}
+    assert {"ix_cafe_city_name", "ix_cafe_city_location"} <= {i["name"] for i in inspector.get_indexes("cafe")}
+    assert {cafe.city for cafe in Cafe.query} == {"london"}
+    assert db.session.get(City, "london").geocode_suffix == "London, UK"
+    assert {(row.city, row.name) for row in Location.query} >= {("london", "Peckham")}
+    assert dict(facets.read()["locations"])["Peckham"] == 2
+    assert [uc["column_names"] for uc in inspector.get_unique_constraints("cafe")] == [["city", "name"]]
+    assert Cafe.query.filter(Cafe.price_pence.is_not(None)).count() == 4    # added and backfilled
@@ -0,0 +1,146 @@
+"""Batch geocoder tests against a local stub Nominatim server."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import geocode
+from extensions import db
+from models import Cafe
+
+# Queries the stub knows; anything else gets an empty (not found) answer.
+KNOWN = {
+    "Geo One, Hackney, London, UK":  (51.545, -0.055),
+    "Geo Two, Soho, London, UK":     (51.513, -0.136),
+}
+
+
+class _StubNominatim(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["q"][0]
+        self.server.queries.append(query)
+        if self.server.fail:
+            self.send_response(self.server.fail_status)
+            self.end_headers()
+            return
+        hit = KNOWN.get(query)
+        body = json.dumps([{"lat": str(hit[0]), "lon": str(hit[1])}] if hit else [])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubNominatim)
+    server.queries = []
+    server.fail = False
+    server.fail_status = 503
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}/search"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def geocoder(stub, tmp_path):
+    g = geocode.Geocoder([geocode.Provider(stub.url, rate=1000)],
+                         geocode.GeocodeCache(str(tmp_path / "cache.db")))
+    yield g
+    g.close()
+
+
+def _add_missing(*names_locations):
+    for name, location in names_locations:
+        db.session.add(Cafe(name=name, location=location, map_url="http://g.co/x",
+                            img_url="http://img/x.jpg"))
+    db.session.commit()
+
+
+def test_lookup_is_cached_on_disk(stub, geocoder, tmp_path):
+    assert geocoder.geocode("Geo One", "Hackney") == (51.545, -0.055)
+    assert geocoder.geocode("Geo One", "Hackney") == (51.545, -0.055)
+    assert len(stub.queries) == 1
+
+    # A fresh geocoder on the same cache file never hits the network either.
+    again = geocode.Geocoder([geocode.Provider(stub.url, rate=1000)],
+                             geocode.GeocodeCache(str(tmp_path / "cache.db")))
+    assert again.geocode("Geo One", "Hackney") == (51.545, -0.055)
+    assert again.network_calls == 0
+    again.close()
+
+
+def test_misses_are_cached_but_outages_are_not(stub, geocoder):
+    assert geocoder.geocode("Nowhere", "Atlantis") is None
+    calls = len(stub.queries)
+    assert geocoder.geocode("Nowhere", "Atlantis") is None
+    assert len(stub.queries) == calls                 # miss answered from cache
+
+    stub.fail = True
+    with pytest.raises(geocode.GeocodeUnavailable):
+        geocoder.lookup("Geo Two, Soho, London, UK")
+    stub.fail = False
+    assert geocoder.lookup("Geo Two, Soho, London, UK") == (51.513, -0.136)
+
+
+def test_rate_limited_answers_are_not_retried_outside_the_bucket(stub, geocoder):
+    stub.fail, stub.fail_status = True, 429
+    with pytest.raises(geocode.GeocodeUnavailable):
+        geocoder.lookup("Geo One, Hackney, London, UK")
+    assert stub.queries == ["Geo One, Hackney, London, UK"]     # one request; the job backs off
+
+
+def test_token_bucket_paces_requests():
+    bucket = geocode.TokenBucket(rate=20)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # First token is banked; the next four wait 1/20 s each.
+    assert time.monotonic() - started >= 0.18
+
+
+def test_providers_from_env(monkeypatch):
+    monkeypatch.setenv("GEOCODE_PROVIDERS", "http://a/search@5, http://b/search")
+    providers = geocode.providers_from_env()
+    assert [p.url for p in providers] == ["http://a/search", "http://b/search"]
+    assert [p.bucket.rate for p in providers] == [5.0, 1.0]
+
+
+def test_run_commits_and_clears_checkpoint(app, geocoder, tmp_path):
+    _add_missing(("Geo One", "Hackney"), ("Geo Two", "Soho"), ("Lost Cafe", "Atlantis"))
+    checkpoint = tmp_path / "checkpoint.json"
+    geocode.run(app, geocoder, chunk_size=2, checkpoint_path=str(checkpoint))
+
+    db.session.expire_all()
+    assert Cafe.query.filter_by(name="Geo One").one().lat == 51.545
+    assert Cafe.query.filter_by(name="Geo Two").one().lng == -0.136
+    assert Cafe.query.filter_by(name="Lost Cafe").one().lat is None
+    assert not checkpoint.exists()
+
+
+def test_run_resumes_after_outage(app, stub, geocoder, tmp_path):
+    _add_missing(("Geo One", "Hackney"), ("Geo Two", "Soho"))
+    checkpoint = tmp_path / "checkpoint.json"
+    geocoder.geocode("Geo One", "Hackney")            # warm the cache for the first cafe
+    stub.fail = True
+    geocode.run(app, geocoder, chunk_size=1, checkpoint_path=str(checkpoint))
+
+    db.session.expire_all()
+    assert Cafe.query.filter_by(name="Geo One").one().lat == 51.545   # committed from cache
+    assert Cafe.query.filter_by(name="Geo Two").one().lat is None
+    geo_two_id = Cafe.query.filter_by(name="Geo Two").one().id
+    assert json.loads(checkpoint.read_text())["last_id"] == geo_two_id - 1
+
+    stub.fail = False
+    geocode.run(app, geocoder, chunk_size=1, checkpoint_path=str(checkpoint))
+    db.session.expire_all()
+    assert Cafe.query.filter_by(name="Geo Two").one().lat == 51.513
@@ -0,0 +1,55 @@
+"""Unit tests for the metrics registry, worker merge and Prometheus rendering."""
+import json
+import subprocess
+import sys
+
+from metrics import Metrics, Registry, merge, render_prometheus
+
+
+def test_histogram_buckets_and_sum():
+    registry = Registry()
+    for value in (0.001, 0.02, 0.02, 9.0):
+        registry.observe("lat", value, buckets=(0.01, 0.1))
+    hist = registry.histograms["lat"]
+    assert hist["counts"] == [1, 2, 1]          # ≤0.01, ≤0.1, +Inf
+    assert hist["count"] == 4 and abs(hist["sum"] - 9.041) < 1e-9
+
+
+def test_merge_sums_workers():
+    a, b = Registry(), Registry()
+    a.inc('hits{cache="page"}', 3)
+    b.inc('hits{cache="page"}', 4)
+    a.observe("lat", 0.001, buckets=(0.01,))
+    b.observe("lat", 1.0, buckets=(0.01,))
+    merged = merge([a.snapshot(), b.snapshot()])
+    assert merged["counters"]['hits{cache="page"}'] == 7
+    assert merged["histograms"]["lat"]["counts"] == [1, 1]
+    assert merged["histograms"]["lat"]["count"] == 2
+
+
+def test_render_prometheus_text_format():
+    registry = Registry()
+    registry.inc('workbrew_requests_total{route="/",method="GET",status="200"}')
+    registry.observe('workbrew_request_duration_seconds{route="/"}', 0.003, buckets=(0.005, 0.01))
+    text = render_prometheus(registry.snapshot())
+    assert "# TYPE workbrew_requests_total counter" in text
+    assert 'workbrew_requests_total{route="/",method="GET",status="200"} 1' in text
+    assert 'workbrew_request_duration_seconds_bucket{route="/",le="0.005"} 1' in text
+    assert 'workbrew_request_duration_seconds_bucket{route="/",le="+Inf"} 1' in text
+    assert 'workbrew_request_duration_seconds_count{route="/"} 1' in text
+    assert text.endswith("\n")
+
+
+def test_collect_drops_gauges_of_exited_workers(app, tmp_path):
+    app.config["METRICS_DIR"] = str(tmp_path)
+    metrics = Metrics(app)
+    metrics.registry.inc("hits", 1)
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()                                   # reaped: its pid no longer exists
+    (tmp_path / f"{exited.pid}.json").write_text(json.dumps(
+        {"counters": {"hits": 2}, "gauges": {'stale{worker="%d"}' % exited.pid: 5}, "histograms": {}}))
+
+    merged = metrics.collect()
+    assert merged["counters"]["hits"] == 3          # its counters still count
+    assert not any(key.startswith("stale") for key in merged["gauges"])
+
@@ -0,0 +1,39 @@
+"""Unit tests for environment-driven pool options and transaction-mode settings."""
+import pytest
+
+import pooling
+
+BASE = {
+    "DB_POOL_MODE": "session", "DB_POOL_SIZE": 3, "DB_MAX_OVERFLOW": 2, "DB_POOL_TIMEOUT": 5.0,
+    "DB_POOL_RECYCLE": 1000, "DB_POOL_PRE_PING": True, "DB_STATEMENT_TIMEOUT_MS": 0,
+}
+PG_URL = "postgresql+psycopg2://u:p@db/app"
+
+
+def test_pool_sizes_and_jittered_recycle():
+    options = pooling.engine_options(BASE, PG_URL)
+    assert options["poolclass"] is pooling.TimedQueuePool
+    assert (options["pool_size"], options["max_overflow"], options["pool_timeout"]) == (3, 2, 5.0)
+    assert 1000 <= options["pool_recycle"] <= 1100
+    assert options["pool_pre_ping"] is True and options["pool_use_lifo"] is True
+
+
+def test_session_mode_sets_startup_options():
+    config = {**BASE, "DB_SCHEMA": "workbrew", "DB_STATEMENT_TIMEOUT_MS": 5000}
+    options = pooling.engine_options(config, PG_URL)
+    assert options["connect_args"] == {"options": "-csearch_path=workbrew,public -cstatement_timeout=5000"}
+
+
+def test_transaction_mode_uses_set_local_instead():
+    config = {**BASE, "DB_POOL_MODE": "transaction", "DB_SCHEMA": "workbrew", "DB_STATEMENT_TIMEOUT_MS": 5000}
+    assert "connect_args" not in pooling.engine_options(config, PG_URL)
+    assert pooling.transaction_settings(config) == [
+        "SET LOCAL search_path TO workbrew, public",
+        "SET LOCAL statement_timeout = 5000",
+    ]
+
+
+def test_in_memory_sqlite_and_bad_mode():
+    assert pooling.engine_options(BASE, "sqlite://") == {}
+    with pytest.raises(ValueError):
+        pooling.engine_options({**BASE, "DB_POOL_MODE": "statement"}, PG_URL)
@@ -0,0 +1,71 @@
+"""Per-route SQL query budgets.
+
+Each route is exercised over a catalog padded with synthetic cafes, and the
+number of statements it issues must stay within a fixed budget that does not
+grow with the row count — an N+1 regression fails here before it ships.
+"""
+import pytest
+
+import bench
+import bulk_load
+from extensions import db
+from models import Cafe
+
+# Statements per request, with the catalog already built in this worker.
+BUDGETS = {
+    "index":        1,     # generation sync check only; cards come from memory
+    "index_cold":   3,     # + catalog build: one scan of the cafe table
+    "page":         1,
+    "search":       1,
+    "near":         1,
+    "map":          1,
+    "ranged":       4,     # + count and the keyset page (known values, then unknowns) in SQL
+    "add":          8,     # cafe + job rows, generation bump
+    "delete":       7,
+}
+
+
+@pytest.fixture
+def padded(app):
+    bulk_load.load(bench.generate(60, seed=3), report=lambda line: None)
+    app.config["CATALOG_SYNC_INTERVAL"] = 0.0     # worst case: check the DB every request
+    return app
+
+
+def _count(app, request):
+    with bench.QueryCounter(db.engine) as counter:
+        resp = request()
+    assert resp.status_code < 400, resp.status_code
+    return counter.count
+
+
+@pytest.mark.parametrize("route,path", [
+    ("index",  "/"),
+    ("index",  "/?wifi=1&sockets=1&location=Shoreditch"),
+    ("page",   "/cafes/page?after=WyJNIiwgMF0"),
+    ("search", "/search?q=golden+bean"),
+    ("near",   "/api/cafes/near?lat=51.52&lng=-0.08&radius=2"),
+    ("map",    "/api/map?bbox=-0.2,51.45,0.0,51.6&zoom=12"),
+    ("ranged", "/?max_price=2.50"),
+    ("ranged", "/?min_seats=20"),
+    ("ranged", "/?sort=price"),
+    ("ranged", "/?max_price=3&min_seats=10&sort=seats&wifi=1"),
+])
+def test_read_routes_within_budget(padded, client, route, path):
+    client.get("/")                                            # build the catalog
+    assert _count(padded, lambda: client.get(path)) <= BUDGETS[route]
+
+
+def test_cold_index_within_budget(padded, client):
+    client.get("/")                                            # load the city registry (once per process)
+    padded.extensions.pop("workbrew.catalog", None)
+    assert _count(padded, lambda: client.get("/")) <= BUDGETS["index_cold"]
+
+
+def test_writes_within_budget(padded, admin_client):
+    admin_client.get("/")
+    form = {"name": "Budget Cafe", "map_url": "https://maps.example.com/b", "img_url": "https://img.example.com/b.jpg",
+            "location": "Soho", "seats": "10-20", "coffee_price": "£2.50"}
+    assert _count(padded, lambda: admin_client.post("/add", data=form)) <= BUDGETS["add"]
+    cafe_id = Cafe.query.filter_by(name="Budget Cafe").one().id
+    assert _count(padded, lambda: admin_client.post(f"/cafe/{cafe_id}/delete")) <= BUDGETS["delete"]
@@ -0,0 +1,30 @@
+"""Read-model tests: column-projected card rows and their map payloads."""
+import pytest
+
+import readmodel
+from extensions import db
+from models import CARD_FIELDS, MAP_FIELDS, Cafe
+
+
+def test_card_select_projects_card_columns_only(app):
+    sql = str(readmodel.card_select())
+    assert "map_url" not in sql
+    assert [c.name for c in readmodel.CARD_COLUMNS] == list(CARD_FIELDS)
+
+
+def test_rows_match_orm_values(app):
+    result = db.session.execute(readmodel.card_select().order_by(Cafe.id))
+    rows = list(readmodel.iter_rows(result))
+    cafes = Cafe.query.order_by(Cafe.id).all()
+    assert [dict(row) for row in rows] == [{f: getattr(c, f) for f in CARD_FIELDS} for c in cafes]
+    assert dict(readmodel.CafeRow.from_cafe(cafes[0])) == dict(rows[0])
+
+
+def test_row_reads_like_a_dict_and_an_object(app):
+    row = readmodel.CafeRow.from_cafe(Cafe.query.filter_by(name="Full House").one())
+    assert row.name == row["name"] == "Full House"
+    assert {**row, "score": 1.0}["location"] == "Shoreditch"
+    assert list(row.map_payload()) == list(MAP_FIELDS)
+    assert not hasattr(row, "__dict__")
+    with pytest.raises(KeyError):
+        row["map_url"]                               # not part of a card
@@ -0,0 +1,144 @@
+"""Read-replica routing against two SQLite files: a primary and a copied "replica"."""
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+import replicas
+from extensions import db
+from models import Cafe, CatalogState
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{primary}")
+    monkeypatch.setenv("DATABASE_URL_READ", f"sqlite:///{replica}")
+    from app import create_app
+    app = create_app()
+    app.config.update({
+        "TESTING": True,
+        "WTF_CSRF_ENABLED": False,
+        "SECRET_KEY": "test-secret",
+        "JOB_WORKERS": 0,
+        "SCHEMA_BOOTSTRAP": "deploy",
+        "THUMBNAILS_ENABLED": False,
+        "REPLICA_CHECK_INTERVAL": 0,         # re-check health on every eligible request
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Cafe(name="Replicated", map_url="http://g.co/1", img_url="http://img/1.jpg",
+                 location="Peckham", has_wifi=True, seats="10", coffee_price="£2.00"),
+            Cafe(name="Also Replicated", map_url="http://g.co/2", img_url="http://img/2.jpg",
+                 location="Hackney", has_sockets=True, seats="20", coffee_price="£2.50"),
+        ])
+        db.session.add(CatalogState(id=1, generation=1, updated_at=datetime.utcnow()))
+        db.session.commit()
+
+        def replicate():
+            """Bring the replica up to date: a file copy stands in for streaming replication."""
+            db.session.remove()
+            db.engine.dispose()
+            app.extensions["workbrew.replica"].engine.dispose()
+            shutil.copyfile(primary, replica)
+
+        app.replicate = replicate
+        replicate()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+        app.extensions["workbrew.replica"].engine.dispose()
+
+
+@pytest.fixture
+def statements(replica_app):
+    """Cafe-table SQL seen by each engine (health checks read catalog_state only)."""
+    seen = {"primary": [], "replica": []}
+    engines = {"primary": db.engine, "replica": replica_app.extensions["workbrew.replica"].engine}
+    for name, engine in engines.items():
+        @event.listens_for(engine, "before_cursor_execute")
+        def _record(conn, cursor, statement, parameters, context, executemany, name=name):
+            if "FROM cafe" in statement:
+                seen[name].append(statement)
+    return seen
+
+
+def test_anonymous_reads_use_replica(replica_app, statements):
+    client = replica_app.test_client()
+    assert client.get("/").status_code == 200
+    body = client.get("/api/cafes/export.ndjson").get_data(as_text=True)
+    assert body.count("\n") == 2
+    assert statements["replica"] and not statements["primary"]
+    router = replica_app.extensions["workbrew.replica"]
+    assert router.healthy and router.replica_reads == 2 and router.fallbacks == 0
+
+
+def test_own_write_is_read_back_from_primary(replica_app, statements):
+    client = replica_app.test_client()
+    resp = client.post("/add", data={
+        "name": "Fresh Cafe", "map_url": "https://maps.google.com/?q=x", "img_url": "https://example.com/x.jpg",
+        "location": "Brixton", "seats": "10-20", "coffee_price": "£2.80",
+    })
+    assert resp.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess["primary_until"] > 0
+
+    statements["primary"].clear()
+    statements["replica"].clear()
+    export = client.get("/api/cafes/export.ndjson").get_data(as_text=True)
+    assert "Fresh Cafe" in export                         # the replica hasn't got it yet
+    assert statements["primary"] and not statements["replica"]
+
+    other = replica_app.test_client()                     # nobody else is pinned
+    assert "Fresh Cafe" not in other.get("/api/cafes/export.ndjson").get_data(as_text=True)
+
+
+def test_admin_reads_use_primary(replica_app, statements):
+    client = replica_app.test_client()
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+    client.get("/api/cafes/export.ndjson")
+    assert statements["primary"] and not statements["replica"]
+    snapshot = client.get("/admin/pool").json["replica"]
+    assert snapshot["configured"] and snapshot["primary_reads"] == 2 and snapshot["replica_reads"] == 0
+
+
+def test_lagging_replica_falls_back_until_caught_up(replica_app, statements):
+    db.session.execute(update(CatalogState).values(
+        generation=CatalogState.generation + 1,
+        updated_at=datetime.utcnow() - timedelta(minutes=1),
+    ))
+    db.session.commit()
+    client = replica_app.test_client()
+    client.get("/api/cafes/export.ndjson")
+    router = replica_app.extensions["workbrew.replica"]
+    assert not router.healthy and router.lag >= 60 and router.fallbacks == 1
+    assert statements["primary"] and not statements["replica"]
+
+    replica_app.replicate()
+    client.get("/api/cafes/export.ndjson")
+    assert router.healthy and router.lag == 0 and statements["replica"]
+
+
+def test_unreachable_replica_falls_back(replica_app, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL_READ", f"sqlite:///{tmp_path}/missing/replica.db")
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True, SCHEMA_BOOTSTRAP="deploy", THUMBNAILS_ENABLED=False, JOB_WORKERS=0)
+    with app.app_context():
+        body = app.test_client().get("/api/cafes/export.ndjson").get_data(as_text=True)
+        assert body.count("\n") == 2
+        router = app.extensions["workbrew.replica"]
+        assert not router.healthy and "OperationalError" in router.last_error
+        db.session.remove()
+        db.engine.dispose()
+        app.extensions["workbrew.replica"].engine.dispose()
+
+
+def test_no_replica_configured(app, client):
+    router = app.extensions["workbrew.replica"]
+    client.get("/")
+    assert not router.configured and router.fallbacks == 0
+    assert app.config["DATABASE_URL_READ"] is None and replicas.read_engine() is db.engine
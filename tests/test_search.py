@@ -0,0 +1,59 @@
+"""Unit tests for the in-process trigram search index."""
+from search import TrigramIndex, trigrams, words
+
+
+def _index(*docs):
+    index = TrigramIndex()
+    for doc_id, text in enumerate(docs, start=1):
+        index.insert(doc_id, (text, doc_id), text, text)
+    return index
+
+
+def _names(hits):
+    return [payload for _, payload in hits]
+
+
+def test_words_fold_case_accents_and_punctuation():
+    assert words("Café Nero — Soho!") == ["cafe", "nero", "soho"]
+
+
+def test_trigrams_are_padded_like_pg_trgm():
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+
+
+def test_prefix_matches_rank_above_fuzzy():
+    index = _index("Peckham Pelican Peckham", "Pelham Street Soho", "Old Spike Peckham")
+    hits = index.search("peck")
+    assert _names(hits) == ["Old Spike Peckham", "Peckham Pelican Peckham"]
+    assert all(score == 0.9 for score, _ in hits)
+
+
+def test_typos_still_match():
+    index = _index("Shoreditch Grind", "Soho Coffee", "Brixton Village")
+    assert _names(index.search("shordeitch"))[:1] == ["Shoreditch Grind"]
+    assert _names(index.search("brixon")) == ["Brixton Village"]
+
+
+def test_every_query_word_must_match():
+    index = _index("Bike Shed Shoreditch", "Bike Works Hackney")
+    assert _names(index.search("bike hackney")) == ["Bike Works Hackney"]
+    assert index.search("bike zzzz") == []
+
+
+def test_accept_filters_and_limit():
+    index = _index("Cafe A", "Cafe B", "Cafe C")
+    assert _names(index.search("cafe", limit=2)) == ["Cafe A", "Cafe B"]
+    assert _names(index.search("cafe", accept=lambda p: p != "Cafe A")) == ["Cafe B", "Cafe C"]
+
+
+def test_remove_drops_document_and_unused_words():
+    index = _index("Unique Roastery", "Other Place")
+    index.remove(1)
+    assert index.search("roastery") == []
+    assert "roastery" not in index._vocab and "roastery" not in index._sorted
+    index.remove(1)                      # removing twice is a no-op
+    assert len(index) == 1
+
+
+def test_empty_query_returns_nothing():
+    assert _index("Anything").search(" — ") == []
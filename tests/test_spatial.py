@@ -0,0 +1,59 @@
+"""Unit tests for the grid-bucket spatial index."""
+import random
+
+from spatial import SpatialIndex, haversine_km
+
+
+def _brute_force(points, lat, lng):
+    return sorted((haversine_km(lat, lng, plat, plng), key) for key, (plat, plng) in points.items())
+
+
+def _random_points(n, seed=7):
+    rng = random.Random(seed)
+    return {i: (51.3 + rng.random() * 0.4, -0.5 + rng.random() * 0.7) for i in range(n)}
+
+
+def test_haversine_known_distance():
+    # London Bridge → Peckham is roughly 4.4 km as the crow flies.
+    assert 4.0 < haversine_km(51.5080, -0.0877, 51.4699, -0.0666) < 4.8
+
+
+def test_radius_matches_brute_force():
+    points = _random_points(2000)
+    index = SpatialIndex()
+    for key, (lat, lng) in points.items():
+        index.insert(key, lat, lng, key)
+
+    expected = [key for d, key in _brute_force(points, 51.5, -0.1) if d <= 1.5]
+    got = [key for _, key in index.radius(51.5, -0.1, 1.5)]
+    assert got == expected
+
+
+def test_nearest_matches_brute_force():
+    points = _random_points(2000)
+    index = SpatialIndex()
+    for key, (lat, lng) in points.items():
+        index.insert(key, lat, lng, key)
+
+    for lat, lng in [(51.5, -0.1), (51.31, 0.19), (52.0, -1.0)]:
+        expected = [key for _, key in _brute_force(points, lat, lng)[:10]]
+        assert [key for _, key in index.nearest(lat, lng, 10)] == expected
+
+
+def test_nearest_returns_everything_when_k_exceeds_size():
+    index = SpatialIndex()
+    index.insert(1, 51.5, -0.1, "a")
+    index.insert(2, 40.7, -74.0, "b")   # far away — exercises the sparse-tail scan
+    assert [p for _, p in index.nearest(51.5, -0.1, 5)] == ["a", "b"]
+
+
+def test_remove_and_reinsert():
+    index = SpatialIndex()
+    index.insert(1, 51.5, -0.1, "old")
+    index.insert(1, 51.6, -0.2, "new")   # re-insert moves the point
+    assert len(index) == 1
+    assert index.radius(51.5, -0.1, 0.5) == []
+    index.remove(1)
+    index.remove(1)                      # idempotent
+    assert len(index) == 0
+    assert index.nearest(51.5, -0.1, 3) == []
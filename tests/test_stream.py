@@ -0,0 +1,151 @@
+"""Live updates: the stream broker, its backends and the /api/stream endpoint."""
+import json
+
+import pytest
+
+import catalog
+import stream
+from models import Cafe
+
+VALID = {"name": "Live Beans", "location": "Brixton", "map_url": "https://maps.google.com/?q=x",
+         "img_url": "https://example.com/x.jpg", "seats": "10", "coffee_price": "£2.50", "has_wifi": "y"}
+
+
+def _event(kind, version, city="london", **extra):
+    return {"type": kind, "city": city, "version": version, **extra}
+
+
+def _read(resp, count):
+    """The first *count* messages of a streamed response, parsed to dicts."""
+    messages = []
+    for chunk in resp.response:
+        text = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if text.startswith(("retry:", ":")):
+            continue
+        fields = dict(line.split(": ", 1) for line in text.strip().splitlines())
+        messages.append({**fields, "data": json.loads(fields["data"])})
+        if len(messages) == count:
+            break
+    return messages
+
+
+# ── Broker ───────────────────────────────────────────────────────────────────
+
+
+def test_subscriber_replays_missed_events():
+    broker = stream.Broker()
+    for version in (2, 3, 4):
+        broker.dispatch(_event("add", version, id=version))
+    subscriber = broker.subscribe("london", since=2, current=4)
+    assert [e["version"] for e in subscriber.backlog] == [3, 4]
+    broker.dispatch(_event("add", 4, id=4))                 # duplicate delivery is ignored
+    broker.dispatch(_event("delete", 5, city="manchester"))  # other cities don't reach it
+    assert [e["version"] for e in subscriber.backlog] == [3, 4]
+
+
+def test_subscriber_behind_the_replay_buffer_gets_reset():
+    broker = stream.Broker(replay=2)
+    for version in (2, 3, 4):
+        broker.dispatch(_event("add", version))
+    subscriber = broker.subscribe("london", since=1, current=4)
+    assert [e["type"] for e in subscriber.backlog] == ["reset"]
+    assert not broker.subscribe("london", since=4, current=4).backlog
+
+
+def test_slow_subscriber_is_reset_not_buffered_without_bound():
+    broker = stream.Broker(queue_size=2)
+    subscriber = broker.subscribe("london", since=None, current=0)
+    for version in range(1, 6):
+        broker.dispatch(_event("update", version))
+    assert subscriber.overflowed and not subscriber.backlog
+    assert broker.snapshot() == {"clients": 1, "published": 5, "dropped": 3}
+    messages = stream._events(broker, subscriber, heartbeat=0.01)
+    assert next(messages).startswith("retry:")
+    assert next(messages).startswith("event: reset")
+    messages.close()
+    assert broker.clients == 0
+
+
+def test_file_backend_delivers_between_processes(app, tmp_path):
+    app.config.update(STREAM_FILE=str(tmp_path / "stream.jsonl"), STREAM_POLL_INTERVAL=0.01)
+    broker = stream.Broker()
+    reader = stream.FileBackend(app, broker)
+    reader.start()
+    subscriber = broker.subscribe("london", since=None, current=0)
+    stream.FileBackend(app, stream.Broker()).publish(_event("add", 1, id=7))
+    assert subscriber.wake.wait(2.0)
+    assert list(subscriber.backlog) == [_event("add", 1, id=7)]
+
+
+# ── Endpoint ─────────────────────────────────────────────────────────────────
+
+
+def test_stream_sends_add_and_delete(app, admin_client):
+    app.config["STREAM_HEARTBEAT"] = 0.01
+    version = catalog.generation()[0]
+    admin_client.post("/add", data=VALID)
+    cafe_id = Cafe.query.filter_by(name="Live Beans").one().id
+    admin_client.post(f"/cafe/{cafe_id}/delete")
+
+    resp = admin_client.get(f"/api/stream?v={version}", buffered=False)
+    assert resp.mimetype == "text/event-stream" and resp.headers["Cache-Control"] == "no-cache"
+    added, deleted = _read(resp, 2)
+    resp.close()
+    assert added["event"] == "add" and added["id"] == str(version + 1)
+    assert added["data"]["cafe"]["name"] == "Live Beans" and added["data"]["id"] == cafe_id
+    assert deleted["event"] == "delete" and deleted["data"]["id"] == cafe_id
+    assert app.extensions["workbrew.stream_broker"].clients == 0
+
+
+def test_stream_resumes_from_last_event_id(app, client):
+    app.config["STREAM_HEARTBEAT"] = 0.01
+    client.post("/add", data=VALID)
+    version = catalog.generation()[0]
+    client.post("/add", data={**VALID, "name": "Second Pour"})
+    resp = client.get("/api/stream?v=0", headers={"Last-Event-ID": str(version)}, buffered=False)
+    (message,) = _read(resp, 1)
+    resp.close()
+    assert message["data"]["cafe"]["name"] == "Second Pour"
+
+
+def test_stream_refuses_clients_past_the_limit(app, client):
+    broker = app.extensions["workbrew.stream_broker"]
+    broker.max_clients = 0
+    assert client.get("/api/stream").status_code == 503
+
+
+def test_open_streams_are_exported_as_a_gauge(app, client):
+    app.config["STREAM_HEARTBEAT"] = 0.01
+    resp = client.get("/api/stream", buffered=False)
+    next(iter(resp.response))
+    metrics = client.get("/metrics").get_data(as_text=True)
+    resp.close()
+    assert "# TYPE workbrew_stream_clients gauge" in metrics
+    assert any(line.startswith("workbrew_stream_clients{") and line.endswith(" 1")
+               for line in metrics.splitlines())
+
+
+def test_page_opens_a_stream_only_when_enabled(app, client):
+    assert "new EventSource" not in client.get("/").get_data(as_text=True)   # sync workers
+    app.config["LIVE_UPDATES"] = True
+    assert "new EventSource" in client.get("/").get_data(as_text=True)
+
+
+# ── Configuration ────────────────────────────────────────────────────────────
+
+
+def test_live_updates_default_follows_the_worker_class(monkeypatch):
+    from app import create_app
+    assert create_app().config["LIVE_UPDATES"] is False
+    monkeypatch.setenv("WORKER_CLASS", "gthread")
+    assert create_app().config["LIVE_UPDATES"] is True
+    monkeypatch.setenv("LIVE_UPDATES", "0")
+    assert create_app().config["LIVE_UPDATES"] is False
+
+
+def test_postgres_backend_is_refused_behind_transaction_pooling(monkeypatch):
+    from app import create_app
+    monkeypatch.setenv("STREAM_BACKEND", "postgres")
+    monkeypatch.setenv("DB_POOL_MODE", "transaction")
+    with pytest.raises(ValueError, match="DB_POOL_MODE=transaction"):
+        create_app()
@@ -0,0 +1,209 @@
+"""Thumbnail pipeline tests against a local stub image server."""
+import io
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import g
+from PIL import Image
+
+import catalog
+import thumbnails
+from extensions import db
+from models import Cafe, PendingJob
+
+
+def _jpeg(color="red", size=(1200, 900)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+class _StubImages(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == "/moved.jpg":
+            self.send_response(302)
+            self.send_header("Location", "/photo.jpg")
+            self.end_headers()
+            return
+        body = self.server.files.get(self.path)
+        if self.server.fail or body is None:
+            self.send_response(503 if self.server.fail else 404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubImages)
+    server.requests = []
+    server.fail = False
+    server.files = {"/photo.jpg": _jpeg(), "/notes.txt": b"not an image"}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(app, tmp_path):
+    app.config.update(THUMBNAILS_ENABLED=True, THUMB_DIR=str(tmp_path / "thumbs"),
+                      THUMB_ALLOW_PRIVATE_HOSTS=True)
+    return app
+
+
+@pytest.fixture
+def runner(app):
+    return app.extensions["workbrew.jobs"]
+
+
+def _add(client, img_url, name="Photo Cafe"):
+    client.post("/add", data={
+        "name": name, "map_url": "https://maps.google.com/?q=x", "img_url": img_url,
+        "location": "Brixton", "seats": "10-20", "coffee_price": "£2.80",
+    })
+    db.session.expire_all()
+    return Cafe.query.filter_by(name=name).one()
+
+
+def _run_thumbnail_jobs(runner):
+    runner.handlers.pop("geocode", None)   # leave geocoding out of these tests
+    db.session.execute(db.delete(PendingJob).where(PendingJob.kind == "geocode"))
+    db.session.commit()
+    runner.run_pending()
+    db.session.expire_all()
+
+
+# ── Job & card ───────────────────────────────────────────────────────────────
+
+
+def test_add_fetches_once_and_cards_use_own_origin(client, runner, stub):
+    cafe = _add(client, f"{stub.url}/photo.jpg")
+    assert PendingJob.query.filter_by(cafe_id=cafe.id, kind="thumbnail").count() == 1
+    _run_thumbnail_jobs(runner)
+
+    key = db.session.get(Cafe, cafe.id).thumb_key
+    assert key and stub.requests == ["/photo.jpg"]
+    page = client.get("/").data.decode()
+    assert f'/img/{cafe.id}/{key}-400.webp 400w, /img/{cafe.id}/{key}-800.webp 800w' in page
+    assert 'loading="lazy"' in page and 'type="image/webp"' in page
+    assert f"{stub.url}/photo.jpg" not in page
+
+    resp = client.get(f"/img/{cafe.id}/{key}-800.webp")
+    assert resp.status_code == 200 and resp.mimetype == "image/webp"
+    assert resp.headers["Cache-Control"] == thumbnails.IMMUTABLE
+    assert Image.open(io.BytesIO(resp.data)).size == (800, 600)
+    assert Image.open(io.BytesIO(client.get(f"/img/{cafe.id}/{key}-160.jpg").data)).format == "JPEG"
+
+
+def test_map_payload_carries_thumb_key(client, runner, stub):
+    cafe = _add(client, f"{stub.url}/photo.jpg")
+    _run_thumbnail_jobs(runner)
+    rows = [row for row in catalog.filter_index().page(catalog.filter_index().match([]), None, 50)[0]
+            if row.id == cafe.id]
+    assert rows[0].map_payload()["thumb_key"] == db.session.get(Cafe, cafe.id).thumb_key
+
+
+def test_shared_photo_is_stored_once(client, runner, stub, app):
+    first = _add(client, f"{stub.url}/photo.jpg", "First")
+    second = _add(client, f"{stub.url}/moved.jpg", "Second")   # redirects to the same bytes
+    _run_thumbnail_jobs(runner)
+    keys = {db.session.get(Cafe, c.id).thumb_key for c in (first, second)}
+    assert len(keys) == 1
+    files = [name for _, _, names in os.walk(app.config["THUMB_DIR"]) for name in names]
+    assert len(files) == len(thumbnails.FORMATS) * 4
+
+
+def test_unusable_image_is_not_retried(client, runner, stub):
+    cafe = _add(client, f"{stub.url}/notes.txt")
+    _run_thumbnail_jobs(runner)
+    assert db.session.get(Cafe, cafe.id).thumb_key is None
+    assert PendingJob.query.count() == 0
+    assert f'src="{stub.url}/notes.txt"' in client.get("/").data.decode()
+
+
+def test_server_error_retries(client, runner, stub):
+    stub.fail = True
+    cafe = _add(client, f"{stub.url}/photo.jpg")
+    _run_thumbnail_jobs(runner)
+    job = PendingJob.query.filter_by(cafe_id=cafe.id).one()
+    assert job.attempts == 1 and job.status == "pending"
+
+
+def test_disabled_keeps_original_urls(client, app, stub):
+    app.config["THUMBNAILS_ENABLED"] = False
+    cafe = _add(client, f"{stub.url}/photo.jpg")
+    assert PendingJob.query.filter_by(cafe_id=cafe.id, kind="thumbnail").count() == 0
+
+
+# ── Route ────────────────────────────────────────────────────────────────────
+
+
+def test_evicted_thumbnail_redirects_and_requeues(client, runner, stub, app):
+    cafe = _add(client, f"{stub.url}/photo.jpg")
+    _run_thumbnail_jobs(runner)
+    key = db.session.get(Cafe, cafe.id).thumb_key
+    os.remove(app.extensions["workbrew.thumbnails"].store.path(key, 400, "jpg"))
+
+    g.pop("db_wrote", None)         # the fixture's app context (and g) outlives the /add request
+    resp = app.test_client().get(f"/img/{cafe.id}/{key}-400.jpg")     # a visitor with no session yet
+    assert resp.status_code == 302 and resp.location == f"{stub.url}/photo.jpg"
+    assert "Set-Cookie" not in resp.headers                           # not pinned to the primary
+    assert PendingJob.query.filter_by(cafe_id=cafe.id, kind="thumbnail").count() == 1
+    assert client.get(f"/img/{cafe.id}/{'0' * 32}-400.jpg").status_code == 404
+    assert client.get(f"/img/{cafe.id}/{key}-401.jpg").status_code == 404
+
+
+# ── Fetch & store ────────────────────────────────────────────────────────────
+
+
+def test_private_hosts_refused_by_default(stub):
+    with pytest.raises(thumbnails.ThumbnailError, match="non-public"):
+        thumbnails.fetch(f"{stub.url}/photo.jpg", timeout=2, max_bytes=10**6)
+    with pytest.raises(thumbnails.ThumbnailError, match="http"):
+        thumbnails.fetch("file:///etc/passwd", timeout=2, max_bytes=10**6)
+    assert stub.requests == []
+
+
+def test_fetch_connects_to_the_address_it_checked(stub, monkeypatch):
+    answers = iter(["127.0.0.1", "192.0.2.1"])     # checked, then what a rebinding DNS would answer
+    resolve = socket.getaddrinfo
+    monkeypatch.setattr(socket, "getaddrinfo",
+                        lambda host, *args, **kwargs: resolve(next(answers) if host == "photos.example" else host,
+                                                              *args, **kwargs))
+    monkeypatch.setattr(thumbnails, "_is_public", lambda address: address == "127.0.0.1")
+    data = thumbnails.fetch(f"http://photos.example:{stub.server_port}/photo.jpg", timeout=2, max_bytes=10**6)
+    assert data == stub.files["/photo.jpg"] and stub.requests == ["/photo.jpg"]
+
+
+def test_source_size_cap(stub):
+    with pytest.raises(thumbnails.ThumbnailError, match="larger"):
+        thumbnails.fetch(f"{stub.url}/photo.jpg", timeout=2, max_bytes=100, allow_private=True)
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    one, two, three = _jpeg("red"), _jpeg("green"), _jpeg("blue")
+    probe = thumbnails.ThumbnailStore(str(tmp_path / "probe"), 10**9)
+    probe.put(one)
+    per_image = probe.total_bytes()
+
+    store = thumbnails.ThumbnailStore(str(tmp_path / "thumbs"), int(per_image * 2.5))
+    old, mid = store.put(one), store.put(two)
+    for path in store._paths(old):                            # "one" was served longest ago
+        os.utime(path, (1, 1))
+    new = store.put(three)
+    assert not store.has(old) and store.has(mid) and store.has(new)
+    assert store.total_bytes() <= store.max_bytes and store.evicted == 1
@@ -0,0 +1,418 @@
+"""
+Cafe photo thumbnails: fetched once, resized, cached on disk, served from /img/.
+
+Usage (backfill cafes added before thumbnails existed, or after a bulk load):
+    python thumbnails.py [--limit N]
+
+``POST /add`` enqueues a ``thumbnail`` job next to the geocode one. The job
+downloads ``Cafe.img_url`` once, renders every width in ``WIDTHS`` as WebP and
+JPEG, and records the content key (a hash of the original bytes) in
+``Cafe.thumb_key``. Cards then carry ``srcset``s pointing at our own origin,
+and the map popup a small 160px thumbnail.
+
+The store is content-addressed: cafes sharing a photo share its files, and a
+URL ``/img/<cafe id>/<key>-<width>.<fmt>`` never changes meaning, so it is
+served with a one-year ``immutable`` Cache-Control. Total size is bounded by
+``THUMB_MAX_BYTES``; the least recently served images are evicted first. A
+request for an evicted (or not yet rendered) thumbnail redirects to the
+original photo and queues a re-fetch.
+
+``img_url`` comes from a public form, so fetches only go to public hosts over
+http(s) — re-checked on every redirect, and connected to at the very address
+that was checked — and are capped in size and pixels.
+"""
+import argparse
+import hashlib
+import io
+import ipaddress
+import os
+import re
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from flask import abort, redirect, send_file, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import create_connection
+
+from extensions import db
+from models import Cafe
+
+HEADERS = {"User-Agent": "WorkBrew/1.0 (portfolio project, no commercial use)"}
+
+# Rendered widths (px). Cards are 192px tall and up to ~400px wide, so 400w
+# and 800w cover 1x and 2x screens; the map popup shows 160px (320w at 2x).
+WIDTHS = {"card": (400, 800), "popup": (160, 320)}
+# The card grid is 1 column, 2 from sm (640px) and 3 from lg (1024px) inside max-w-7xl.
+CARD_SIZES = "(min-width: 1024px) 400px, (min-width: 640px) 50vw, 100vw"
+FORMATS = {"webp": "image/webp", "jpg": "image/jpeg"}
+QUALITY = {"webp": 78, "jpg": 80}
+
+# Cache-Control for thumbnails: a content key never changes its bytes.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+MAX_REDIRECTS = 3
+MAX_PIXELS = 40_000_000
+
+_NAME = re.compile(r"([0-9a-f]{32})-(\d+)\.(webp|jpg)")
+
+
+class ThumbnailError(Exception):
+    """The photo can't be thumbnailed (refused host, not an image, too big) — retrying won't help."""
+
+
+def _all_widths() -> list[int]:
+    return sorted({width for widths in WIDTHS.values() for width in widths})
+
+
+# ── Store ────────────────────────────────────────────────────────────────────
+
+
+class ThumbnailStore:
+    """Content-addressed thumbnail files under *root*, at most *max_bytes* in total.
+
+    Files live at ``<root>/<key[:2]>/<key>-<width>.<fmt>``. Every file of a key
+    is written before the key is reported, and a key is evicted as a whole,
+    least recently used (file mtime, refreshed when served) first.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: int | None = None   # bytes on disk, scanned lazily
+        self.evicted = 0
+
+    def path(self, key: str, width: int, fmt: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}-{width}.{fmt}")
+
+    def _paths(self, key: str) -> list[str]:
+        return [self.path(key, width, fmt) for width in _all_widths() for fmt in FORMATS]
+
+    def has(self, key: str) -> bool:
+        return all(os.path.exists(path) for path in self._paths(key))
+
+    def open(self, key: str, width: int, fmt: str) -> str | None:
+        """Path of a stored thumbnail (marked as recently used), or None."""
+        path = self.path(key, width, fmt)
+        try:
+            # Refresh the LRU stamp at most hourly, not on every hit.
+            if os.stat(path).st_mtime < time.time() - 3600:
+                os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, data: bytes) -> str:
+        """Store thumbnails of the image *data*; return its content key."""
+        key = hashlib.sha256(data).hexdigest()[:32]
+        if self.has(key):
+            return key
+        written = 0
+        for path, body in zip(self._paths(key), render(data)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(body)
+            os.replace(tmp, path)
+            written += len(body)
+        with self._lock:
+            if self._total is not None:
+                self._total += written
+        if self.total_bytes() > self.max_bytes:
+            self.evict(keep=key)
+        return key
+
+    def _groups(self) -> dict[str, list]:
+        """key → [(mtime, size, path), ...] for every stored file."""
+        groups: dict[str, list] = {}
+        if not os.path.isdir(self.root):
+            return groups
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                match = _NAME.fullmatch(entry.name)
+                if match is None:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue   # evicted by another worker meanwhile
+                groups.setdefault(match.group(1), []).append((stat.st_mtime, stat.st_size, entry.path))
+        return groups
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for files in self._groups().values() for _, size, _ in files)
+            return self._total
+
+    def evict(self, keep: str | None = None) -> int:
+        """Drop least recently used keys until under 90% of the limit; return bytes freed.
+
+        Rescans the directory, so files written by other workers count too.
+        """
+        with self._lock:
+            groups = self._groups()
+            total = sum(size for files in groups.values() for _, size, _ in files)
+            target = int(self.max_bytes * 0.9)
+            freed = 0
+            oldest_first = sorted(groups.items(), key=lambda item: max(m for m, _, _ in item[1]))
+            for key, files in oldest_first:
+                if total - freed <= target:
+                    break
+                if key == keep:
+                    continue
+                for _, size, path in files:
+                    try:
+                        os.remove(path)
+                        freed += size
+                    except FileNotFoundError:
+                        pass
+                self.evicted += 1
+            self._total = total - freed
+            return freed
+
+
+# ── Fetch & render ───────────────────────────────────────────────────────────
+
+
+def _check_url(url: str) -> None:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ThumbnailError(f"not an http(s) URL: {url!r}")
+
+
+def _is_public(address: str) -> bool:
+    return ipaddress.ip_address(address).is_global
+
+
+def _resolve(host: str, port: int, allow_private: bool) -> str:
+    """Resolve *host* once; return the address to connect to.
+
+    Every answer must be public unless *allow_private*. The connection goes to
+    the returned address instead of resolving again, so a DNS answer that
+    changes between the check and the connect (rebinding) can't reach an
+    internal host.
+    """
+    answers = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not allow_private and not all(_is_public(sockaddr[0]) for *_, sockaddr in answers):
+        raise ThumbnailError(f"refusing non-public host {host!r}")
+    return answers[0][4][0]
+
+
+class _CheckedAddress:
+    """urllib3 connection mixin: connect to the address ``_resolve`` checked.
+
+    ``host`` is left alone, so the Host header, SNI and certificate checks
+    still use the name from the URL.
+    """
+    allow_private = False
+
+    def _new_conn(self):
+        try:
+            address = _resolve(self.host, self.port, self.allow_private)
+            return create_connection((address, self.port), self.timeout,
+                                     source_address=self.source_address, socket_options=self.socket_options)
+        except socket.timeout as exc:
+            raise ConnectTimeoutError(self, f"connection to {self.host} timed out") from exc
+        except OSError as exc:
+            raise NewConnectionError(self, f"failed to connect to {self.host}: {exc}") from exc
+
+
+class _PublicHostAdapter(HTTPAdapter):
+    """Transport adapter whose connections only reach public addresses."""
+
+    def __init__(self, allow_private: bool = False):
+        self.allow_private = allow_private
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {"allow_private": self.allow_private}
+        http = type("CheckedHTTPConnection", (_CheckedAddress, HTTPConnection), attrs)
+        https = type("CheckedHTTPSConnection", (_CheckedAddress, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CheckedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http}),
+            "https": type("CheckedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https}),
+        }
+
+
+def public_session(allow_private: bool = False) -> requests.Session:
+    """A ``requests`` session for untrusted URLs: public hosts only, no env proxies."""
+    session = requests.Session()
+    session.trust_env = False          # a proxy would resolve (and reach) hosts on our behalf
+    adapter = _PublicHostAdapter(allow_private)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch(url: str, timeout: float, max_bytes: int, allow_private: bool = False,
+          session: requests.Session | None = None) -> bytes:
+    """Download *url* (following a few redirects), at most *max_bytes*.
+
+    *session*, when given, should come from ``public_session``. Network errors
+    and 5xx answers raise ``requests`` exceptions (the job retries them);
+    anything permanent raises ``ThumbnailError``.
+    """
+    session = session or public_session(allow_private)
+    for _ in range(MAX_REDIRECTS + 1):
+        _check_url(url)
+        with session.get(url, headers=HEADERS, timeout=timeout, stream=True, allow_redirects=False) as resp:
+            if resp.is_redirect:
+                url = urljoin(url, resp.headers["Location"])
+                continue
+            if resp.status_code >= 500:
+                resp.raise_for_status()
+            if resp.status_code != 200:
+                raise ThumbnailError(f"HTTP {resp.status_code} for {url}")
+            if int(resp.headers.get("Content-Length") or 0) > max_bytes:
+                raise ThumbnailError(f"image larger than {max_bytes} bytes")
+            body = bytearray()
+            for chunk in resp.iter_content(64 * 1024):
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ThumbnailError(f"image larger than {max_bytes} bytes")
+            return bytes(body)
+    raise ThumbnailError(f"more than {MAX_REDIRECTS} redirects")
+
+
+def render(data: bytes):
+    """Yield the encoded thumbnails of *data*, in ``ThumbnailStore._paths`` order."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width * img.height > MAX_PIXELS:
+                raise ThumbnailError(f"image too large: {img.width}×{img.height}")
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise ThumbnailError(f"not a usable image: {exc}") from None
+    for width in _all_widths():
+        resized = img.copy()
+        # Never upscale; keep the aspect ratio (cards crop with object-cover).
+        resized.thumbnail((width, width * 2), Image.Resampling.LANCZOS)
+        for fmt in FORMATS:
+            buf = io.BytesIO()
+            resized.save(buf, "WEBP" if fmt == "webp" else "JPEG",
+                         quality=QUALITY[fmt], optimize=fmt == "jpg", progressive=fmt == "jpg")
+            yield buf.getvalue()
+
+
+class Thumbnailer:
+    """Fetches and stores thumbnails with the app's current THUMB_* settings."""
+
+    def __init__(self, app):
+        self.app = app
+        self._store: ThumbnailStore | None = None
+        self._sessions: dict[bool, requests.Session] = {}
+
+    @property
+    def store(self) -> ThumbnailStore:
+        root, max_bytes = self.app.config["THUMB_DIR"], self.app.config["THUMB_MAX_BYTES"]
+        if self._store is None or (self._store.root, self._store.max_bytes) != (root, max_bytes):
+            self._store = ThumbnailStore(root, max_bytes)
+        return self._store
+
+    def process(self, url: str) -> str:
+        """Fetch *url* and store its thumbnails; return the content key."""
+        config = self.app.config
+        allow_private = config["THUMB_ALLOW_PRIVATE_HOSTS"]
+        session = self._sessions.get(allow_private)
+        if session is None:
+            session = self._sessions[allow_private] = public_session(allow_private)
+        data = fetch(url, config["THUMB_FETCH_TIMEOUT"], config["THUMB_MAX_SOURCE_BYTES"], allow_private, session)
+        return self.store.put(data)
+
+
+# ── Templates & route ────────────────────────────────────────────────────────
+
+
+def thumb_url(cafe, width: int, fmt: str) -> str:
+    return url_for("thumbnail", cafe_id=cafe.id, name=f"{cafe.thumb_key}-{width}.{fmt}")
+
+
+def thumb_srcset(cafe, variant: str, fmt: str) -> str:
+    return ", ".join(f"{thumb_url(cafe, width, fmt)} {width}w" for width in WIDTHS[variant])
+
+
+def init_app(app) -> Thumbnailer:
+    app.config.setdefault("THUMBNAILS_ENABLED", True)
+    app.config.setdefault("THUMB_DIR", os.path.join(app.instance_path, "thumbs"))
+    app.config.setdefault("THUMB_MAX_BYTES", 256 * 1024 * 1024)
+    app.config.setdefault("THUMB_FETCH_TIMEOUT", 10.0)
+    app.config.setdefault("THUMB_MAX_SOURCE_BYTES", 15 * 1024 * 1024)
+    app.config.setdefault("THUMB_ALLOW_PRIVATE_HOSTS", False)   # tests point at a local stub server
+    thumbnailer = app.extensions["workbrew.thumbnails"] = Thumbnailer(app)
+    app.jinja_env.globals.update(thumb_url=thumb_url, thumb_srcset=thumb_srcset, card_sizes=CARD_SIZES)
+
+    @app.route("/img/<int:cafe_id>/<name>")
+    def thumbnail(cafe_id: int, name: str):
+        match = _NAME.fullmatch(name)
+        if match is None or int(match.group(2)) not in _all_widths():
+            abort(404)
+        key, width, fmt = match.group(1), int(match.group(2)), match.group(3)
+        path = thumbnailer.store.open(key, width, fmt)
+        if path is not None:
+            resp = send_file(path, mimetype=FORMATS[fmt], conditional=True, etag=True)
+            resp.headers["Cache-Control"] = IMMUTABLE
+            return resp
+
+        # Evicted, or on a fresh disk after a deploy: show the original for
+        # now and render the thumbnails again in the background.
+        import jobs
+
+        cafe = db.get_or_404(Cafe, cafe_id)
+        if cafe.thumb_key != key:
+            abort(404)
+        # Queued on a connection of its own, not the request's session: an
+        # image hit is not the visitor's write, so it must not pin them to
+        # the primary (replicas.py) or set a cookie on the image response.
+        with db.engine.begin() as conn:
+            jobs.enqueue_where(jobs.JOB_THUMBNAIL, Cafe.id == cafe.id, Cafe.thumb_key == key, conn=conn)
+        jobs.notify()
+        resp = redirect(cafe.img_url)
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+
+    return thumbnailer
+
+
+if __name__ == "__main__":
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Render thumbnails for cafes that have none.")
+    parser.add_argument("--limit", type=int, default=None, help="stop after N cafes")
+    args = parser.parse_args()
+
+    import bootstrap
+    import catalog
+
+    bootstrap.ensure_schema(app)
+    with app.app_context():
+        thumbnailer = app.extensions["workbrew.thumbnails"]
+        pending = db.session.execute(
+            db.select(Cafe.id, Cafe.img_url).where(Cafe.thumb_key.is_(None)).order_by(Cafe.id).limit(args.limit)
+        ).all()
+        done = failed = 0
+        for cafe_id, img_url in pending:
+            try:
+                key = thumbnailer.process(img_url)
+            except (ThumbnailError, requests.RequestException, OSError) as exc:
+                print(f"  ✗ cafe {cafe_id}: {exc}")
+                failed += 1
+                continue
+            cafe = db.session.get(Cafe, cafe_id)
+            cafe.thumb_key = key
+            generation = catalog.bump_generation(cafe.city)
+            db.session.commit()
+            catalog.cafe_updated(cafe, generation)
+            done += 1
+        store = thumbnailer.store
+        print(f"✅ {done} thumbnailed, {failed} failed; cache {store.total_bytes():,} B in {store.root}")
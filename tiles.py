@@ -0,0 +1,111 @@
+"""Web-Mercator tile math and per-tile grid clustering for the map API."""
+import math
+import threading
+from collections import OrderedDict
+
+MAX_ZOOM = 19
+# Each tile is split into CLUSTER_GRID × CLUSTER_GRID cells (64px on a 256px
+# tile); every non-empty cell becomes one cluster.
+CLUSTER_GRID = 4
+# From this zoom on, pins are returned individually instead of clustered.
+UNCLUSTER_ZOOM = 16
+AMENITY_KEYS = ("has_wifi", "has_sockets", "can_take_calls")
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> tuple[int, int]:
+    """Tile (x, y) containing a point at *zoom* (standard slippy-map scheme)."""
+    n = 1 << zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile in degrees."""
+    n = 1 << zoom
+
+    def lat_at(ty: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lat_at(y + 1), x / n * 360.0 - 180.0, lat_at(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_range(west: float, south: float, east: float, north: float, zoom: int) -> tuple[int, int, int, int]:
+    """Inclusive (x0, y0, x1, y1) tile range covering the bounding box."""
+    x0, y0 = tile_xy(north, west, zoom)
+    x1, y1 = tile_xy(south, east, zoom)
+    return x0, y0, x1, y1
+
+
+def tiles_for_bbox(west: float, south: float, east: float, north: float, zoom: int) -> list[tuple[int, int]]:
+    """All tiles at *zoom* overlapping the bounding box."""
+    x0, y0, x1, y1 = tile_range(west, south, east, north, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def cluster_tile(zoom: int, points: list[dict]) -> list[dict]:
+    """Aggregate map payloads in one tile into grid clusters.
+
+    Single-member cells (and everything at ``UNCLUSTER_ZOOM`` and above) are
+    returned as plain markers: ``{"type": "marker", "cafe": payload}``.
+    Larger cells become ``{"type": "cluster", lat, lng, count, amenities}``
+    positioned at the members' centroid.
+    """
+    if zoom >= UNCLUSTER_ZOOM:
+        return [{"type": "marker", "cafe": p} for p in points]
+
+    sub = zoom + CLUSTER_GRID.bit_length() - 1
+    cells: dict[tuple[int, int], list[dict]] = {}
+    for p in points:
+        cells.setdefault(tile_xy(p["lat"], p["lng"], sub), []).append(p)
+
+    features = []
+    for members in cells.values():
+        if len(members) == 1:
+            features.append({"type": "marker", "cafe": members[0]})
+            continue
+        features.append({
+            "type":      "cluster",
+            "lat":       sum(m["lat"] for m in members) / len(members),
+            "lng":       sum(m["lng"] for m in members) / len(members),
+            "count":     len(members),
+            "amenities": {key: sum(1 for m in members if m[key]) for key in AMENITY_KEYS},
+        })
+    return features
+
+
+class TileCache:
+    """LRU of clustered tiles, keyed by (z, x, y) then by filter combination.
+
+    ``invalidate_point`` drops the one tile per zoom level that covers a
+    changed cafe, leaving the rest of the map cached.
+    """
+
+    def __init__(self, max_tiles: int = 4096):
+        self.max_tiles = max_tiles
+        self.hits = 0
+        self.misses = 0
+        self._tiles: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, tile: tuple[int, int, int], variant, build) -> list[dict]:
+        with self._lock:
+            variants = self._tiles.get(tile)
+            if variants is not None and variant in variants:
+                self._tiles.move_to_end(tile)
+                self.hits += 1
+                return variants[variant]
+        self.misses += 1
+        features = build()
+        with self._lock:
+            self._tiles.setdefault(tile, {})[variant] = features
+            self._tiles.move_to_end(tile)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return features
+
+    def invalidate_point(self, lat: float, lng: float) -> None:
+        with self._lock:
+            for zoom in range(MAX_ZOOM + 1):
+                self._tiles.pop((zoom, *tile_xy(lat, lng, zoom)), None)